@@ -0,0 +1,126 @@
+"""
+Measure the time taken to classify the branches of a stream of changes.
+
+A synthetic stream of changes, mostly to trunk, some to release branches and
+the rest to feature branches named as svn paths, is classified as the steps
+of a build on each builder classify it: by L{txbuildbot.git.TwistedGit},
+L{txbuildbot.git.MergeForward} and the steps only run for trunk builds.  This
+is done with the cached L{txbuildbot.branches.BranchInfo}, and with the
+previous implementation, which stripped the svn prefix off the name on each
+call.
+
+Run from the master directory::
+
+    python benchmarks/branch_classification.py [changes] [builders] [repeat]
+"""
+
+import random
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+from txbuildbot.branches import branchInfo
+
+
+
+def previousMungeBranch(branch):
+    """
+    Remove the leading prefix, as L{txbuildbot.git.mungeBranch} did before
+    using L{branchInfo}.
+    """
+    if not branch:
+        return 'trunk'
+
+    for cutoff in ['/branches/', 'branches/', '/']:
+        if branch.startswith(cutoff):
+            branch = branch[len(cutoff):]
+            break
+    return branch
+
+
+def previousIsTrunk(branch):
+    return previousMungeBranch(branch) == 'trunk'
+
+
+def previousIsRelease(branch):
+    return previousMungeBranch(branch).startswith('releases/')
+
+
+def previousClassification(changes, builders):
+    """
+    Classify the branches of C{changes} as the builds on C{builders} builders
+    did with the previous functions.
+
+    @return: the name and kind of the branch of each build
+    """
+    results = []
+    for branch in changes:
+        for i in range(builders):
+            name = previousMungeBranch(branch)
+            trunk = previousIsTrunk(branch)
+            release = previousIsTrunk(branch) or previousIsRelease(branch)
+            previousIsTrunk(branch)
+            previousIsTrunk(branch)
+            results.append((name, trunk, release))
+    return results
+
+
+def currentClassification(changes, builders):
+    results = []
+    for branch in changes:
+        for i in range(builders):
+            name = branchInfo(branch).name
+            info = branchInfo(branch)
+            trunk = info.isTrunk
+            release = info.isTrunk or info.isRelease
+            branchInfo(branch).isTrunk
+            branchInfo(branch).isTrunk
+            results.append((name, trunk, release))
+    return results
+
+
+def makeChanges(count, branches=300, seed=0):
+    """
+    Generate the branches of C{count} changes: trunk is named as by svn and
+    by git, and the others with and without their svn prefix.
+    """
+    random.seed(seed)
+    names = ['destroy-the-sun-%d' % (n,) for n in range(branches)]
+    changes = []
+    for n in range(count):
+        kind = random.random()
+        if kind < 0.6:
+            changes.append(random.choice([None, 'trunk']))
+        elif kind < 0.65:
+            changes.append('/branches/releases/release-%d.%d-%d' % (
+                random.randint(10, 16), random.randint(0, 3), n % 7))
+        else:
+            changes.append(random.choice(['/branches/', 'branches/', ''])
+                           + random.choice(names))
+    return changes
+
+
+def best(function, changes, builders, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        function(changes, builders)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(changes=20000, builders=30, repeat=3):
+    stream = makeChanges(changes)
+    print "%d changes, %d builders" % (changes, builders)
+    if (previousClassification(stream, builders) !=
+            currentClassification(stream, builders)):
+        raise SystemExit("The classifications differ")
+    before = best(previousClassification, stream, builders, repeat)
+    after = best(currentClassification, stream, builders, repeat)
+    print "parsed on each call: %8.3fs" % (before,)
+    print "cached BranchInfo:   %8.3fs" % (after,)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
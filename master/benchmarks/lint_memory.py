@@ -0,0 +1,134 @@
+"""
+Measure the memory used by the errors parsed from a twistedchecker log.
+
+A synthetic log resembling a twistedchecker run over the whole of Twisted is
+parsed twice, as L{txbuildbot.lint.LintStep} does for the current and the
+previous trunk log, and the memory held by the resulting errors is reported
+for the current L{TwistedCheckerError} and for the previous implementation,
+which kept an instance dictionary and did not intern its fields.
+
+Run from the master directory::
+
+    python benchmarks/lint_memory.py [modules] [errors-per-module]
+"""
+
+import random
+import sys
+
+sys.path.insert(0, '.')
+
+from twisted.python import util
+
+from txbuildbot import lint
+
+
+class DictTwistedCheckerError(util.FancyEqMixin, object):
+    """
+    The representation of L{lint.TwistedCheckerError} before it used
+    C{__slots__} and interning.
+    """
+    regex = lint.TwistedCheckerError.regex
+    compareAttributes = ('type', 'text')
+
+    def __init__(self, msg):
+        self.msg = msg
+        d = self.regex.match(msg).groupdict()
+        self.type = d['type']
+        self.line = d['line']
+        self.indent = d['indent']
+        self.text = d['text']
+
+    def __hash__(self):
+        return hash((self.type, self.text))
+
+
+
+MESSAGES = [
+    ('W9208', '%(name)s: Missing docstring'),
+    ('W9202', '%(name)s: Missing epytext markup @param for argument "%(arg)s"'),
+    ('W9203', '%(name)s: Missing epytext markup @type for argument "%(arg)s"'),
+    ('W9204', '%(name)s: Missing epytext markup @return for return value'),
+    ('W9013', ' Expected 3 blank lines, found 2'),
+    ('W9011', ' Blank line contains whitespace'),
+    ('W9402', ' The first letter of comment should be capitalized'),
+    ('C0103', '%(name)s: Invalid name "%(arg)s" (should match '
+              '((([a-z_])|([a-z]+_[a-z]))[a-zA-Z0-9]+)$)'),
+    ('C0301', ' Line too long (%(width)d/79)'),
+    ('W0612', '%(name)s: Unused variable \'%(arg)s\''),
+    ]
+
+
+def makeLog(modules, errorsPerModule, seed=0):
+    """
+    Generate the text of a twistedchecker run.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for m in range(modules):
+        lines.append('************* Module twisted.package%d.module%d'
+                     % (m % 40, m))
+        for n in range(errorsPerModule):
+            code, template = rng.choice(MESSAGES)
+            text = template % dict(
+                name='Class%d.method%d' % (rng.randrange(20), rng.randrange(20)),
+                arg='arg%d' % (rng.randrange(10),),
+                width=rng.randrange(80, 120))
+            lines.append('%s:%3d,%d:%s' % (
+                code, rng.randrange(1, 2000), rng.choice([0, 4, 8]), text))
+    return '\n'.join(lines) + '\n'
+
+
+def sizeOf(errors):
+    """
+    Compute the memory held by the parsed C{errors}, counting each distinct
+    object once.
+    """
+    seen = set()
+    def size(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        return sys.getsizeof(obj)
+
+    total = 0
+    for parsed in errors:
+        total += size(parsed)
+        for module, moduleErrors in parsed.iteritems():
+            total += size(module) + size(moduleErrors)
+            for error in moduleErrors:
+                total += size(error)
+                if hasattr(error, '__dict__'):
+                    total += size(error.__dict__)
+                for name in ('msg', 'type', 'line', 'indent', 'text'):
+                    total += size(getattr(error, name))
+    return total
+
+
+def measure(errorClass, text):
+    """
+    Parse two separate copies of C{text} into errors of type C{errorClass}.
+    """
+    original = lint.TwistedCheckerError
+    lint.TwistedCheckerError = errorClass
+    try:
+        # Copy the text, as the current and previous logs are read separately.
+        return [lint.CheckCodesByTwistedChecker.computeErrors(text[:-1] + '\n')
+                for i in range(2)]
+    finally:
+        lint.TwistedCheckerError = original
+
+
+def main(modules=1000, errorsPerModule=30):
+    text = makeLog(modules, errorsPerModule)
+    print "%d errors in %d modules, %d bytes of log" % (
+        modules * errorsPerModule, modules, len(text))
+    before = sizeOf(measure(DictTwistedCheckerError, text))
+    after = sizeOf(measure(lint.TwistedCheckerError, text))
+    print "instance dictionaries: %10d bytes" % (before,)
+    print "slots and interning:   %10d bytes" % (after,)
+    print "saved:                 %10d bytes (%.0f%%)" % (
+        before - after, 100.0 * (before - after) / before)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
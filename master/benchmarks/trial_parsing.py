@@ -0,0 +1,182 @@
+"""
+Measure the cost of each parser applied to the output of trial on the master.
+
+The log observers of L{twisted_steps.Trial} run on the reactor thread for
+every chunk of output, and the summaries are computed there when the step
+finishes, so each of them is timed over whole trial logs.  The previous
+implementations of L{countFailedTests} and L{TrialTestCaseCounter}, which
+used uncompiled patterns and a search per count, are timed for comparison.
+
+Real trial logs, such as the stdio logs of a builder saved from the web
+status, can be given as arguments; otherwise a synthetic log of a run with
+the timing reporter is used.
+
+Run from the master directory::
+
+    python benchmarks/trial_parsing.py [log...]
+"""
+
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+from txbuildbot.testtimes import TrialTestTimer
+from txbuildbot.trialoutput import (
+    TrailingOutput, TrialTestCaseCounter, countFailedTests, parseTrialOutput)
+
+
+
+def previousCountFailedTests(output):
+    """
+    L{countFailedTests} before it used precompiled patterns.
+    """
+    chunk = output[-10000:]
+    lines = chunk.split("\n")
+    lines.pop()
+    res = {'total': None,
+           'failures': 0,
+           'errors': 0,
+           'skips': 0,
+           'expectedFailures': 0,
+           'unexpectedSuccesses': 0,
+           }
+    for l in lines:
+        out = re.search(r'Ran (\d+) tests', l)
+        if out:
+            res['total'] = int(out.group(1))
+        if (l.startswith("OK") or
+            l.startswith("FAILED ") or
+            l.startswith("PASSED")):
+            out = re.search(r'failures=(\d+)', l)
+            if out: res['failures'] = int(out.group(1))
+            out = re.search(r'errors=(\d+)', l)
+            if out: res['errors'] = int(out.group(1))
+            out = re.search(r'skips=(\d+)', l)
+            if out: res['skips'] = int(out.group(1))
+            out = re.search(r'expectedFailures=(\d+)', l)
+            if out: res['expectedFailures'] = int(out.group(1))
+            out = re.search(r'unexpectedSuccesses=(\d+)', l)
+            if out: res['unexpectedSuccesses'] = int(out.group(1))
+            out = re.search(r'successes=(\d+)', l)
+            if out: res['successes'] = int(out.group(1))
+    return res
+
+
+
+class PreviousTrialTestCaseCounter(TrialTestCaseCounter):
+    """
+    L{TrialTestCaseCounter} before it matched lines without stripping them.
+    """
+    _line_re = re.compile(r'^([\w\.]+) \.\.\. \[([^\]]+)\]$')
+
+    def outLineReceived(self, line):
+        if self.finished:
+            return
+        if line.startswith("=" * 40):
+            self.finished = True
+            return
+
+        m = self._line_re.search(line.strip())
+        if m:
+            testname, result = m.groups()
+            self.numTests += 1
+            self.step.setProgress('tests', self.numTests)
+
+
+
+class FakeStep(object):
+    def setProgress(self, metric, value):
+        pass
+
+
+
+def makeLog(tests=20000, failures=200, seed=0):
+    """
+    Generate the output of C{trial --reporter=timing}.
+    """
+    rng = random.Random(seed)
+    lines = []
+    failed = set(rng.sample(range(tests), failures))
+    for n in range(tests):
+        name = "twisted.test.test_mod%d.Tests%d.test_%d" % (n % 300, n % 7, n)
+        lines.append("%s ... [%s]" % (name, n in failed and "FAIL" or "OK"))
+        lines.append("(%.3f secs)" % (rng.expovariate(50),))
+    lines.append("")
+    for n in sorted(failed):
+        lines.append("=" * 79)
+        lines.append("[FAIL]")
+        lines.append("Traceback (most recent call last):")
+        for i in range(10):
+            lines.append('  File "/slave/twisted/test/test_mod%d.py", '
+                         'line %d, in test_%d' % (n % 300, i, n))
+            lines.append("    self.assertEqual(result, expected)")
+        lines.append("twisted.trial.unittest.FailTest: not equal")
+        lines.append("")
+        lines.append("twisted.test.test_mod%d.Tests%d.test_%d"
+                     % (n % 300, n % 7, n))
+    lines.append("-" * 79)
+    lines.append("Ran %d tests in 123.456s" % (tests,))
+    lines.append("")
+    lines.append("FAILED (failures=%d, successes=%d)"
+                 % (failures, tests - failures))
+    return "\n".join(lines) + "\n"
+
+
+def feedLines(observerClass):
+    def feed(output):
+        observer = observerClass()
+        observer.step = FakeStep()
+        for line in output.split("\n"):
+            observer.outLineReceived(line)
+    return feed
+
+
+def feedChunks(output, size=4096):
+    tail = TrailingOutput()
+    for i in xrange(0, len(output), size):
+        tail.outReceived(output[i:i + size])
+    return tail.getText()
+
+
+def best(function, output, repeat=3, number=1):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        for j in xrange(number):
+            function(output)
+        times.append((time.time() - start) / number)
+    return min(times)
+
+
+BENCHMARKS = [
+    ("TrialTestCaseCounter (previous)", feedLines(PreviousTrialTestCaseCounter),
+     1),
+    ("TrialTestCaseCounter", feedLines(TrialTestCaseCounter), 1),
+    ("TrialTestTimer", feedLines(TrialTestTimer), 1),
+    ("TrailingOutput", feedChunks, 1),
+    ("parseTrialOutput", parseTrialOutput, 1),
+    ("countFailedTests (previous)", previousCountFailedTests, 1000),
+    ("countFailedTests", countFailedTests, 1000),
+    ]
+
+
+def main(paths):
+    if paths:
+        logs = [(path, open(path, 'rb').read()) for path in paths]
+    else:
+        logs = [("synthetic", makeLog())]
+    for name, output in logs:
+        print "%s: %d bytes, %d lines" % (
+            name, len(output), output.count("\n"))
+        if countFailedTests(output) != previousCountFailedTests(output):
+            raise SystemExit("The counts differ")
+        for label, function, number in BENCHMARKS:
+            print "  %-32s %10.3fms" % (
+                label, 1000 * best(function, output, number=number))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,153 @@
+"""
+Measure the time taken to summarize the output of a failure-heavy trial run.
+
+A synthetic trial log with many failures and warnings is summarized by
+L{txbuildbot.trialoutput.parseTrialOutput}, as L{twisted_steps.Trial} does in
+its C{createSummary}, and by the previous implementation, which read the
+output through a L{StringIO} twice and built the problems and each test log by
+repeated string concatenation.
+
+Run from the master directory::
+
+    python benchmarks/trial_summary.py [failures] [repeat]
+"""
+
+import re
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+from txbuildbot.trialoutput import PROBLEM_RESULTS, parseTrialOutput
+from buildbot.status.builder import WARNINGS
+
+
+
+def previousSummary(output):
+    """
+    Summarize C{output} the way L{twisted_steps.Trial.createSummary} did
+    before using L{parseTrialOutput}.
+
+    @return: the problems, the test results and the warnings
+    """
+    problems = ""
+    results = []
+    sio = StringIO.StringIO(output)
+    warnings = {}
+    while 1:
+        line = sio.readline()
+        if line == "":
+            break
+        if line.find(" exceptions.DeprecationWarning: ") != -1:
+            warning = line
+            warnings[warning] = warnings.get(warning, 0) + 1
+        elif (line.find(" DeprecationWarning: ") != -1 or
+            line.find(" UserWarning: ") != -1):
+            warning = line + sio.readline()
+            warnings[warning] = warnings.get(warning, 0) + 1
+        elif line.find("Warning: ") != -1:
+            warning = line
+            warnings[warning] = warnings.get(warning, 0) + 1
+
+        if line.find("=" * 60) == 0 or line.find("-" * 60) == 0:
+            problems += line
+            problems += sio.read()
+            break
+
+    if problems:
+        pio = StringIO.StringIO(problems)
+        pio.readline()
+        testname = None
+        done = False
+        while not done:
+            while 1:
+                line = pio.readline()
+                if line == "":
+                    done = True
+                    break
+                if line.find("=" * 60) == 0:
+                    break
+                if line.find("-" * 60) == 0:
+                    done = True
+                    break
+                if testname is None:
+                    r = re.search(r'^([^:]+): (\w+) \(([\w\.]+)\)', line)
+                    if not r:
+                        continue
+                    result, name, case = r.groups()
+                    testname = tuple(case.split(".") + [name])
+                    testResults = PROBLEM_RESULTS.get(result, WARNINGS)
+                    text = result.lower().split()
+                    loog = line
+                    loog += pio.readline()
+                else:
+                    loog += line
+            if testname:
+                results.append((testname, testResults, text, loog))
+                testname = None
+    return problems, results, warnings
+
+
+def currentSummary(output):
+    parser = parseTrialOutput(output)
+    return parser.getProblems(), parser.results, parser.warnings
+
+
+def makeLog(failures, tracebackLines=20):
+    """
+    Generate the output of a trial run in which C{failures} tests failed.
+    """
+    lines = []
+    for n in range(failures):
+        lines.append("twisted.test.test_mod%d.Tests.test_%d ... [FAIL]"
+                     % (n % 100, n))
+        if n % 10 == 0:
+            lines.append("twisted/test/test_mod%d.py:%d: "
+                         "DeprecationWarning: old is deprecated"
+                         % (n % 100, n % 500))
+            lines.append("  old()")
+    for n in range(failures):
+        lines.append("=" * 79)
+        lines.append("FAILURE: test_%d (twisted.test.test_mod%d.Tests)"
+                     % (n, n % 100))
+        lines.append("-" * 79)
+        lines.append("Traceback (most recent call last):")
+        for i in range(tracebackLines):
+            lines.append('  File "/slave/twisted/test/test_mod%d.py", '
+                         'line %d, in test_%d' % (n % 100, i, n))
+            lines.append("    self.assertEqual(result, expected)")
+        lines.append("twisted.trial.unittest.FailTest: not equal")
+    lines.append("-" * 79)
+    lines.append("Ran %d tests in 12.345s" % (failures,))
+    lines.append("")
+    lines.append("FAILED (failures=%d)" % (failures,))
+    return "\n".join(lines) + "\n"
+
+
+def best(function, output, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        function(output)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(failures=10000, repeat=3):
+    output = makeLog(failures)
+    print "%d failures, %d bytes of output" % (failures, len(output))
+    if previousSummary(output) != currentSummary(output):
+        raise SystemExit("The summaries differ")
+    before = best(previousSummary, output, repeat)
+    after = best(currentSummary, output, repeat)
+    print "two passes, concatenation: %8.3fs" % (before,)
+    print "single pass, joins:        %8.3fs" % (after,)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
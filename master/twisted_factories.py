@@ -10,19 +10,30 @@ from buildbot.process.factory import BuildFactory
 from buildbot.steps import shell, transfer
 from buildbot.steps.shell import ShellCommand
 from buildbot.steps.source import Mercurial, Git
-from txbuildbot.pypy import Translate
+from txbuildbot.pypy import (
+    Translate, DownloadTranslation, UploadTranslation, translationNeeded)
+from txbuildbot.venvcache import CachedVirtualEnv
+from txbuildbot.extcache import CachedBuildExt
+from txbuildbot.dependencies import (
+    DownloadDependency, InstallDependency, dependencyProperty)
+from txbuildbot.testdeps import (
+        RecordTestDependencies, isTrunkBuild, isBranchBuild)
 
 from twisted_steps import ProcessDocs, ReportPythonModuleVersions, \
     Trial, RemovePYCs, RemoveTrialTemp, LearnVersion, \
-    SetBuildProperty
+    SetBuildProperty, RunReactorsConcurrently
 
 from txbuildbot.lint import (
         CheckDocumentation,
         CheckCodesByTwistedChecker,
+        LearnChangedFiles,
+        ShardedTwistedChecker,
         PyFlakes,
         )
 
 TRIAL_FLAGS = ["--reporter=bwverbose"]
+# bwverbose with the time taken by each test, which Trial collects.
+TIMING_FLAGS = ["--reporter=timing"]
 WARNING_FLAGS = ["--unclean-warnings"]
 FORCEGC_FLAGS = ["--force-gc"]
 
@@ -48,6 +59,22 @@ class TwistedBaseFactory(BuildFactory):
     """
     @ivar python: The path to the Python executable to use.  This is a
         list, to allow additional arguments to be passed.
+
+    @ivar trialShards: If given, the number of concurrent trial processes
+        running the tests of trial steps.
+
+    @ivar testDependencies: If true, trunk builds record which modules each
+        test module imports, and branch builds first run the tests affected by
+        their changes in a 'fast-' trial step, before the whole test suite.
+
+    @ivar testTimings: If true, trial reports the time taken by each test,
+        which the trial steps keep on the master, along with the result of
+        each test.  Sharding needs the timings, so this is implied by
+        C{trialShards}.
+
+    @ivar extensionCache: If true, the extension modules built by a build are
+        kept on the slave, and restored instead of being compiled by the next
+        builds with the same C sources and interpreter.
     """
     buildClass = TwistedBuild
     # bin/trial expects its parent directory to be named "Twisted": it uses
@@ -72,7 +99,9 @@ class TwistedBaseFactory(BuildFactory):
 
     def __init__(
         self, python, source, uncleanWarnings, trialTests=None,
-        trialMode=None, virtualenv=False,
+        trialMode=None, virtualenv=False, trialShards=None,
+        testDependencies=False, virtualenvRequirements=None,
+        extensionCache=False, testTimings=False,
             ):
         if not isinstance(source, list):
             source = [source]
@@ -93,11 +122,23 @@ class TwistedBaseFactory(BuildFactory):
         self.python = python
         self.uncleanWarnings = uncleanWarnings
         self.trialMode = trialMode
+        self.trialShards = trialShards
+        self.testTimings = testTimings or bool(trialShards)
+        self.testDependencies = testDependencies
+        self.extensionCache = extensionCache
+        self._recordingTestDependencies = False
         if trialTests is None:
             trialTests = [WithProperties("%(test-case-name:~twisted)s")]
         self.trialTests = trialTests
 
-        if virtualenv:
+        if virtualenv and virtualenvRequirements is not None:
+            self.addStep(
+                CachedVirtualEnv,
+                python=self.python,
+                path=self._virtualEnvPath,
+                requirements=virtualenvRequirements,
+                )
+        elif virtualenv:
             # Each time we create a new virtualenv as latest pip can build
             # wheels on the fly and install them from user's cache.
             self.addStep(
@@ -132,9 +173,14 @@ class TwistedBaseFactory(BuildFactory):
                 ])
 
 
-    def addTrialStep(self, **kw):
+    def getTrialMode(self):
+        """
+        Get the arguments given to trial by the trial steps of this factory.
+        """
         if self.trialMode is not None:
             trialMode = self.trialMode
+        elif self.testTimings:
+            trialMode = TIMING_FLAGS
         else:
             trialMode = TRIAL_FLAGS
 
@@ -142,10 +188,30 @@ class TwistedBaseFactory(BuildFactory):
             trialMode = trialMode + WARNING_FLAGS
         if self.forceGarbageCollection:
             trialMode = trialMode + FORCEGC_FLAGS
+        return trialMode
+
+
+    def addTrialStep(self, **kw):
+        trialMode = self.getTrialMode()
         if 'tests' not in kw:
             kw['tests'] = self.trialTests
         if 'python' not in kw:
             kw['python'] = self.python
+        if kw.get('concurrent'):
+            # The tests were run by RunReactorsConcurrently.
+            self.addStep(TwistedTrial, trialMode=trialMode, **kw)
+            return
+        if self.testDependencies:
+            if not self._recordingTestDependencies:
+                self.addStep(RecordTestDependencies, python=self.python,
+                             doStepIf=isTrunkBuild)
+                self._recordingTestDependencies = True
+            fast = dict(kw, name="fast-%s" % (kw.get('name', 'trial'),),
+                        testChanges=True)
+            self.addStep(TwistedTrial, trialMode=trialMode,
+                         doStepIf=isBranchBuild, **fast)
+        if self.trialShards and 'shards' not in kw:
+            kw['shards'] = self.trialShards
         self.addStep(TwistedTrial, trialMode=trialMode, **kw)
 
 
@@ -177,6 +243,19 @@ class TwistedBaseFactory(BuildFactory):
         self.addStep(step, **kwargs)
 
 
+    def addCompileStep(self, command, **kwargs):
+        """
+        Add a step building the extension modules in place with C{command},
+        which restores them from the slave's cache instead when
+        C{extensionCache} is set.
+        """
+        if self.extensionCache:
+            self.addStep(CachedBuildExt, python=self.python,
+                         buildCommand=command, **kwargs)
+        else:
+            self.addStep(shell.Compile, command=command, **kwargs)
+
+
 
 class TwistedDocumentationBuildFactory(TwistedBaseFactory):
     treeStableTimer = 5 * 60
@@ -232,8 +311,10 @@ class FullTwistedBuildFactory(TwistedBaseFactory):
                  runTestsRandomly=False,
                  compileOpts=[], compileOpts2=[],
                  uncleanWarnings=True, trialMode=None,
-                 trialTests=None, buildExtensions=True):
-        TwistedBaseFactory.__init__(self, python, source, uncleanWarnings, trialTests=trialTests, trialMode=trialMode)
+                 trialTests=None, buildExtensions=True, trialShards=None,
+                 testDependencies=False, extensionCache=False,
+                 testTimings=False):
+        TwistedBaseFactory.__init__(self, python, source, uncleanWarnings, trialTests=trialTests, trialMode=trialMode, trialShards=trialShards, testDependencies=testDependencies, extensionCache=extensionCache, testTimings=testTimings)
 
         assert isinstance(compileOpts, list)
         assert isinstance(compileOpts2, list)
@@ -241,7 +322,7 @@ class FullTwistedBuildFactory(TwistedBaseFactory):
         if buildExtensions:
             cmd = (python + compileOpts + ["setup.py", "build_ext"]
                    + compileOpts2 + ["-i"])
-            self.addStep(shell.Compile, command=cmd, flunkOnFailure=True)
+            self.addCompileStep(cmd, flunkOnFailure=True)
 
         self.addStep(RemovePYCs)
         self.addTrialStep(randomly=runTestsRandomly)
@@ -262,8 +343,14 @@ class GoodTwistedBuildFactory(TwistedBaseFactory):
                  compileOpts=[], compileOpts2=[],
                  uncleanWarnings=True,
                  extraTrialArguments={},
-                 forceGarbageCollection=False):
-        TwistedBaseFactory.__init__(self, python, source, uncleanWarnings)
+                 forceGarbageCollection=False, trialShards=None,
+                 testDependencies=False, extensionCache=False,
+                 testTimings=False):
+        TwistedBaseFactory.__init__(self, python, source, uncleanWarnings,
+                                    trialShards=trialShards,
+                                    testDependencies=testDependencies,
+                                    extensionCache=extensionCache,
+                                    testTimings=testTimings)
         self.forceGarbageCollection = forceGarbageCollection
         if processDocs:
             self.addStep(ProcessDocs)
@@ -273,25 +360,52 @@ class GoodTwistedBuildFactory(TwistedBaseFactory):
         cmd = (self.python + compileOpts + ["setup.py", "build_ext"]
                + compileOpts2 + ["-i"])
 
-        self.addStep(shell.Compile, command=cmd, flunkOnFailure=True)
+        self.addCompileStep(cmd, flunkOnFailure=True)
         self.addStep(RemovePYCs)
         self.addTrialStep(randomly=runTestsRandomly, **extraTrialArguments)
 
 
 class TwistedReactorsBuildFactory(TwistedBaseFactory):
+    """
+    Run the test suite once for each of several reactors.
+
+    @ivar concurrentReactors: If true, the test suite is run with all the
+        reactors at the same time, by a single step, and a trial step for each
+        reactor then reports the results of its run.  Sharding and the fast
+        trial steps of C{testDependencies} are not used in that case.
+    """
     treeStableTimer = 5*60
 
     def __init__(self, source, RemovePYCs=RemovePYCs,
                  python="python", compileOpts=[], compileOpts2=[],
-                 reactors=["select"], uncleanWarnings=True):
-        TwistedBaseFactory.__init__(self, python, source, uncleanWarnings)
+                 reactors=["select"], uncleanWarnings=True, trialShards=None,
+                 testDependencies=False, concurrentReactors=False,
+                 extensionCache=False, testTimings=False):
+        TwistedBaseFactory.__init__(self, python, source, uncleanWarnings,
+                                    trialShards=trialShards,
+                                    testDependencies=testDependencies,
+                                    extensionCache=extensionCache,
+                                    testTimings=testTimings)
 
         assert isinstance(compileOpts, list)
         assert isinstance(compileOpts2, list)
         cmd = (self.python + compileOpts + ["setup.py", "build_ext"]
                + compileOpts2 + ["-i"])
 
-        self.addStep(shell.Compile, command=cmd, warnOnFailure=True)
+        self.addCompileStep(cmd, warnOnFailure=True)
+
+        if concurrentReactors:
+            self.addStep(RemovePYCs)
+            self.addStep(
+                RunReactorsConcurrently, python=self.python,
+                trial=(self.python + [TwistedTrial.trial] +
+                       self.getTrialMode()),
+                reactors=reactors, tests=self.trialTests)
+            for reactor in reactors:
+                self.addTrialStep(
+                    name=reactor, reactor=reactor, concurrent=True,
+                    flunkOnFailure=True, warnOnFailure=False)
+            return
 
         for reactor in reactors:
             self.addStep(RemovePYCs)
@@ -388,39 +502,35 @@ class InterpreterBuilderMixin:
     modulePrefix = '../install'
 
     def buildModule(self, python, basename):
+        # The installation is restored from the slave's cache when the
+        # interpreter was built from the same revision and the tarball did
+        # not change.
         self.addStep(
-            ShellCommand,
-            name="extract-"+basename,
-            description=["extracting", basename],
-            descriptionDone=["extract", basename],
-            # Can't make workdir build, .. won't resolve properly
-            # because build is a symlink.
-            workdir=".",
-            command=["/bin/tar", "Cxzf", "build", basename + ".tar.gz"])
-        self.addStep(
-            ShellCommand,
+            InstallDependency,
             name="install-"+basename,
             description=["installing", basename],
             descriptionDone=["install", basename],
-            workdir="build/" + basename,
-            command=[python, "setup.py", "clean", "install", "--prefix", self.modulePrefix])
+            # Can't make workdir build, .. won't resolve properly
+            # because build is a symlink.
+            workdir=".",
+            python="build/" + python,
+            basename=basename,
+            prefix=os.path.normpath(
+                os.path.join("build", basename, self.modulePrefix)),
+            buildId=WithProperties("%(got_revision)s"))
 
 
     def buildModules(self, python, projects):
-        python = "../" + python
-
         for basename in projects:
-            # Send the tarball down
+            # Send the tarball down, if the slave does not have it already.
             self.addStep(
-                transfer.FileDownload,
+                DownloadDependency,
                 name="download-" + basename,
-                mastersrc="dependencies/" + basename + ".tar.gz",
-                slavedest=basename + ".tar.gz",
-                workdir=".")
+                basename=basename)
 
             if "subunit" in basename:
                 # Always trying to be special.
-                self.buildSubunit(python, basename)
+                self.buildSubunit("../" + python, basename)
             else:
                 self.buildModule(python, basename)
 
@@ -432,7 +542,8 @@ class InterpreterBuilderMixin:
             description=["extracting", dirname],
             descriptionDone=["extract", dirname],
             workdir=".",
-            command=["/bin/tar", "Cxzf", "build", basename])
+            command=["/bin/tar", "Cxzf", "build", WithProperties(
+                "%%(%s)s" % (dependencyProperty(dirname),))])
         self.addStep(
             ShellCommand,
             name="configure-"+dirname,
@@ -452,26 +563,58 @@ class InterpreterBuilderMixin:
 
 
 class CPythonBuildFactory(BuildFactory, InterpreterBuilderMixin):
+    """
+    Build CPython from C{branch}, and install C{projects} with it.
+
+    @param incremental: If true, the build directory is kept between builds:
+        configure is only run again when C{configure} or C{Makefile.pre.in}
+        changed, and make runs as many jobs as the slave has CPUs.
+    """
+    configureCommand = "./configure --prefix=$PWD/install"
+
+    # The checksums of the files configure depends on are recorded when it
+    # succeeds, and it is skipped while they do not change and the Makefile
+    # it generates is still there.
+    incrementalConfigureCommand = (
+        'stamp="$(cat configure Makefile.pre.in | cksum)"; '
+        'if [ -f Makefile ] && '
+        '[ "$stamp" = "$(cat .configure-stamp 2>/dev/null)" ]; then '
+        'echo "configure and Makefile.pre.in are unchanged"; '
+        'else rm -f .configure-stamp && ' + configureCommand + ' && '
+        'echo "$stamp" > .configure-stamp; fi')
+
+    incrementalInstallCommand = (
+        "make -j$(getconf _NPROCESSORS_ONLN 2>/dev/null || echo 1) install")
+
     def __init__(self, branch, python, projects, *a, **kw):
+        incremental = kw.pop('incremental', False)
         BuildFactory.__init__(self, *a, **kw)
+        if incremental:
+            mode = "update"
+            configureCommand = self.incrementalConfigureCommand
+            installCommand = self.incrementalInstallCommand
+        else:
+            mode = "copy"
+            configureCommand = self.configureCommand
+            installCommand = ["make", "install"]
         self.addStep(
             Mercurial,
             repourl="http://hg.python.org/cpython",
             defaultBranch=branch,
             branchType='inrepo',
-            mode="copy")
+            mode=mode)
         self.addStep(
             ShellCommand,
             name="configure-python",
             description=["configuring", "python"],
             descriptionDone=["configure", "python"],
-            command="./configure --prefix=$PWD/install")
+            command=configureCommand)
         self.addStep(
             ShellCommand,
             name="install-python",
             description=["installing", "python"],
             descriptionDone=["install", "python"],
-            command=["make", "install"])
+            command=installCommand)
         pythonc = "install/bin/" + python
         self.addStep(
             ShellCommand,
@@ -485,15 +628,34 @@ class CPythonBuildFactory(BuildFactory, InterpreterBuilderMixin):
 
 
 class PyPyTranslationFactory(BuildFactory, InterpreterBuilderMixin):
-    modulePrefix = '../'
+    """
+    Translate PyPy, and install C{projects} with it.
+
+    The binary translated and its libraries are cached on the master, and
+    only translated again when the revision or the arguments of the
+    translation change.
+
+    The projects are installed in their own prefix rather than in the
+    checkout, and found through a C{.pth} file in the checkout's
+    C{site-packages} directory.
+    """
     def __init__(self, translationArguments, targetArguments, projects, *a, **kw):
         BuildFactory.__init__(self, *a, **kw)
         self.addStep(
             Mercurial,
             repourl="https://bitbucket.org/pypy/pypy")
+        self.addStep(
+            DownloadTranslation,
+            translationArgs=translationArguments,
+            targetArgs=targetArguments)
         self.addStep(
             Translate,
             translationArgs=translationArguments,
+            targetArgs=targetArguments,
+            doStepIf=translationNeeded)
+        self.addStep(
+            UploadTranslation,
+            translationArgs=translationArguments,
             targetArgs=targetArguments)
         self.addStep(
             ShellCommand,
@@ -503,6 +665,12 @@ class PyPyTranslationFactory(BuildFactory, InterpreterBuilderMixin):
             command=["ln", "-nsf", "build/pypy/goal/pypy-c", "."],
             workdir=".")
 
+        self.addStep(
+            transfer.StringDownload,
+            name="add-install-path",
+            s=self.modulePrefix + "/site-packages\n",
+            slavedest="site-packages/install.pth")
+
         # Don't try building these yet.  PyPy doesn't quite work well
         # enough.
         pypyc = "pypy/goal/pypy-c"
@@ -527,12 +695,11 @@ class TwistedCoveragePyFactory(TwistedBaseFactory):
         'coverage', 'html', '-d', 'twisted-coverage',
         '--omit', ','.join(OMIT_PATHS), '-i']
 
-    def __init__(self, python, source):
-        TwistedBaseFactory.__init__(self, python, source, False)
-        self.addStep(
-            shell.Compile,
-            command=python + ["setup.py", "build_ext", "-i"],
-            flunkOnFailure=True)
+    def __init__(self, python, source, extensionCache=False):
+        TwistedBaseFactory.__init__(self, python, source, False,
+                                    extensionCache=extensionCache)
+        self.addCompileStep(python + ["setup.py", "build_ext", "-i"],
+                            flunkOnFailure=True)
         self.addTrialStep(python=[
                 "coverage", "run",
                 "--omit", ','.join(self.OMIT_PATHS),
@@ -602,28 +769,60 @@ class TwistedPython3Tests(TwistedBaseFactory):
 class TwistedCheckerBuildFactory(TwistedBaseFactory):
     """
     Run twistedchecker check from an virtualenv.
+
+    @param shards: If given, the number of twistedchecker processes to run
+        concurrently, each checking a share of the modules.
+
+    @param incremental: If true, branch builds only check the modules changed
+        since they were branched from trunk.
+
+    @param cachedVirtualenv: If true, the virtualenv with twistedchecker
+        installed is kept on the slave and reused by the next builds, instead
+        of being created again by each build.
     """
+    requirements = ['twistedchecker==0.4.0']
 
-    def __init__(self, source, python="python2.7"):
+    def __init__(self, source, python="python2.7", shards=None,
+                 incremental=False, cachedVirtualenv=False):
+        if cachedVirtualenv:
+            virtualenvRequirements = self.requirements
+        else:
+            virtualenvRequirements = None
         TwistedBaseFactory.__init__(
             self,
             source=source,
             python=python,
             uncleanWarnings=False,
             virtualenv=True,
+            virtualenvRequirements=virtualenvRequirements,
             )
-        self.addVirtualEnvStep(
-            shell.ShellCommand,
-            command=['pip', 'install', 'twistedchecker==0.4.0'])
-        self.addVirtualEnvStep(CheckCodesByTwistedChecker, want_stderr=False)
+        if not cachedVirtualenv:
+            self.addVirtualEnvStep(
+                shell.ShellCommand,
+                command=['pip', 'install'] + self.requirements)
+        if incremental:
+            self.addStep(LearnChangedFiles)
+        if shards:
+            self.addVirtualEnvStep(
+                ShardedTwistedChecker, shards=shards, want_stderr=False,
+                incremental=incremental)
+        else:
+            self.addVirtualEnvStep(
+                CheckCodesByTwistedChecker, want_stderr=False,
+                incremental=incremental)
 
 
 class PyFlakesBuildFactory(TwistedBaseFactory):
     """
     A build factory which just runs PyFlakes over the specified source.
+
+    @param incremental: If true, branch builds only check the files changed
+        since they were branched from trunk.
     """
 
-    def __init__(self, source, python="python"):
+    def __init__(self, source, python="python", incremental=False):
         TwistedBaseFactory.__init__(self, python, source, False)
 
-        self.addStep(PyFlakes)
+        if incremental:
+            self.addStep(LearnChangedFiles)
+        self.addStep(PyFlakes, incremental=incremental)
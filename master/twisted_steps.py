@@ -1,97 +1,37 @@
 # -*- test-case-name: buildbot.test.test_twisted -*-
 
 from twisted.python import log
+from twisted.internet import threads
 
 from buildbot.status import builder
 from buildbot.status.builder import SUCCESS, FAILURE, WARNINGS, SKIPPED
-from buildbot.process.buildstep import LogLineObserver, OutputProgressObserver
+from buildbot.process.buildstep import OutputProgressObserver
 from buildbot.process.buildstep import RemoteShellCommand, BuildStep
 from buildbot.steps.shell import ShellCommand, SetProperty
 
+from txbuildbot.testtimes import TrialTestTimer, TestTimings, formatTimings
+from txbuildbot.testtimes import moduleDurations
+from txbuildbot.testdeps import TestDependencyIndex
+from txbuildbot.testresults import TestResultStore
+from txbuildbot.trialwarnings import WarningIndex, slaveDirectories
+from txbuildbot.trialwarnings import normalizeWarnings, formatWarnings
+from txbuildbot.git import isTrunk
+from txbuildbot.trialoutput import parseTrialOutput, TrailingOutput
+from txbuildbot.trialoutput import countFailedTests, TrialTestCaseCounter
+
 try:
     import cStringIO
     StringIO = cStringIO
 except ImportError:
     import StringIO
-import re
+import base64
+import json
+import zlib
+from binascii import hexlify
 
 # BuildSteps that are specific to the Twisted source tree
 
 
-def countFailedTests(output):
-    # start scanning 10kb from the end, because there might be a few kb of
-    # import exception tracebacks between the total/time line and the errors
-    # line
-    chunk = output[-10000:]
-    lines = chunk.split("\n")
-    lines.pop() # blank line at end
-    # lines[-3] is "Ran NN tests in 0.242s"
-    # lines[-2] is blank
-    # lines[-1] is 'OK' or 'FAILED (failures=1, errors=12)'
-    #  or 'FAILED (failures=1)'
-    #  or "PASSED (skips=N, successes=N)"  (for Twisted-2.0)
-    # there might be other lines dumped here. Scan all the lines.
-    res = {'total': None,
-           'failures': 0,
-           'errors': 0,
-           'skips': 0,
-           'expectedFailures': 0,
-           'unexpectedSuccesses': 0,
-           }
-    for l in lines:
-        out = re.search(r'Ran (\d+) tests', l)
-        if out:
-            res['total'] = int(out.group(1))
-        if (l.startswith("OK") or
-            l.startswith("FAILED ") or
-            l.startswith("PASSED")):
-            # the extra space on FAILED_ is to distinguish the overall
-            # status from an individual test which failed. The lack of a
-            # space on the OK is because it may be printed without any
-            # additional text (if there are no skips,etc)
-            out = re.search(r'failures=(\d+)', l)
-            if out: res['failures'] = int(out.group(1))
-            out = re.search(r'errors=(\d+)', l)
-            if out: res['errors'] = int(out.group(1))
-            out = re.search(r'skips=(\d+)', l)
-            if out: res['skips'] = int(out.group(1))
-            out = re.search(r'expectedFailures=(\d+)', l)
-            if out: res['expectedFailures'] = int(out.group(1))
-            out = re.search(r'unexpectedSuccesses=(\d+)', l)
-            if out: res['unexpectedSuccesses'] = int(out.group(1))
-            # successes= is a Twisted-2.0 addition, and is not currently used
-            out = re.search(r'successes=(\d+)', l)
-            if out: res['successes'] = int(out.group(1))
-
-    return res
-
-
-class TrialTestCaseCounter(LogLineObserver):
-    _line_re = re.compile(r'^([\w\.]+) \.\.\. \[([^\]]+)\]$')
-    numTests = 0
-    finished = False
-
-    def outLineReceived(self, line):
-        # different versions of Twisted emit different per-test lines with
-        # the bwverbose reporter.
-        #  2.0.0: testSlave (buildbot.test.test_runner.Create) ... [OK]
-        #  2.1.0: buildbot.test.test_runner.Create.testSlave ... [OK]
-        #  2.4.0: buildbot.test.test_runner.Create.testSlave ... [OK]
-        # Let's just handle the most recent version, since it's the easiest.
-
-        if self.finished:
-            return
-        if line.startswith("=" * 40):
-            self.finished = True
-            return
-
-        m = self._line_re.search(line.strip())
-        if m:
-            testname, result = m.groups()
-            self.numTests += 1
-            self.step.setProgress('tests', self.numTests)
-
-
 UNSPECIFIED=() # since None is a valid choice
 
 class Trial(ShellCommand):
@@ -136,7 +76,11 @@ class Trial(ShellCommand):
     provide them to trial, thus running the minimal set of test cases needed
     to cover the Changes. This is useful for quick builds, especially in
     trees with a lot of test cases. The 'testChanges' parameter controls this
-    feature: if set, it will override 'tests'.
+    feature: if set, it will override 'tests'. If the builder has a
+    TestDependencyIndex, the test modules which import the changed modules,
+    directly or indirectly, are run as well. If there are more than
+    'maxAffectedTests' of them, or no tests to run at all, the step is
+    skipped.
 
     The trial executable itself is typically just 'trial' (which is usually
     found on your $PATH as /usr/bin/trial), but it can be overridden with the
@@ -161,6 +105,22 @@ class Trial(ShellCommand):
     There are some class attributes which may be usefully overridden
     by subclasses. 'trialMode' and 'trialArgs' can influence the trial
     command line.
+
+    When trial is run with '--reporter=timing', the time taken by each test
+    is collected. The 'slowestTests' slowest tests are shown in a 'slowest
+    tests' log, and the timings of all tests are kept on the master, in the
+    'test-timings' directory of the builder.
+
+    The test suite can be split into 'shards' which are run by concurrent
+    trial processes. The test modules are assigned to the shards using the
+    timings kept from the last build, so each shard takes about the same
+    time, and the output of the shards is combined on the slave into that of
+    a single trial run. The first shard uses _trial_temp/, and the others
+    _trial_temp-N/.
+
+    With 'concurrent', trial is not run by this step: the tests have already
+    been run for its reactor by a L{RunReactorsConcurrently} step, and this
+    step reports the output and exit status that run left on the slave.
     """
 
     name = "trial"
@@ -185,13 +145,126 @@ class Trial(ShellCommand):
     reactor = None
     randomly = False
     tests = None # required
+    slowestTests = 20
+    shards = None
+    maxAffectedTests = 100
+    concurrent = False
+
+    collectSource = (
+        "import sys\n"
+        "temp = sys.argv[1]\n"
+        "try:\n"
+        "    rc = int(open(temp + '.rc').read())\n"
+        "    output = open(temp + '.out', 'rb')\n"
+        "except (IOError, ValueError):\n"
+        "    sys.stderr.write('No results of a concurrent run in %s\\n' % (temp,))\n"
+        "    sys.exit(1)\n"
+        "stdout = getattr(sys.stdout, 'buffer', sys.stdout)\n"
+        "while True:\n"
+        "    chunk = output.read(65536)\n"
+        "    if not chunk:\n"
+        "        break\n"
+        "    stdout.write(chunk)\n"
+        "stdout.flush()\n"
+        "sys.exit(rc)\n")
+
+    shardSource = (
+        "import base64, json, os, re, shutil, subprocess, sys, tempfile, time, zlib\n"
+        "count = int(sys.argv[1])\n"
+        "durations = json.loads(zlib.decompress(base64.b64decode(sys.argv[2])).decode('ascii'))\n"
+        "split = sys.argv.index('--', 3)\n"
+        "trial, targets = sys.argv[3:split], sys.argv[split + 1:]\n"
+        "units = []\n"
+        "for target in targets:\n"
+        "    root = target.replace('.', os.sep)\n"
+        "    found = []\n"
+        "    if os.path.isfile(os.path.join(root, '__init__.py')):\n"
+        "        for dirpath, dirnames, filenames in os.walk(root):\n"
+        "            if '__init__.py' not in filenames:\n"
+        "                dirnames[:] = []\n"
+        "                continue\n"
+        "            for filename in filenames:\n"
+        "                if filename.startswith('test_') and filename.endswith('.py'):\n"
+        "                    path = os.path.join(dirpath, filename)\n"
+        "                    name = os.path.splitext(path)[0].replace(os.sep, '.')\n"
+        "                    found.append((name, os.path.getsize(path)))\n"
+        "    units.extend(found or [(target, 0)])\n"
+        "if durations:\n"
+        "    default = sum(durations.values()) / len(durations)\n"
+        "    units = [(durations.get(name, default), name) for name, size in units]\n"
+        "else:\n"
+        "    units = [(size, name) for name, size in units]\n"
+        "shards = [[0, []] for i in range(max(1, min(count, len(units))))]\n"
+        "for weight, name in sorted(units, reverse=True):\n"
+        "    shard = min(shards, key=lambda shard: shard[0])\n"
+        "    shard[0] += weight\n"
+        "    shard[1].append(name)\n"
+        "started = time.time()\n"
+        "processes = []\n"
+        "for i, (weight, names) in enumerate(shards):\n"
+        "    temp = '_trial_temp'\n"
+        "    if i:\n"
+        "        temp += '-%d' % (i,)\n"
+        "        if os.path.isdir(temp):\n"
+        "            shutil.rmtree(temp)\n"
+        "    output = tempfile.TemporaryFile()\n"
+        "    processes.append((subprocess.Popen(\n"
+        "        trial + ['--temp-directory=' + temp] + sorted(names),\n"
+        "        stdout=output, stderr=subprocess.STDOUT), output))\n"
+        "ranRe = re.compile(r'^Ran (\\d+) tests? in ')\n"
+        "order = ['skips', 'expectedFailures', 'failures', 'errors',\n"
+        "         'unexpectedSuccesses', 'successes']\n"
+        "verbose, problems, counts = [], [], {}\n"
+        "total, parsed, failed, rc = 0, True, False, 0\n"
+        "for process, output in processes:\n"
+        "    if process.wait() != 0:\n"
+        "        rc = 1\n"
+        "    output.seek(0)\n"
+        "    lines = output.read().decode('latin-1').splitlines(True)\n"
+        "    ran = [j for j, line in enumerate(lines) if ranRe.match(line)]\n"
+        "    if not ran:\n"
+        "        parsed = False\n"
+        "        verbose.extend(lines)\n"
+        "        continue\n"
+        "    ran = ran[-1]\n"
+        "    total += int(ranRe.match(lines[ran]).group(1))\n"
+        "    end = ran\n"
+        "    if ran and lines[ran - 1].startswith('-' * 60):\n"
+        "        end -= 1\n"
+        "    first = end\n"
+        "    for j, line in enumerate(lines[:end]):\n"
+        "        if line.startswith('=' * 60):\n"
+        "            first = j\n"
+        "            break\n"
+        "    body = lines[:first]\n"
+        "    while body and not body[-1].strip():\n"
+        "        body.pop()\n"
+        "    verbose.extend(body)\n"
+        "    problems.extend(lines[first:end])\n"
+        "    for line in lines[ran + 1:]:\n"
+        "        if line.startswith(('OK', 'FAILED', 'PASSED')):\n"
+        "            failed = failed or line.startswith('FAILED')\n"
+        "            for key, value in re.findall(r'(\\w+)=(\\d+)', line):\n"
+        "                if key not in order:\n"
+        "                    order.append(key)\n"
+        "                counts[key] = counts.get(key, 0) + int(value)\n"
+        "out = ''.join(verbose) + '\\n' + ''.join(problems) + '-' * 79 + '\\n'\n"
+        "if parsed:\n"
+        "    out += 'Ran %d tests in %.3fs\\n\\n%s (%s)\\n' % (\n"
+        "        total, time.time() - started, failed and 'FAILED' or 'PASSED',\n"
+        "        ', '.join(['%s=%d' % (key, counts[key])\n"
+        "                   for key in order if key in counts]))\n"
+        "stdout = getattr(sys.stdout, 'buffer', sys.stdout)\n"
+        "stdout.write(out.encode('latin-1'))\n"
+        "stdout.flush()\n"
+        "sys.exit(rc)\n")
 
     def __init__(self, reactor=UNSPECIFIED, python=None, trial=None,
                  testpath=UNSPECIFIED,
                  tests=None, testChanges=None,
                  recurse=None, randomly=None,
-                 trialMode=None, trialArgs=None,
-                 **kwargs):
+                 trialMode=None, trialArgs=None, shards=None,
+                 concurrent=None, **kwargs):
         """
         @type  testpath: string
         @param testpath: use in PYTHONPATH when running the tests. If
@@ -259,6 +332,19 @@ class Trial(ShellCommand):
                          (like failing to make registerAdapter calls before
                          lookups are done).
 
+        @type  shards: int
+        @param shards: if greater than 1, run the tests in that many
+                       concurrent trial processes, each running a share of the
+                       test modules which took about the same time in the
+                       last build. This is ignored when using testChanges.
+
+        @type  concurrent: boolean
+        @param concurrent: if True, report the run of the tests with 'reactor'
+                           left in _trial_temp-REACTOR.out and
+                           _trial_temp-REACTOR.rc by a previous
+                           L{RunReactorsConcurrently} step, instead of running
+                           trial.
+
         @type  kwargs: dict
         @param kwargs: parameters. The following parameters are inherited from
                        L{ShellCommand} and may be useful to set: workdir,
@@ -317,6 +403,10 @@ class Trial(ShellCommand):
             self.recurse = recurse
         if randomly is not None:
             self.randomly = randomly
+        if shards is not None:
+            self.shards = shards
+        if concurrent is not None:
+            self.concurrent = concurrent
 
         # build up most of the command, then stash it until start()
         command = []
@@ -343,6 +433,12 @@ class Trial(ShellCommand):
 
         # this counter will feed Progress along the 'test cases' metric
         self.addLogObserver('stdio', TrialTestCaseCounter())
+        # this one collects the timings printed by --reporter=timing
+        self.timer = TrialTestTimer()
+        self.addLogObserver('stdio', self.timer)
+        # and this one keeps the end of the output, for countFailedTests
+        self.tail = TrailingOutput()
+        self.addLogObserver('stdio', self.tail)
         # this one just measures bytes of output in _trial_temp/test.log
         self.addLogObserver('test.log', OutputProgressObserver('test.log'))
 
@@ -373,10 +469,23 @@ class Trial(ShellCommand):
     def start(self):
         # now that self.build.allFiles() is nailed down, finish building the
         # command
-        if self.testChanges:
-            for f in self.build.allFiles():
-                if f.endswith(".py"):
-                    self.command.append("--testmodule=%s" % f)
+        if self.concurrent:
+            self.command = self.collectCommand()
+        elif self.testChanges:
+            files = self.build.allFiles()
+            testModules = ["--testmodule=%s" % f
+                           for f in files if f.endswith(".py")]
+            index = TestDependencyIndex.forBuilder(
+                self.build.build_status.getBuilder())
+            affected = index.affectedTests(files) or []
+            log.msg("Trial: %d test modules depend on the changes" % (
+                len(affected),))
+            if len(affected) > self.maxAffectedTests or not (
+                    testModules or affected):
+                return SKIPPED
+            self.command.extend(testModules + affected)
+        elif self.shards > 1:
+            self.command = self.shardCommand(self.command, self.tests)
         else:
             self.command.extend(self.tests)
         log.msg("Trial.start: command is", self.command)
@@ -385,7 +494,10 @@ class Trial(ShellCommand):
         # manually. This is a fallback for the Twisted buildbot and some old
         # buildslaves.
         self._needToPullTestDotLog = False
-        if self.slaveVersionIsOlderThan("shell", "2.1"):
+        if self.concurrent:
+            # test.log was collected by the step which ran trial
+            self.logfiles = {}
+        elif self.slaveVersionIsOlderThan("shell", "2.1"):
             log.msg("Trial: buildslave %s is too old to accept logfiles=" %
                     self.getSlaveName())
             log.msg(" falling back to 'cat _trial_temp/test.log' instead")
@@ -395,6 +507,43 @@ class Trial(ShellCommand):
         ShellCommand.start(self)
 
 
+    def shardCommand(self, trial, tests):
+        """
+        Build the command running the tests in shards, and watch the test.log
+        of each shard.
+
+        @param trial: the command running trial, without the tests
+        @param tests: the tests to run
+        """
+        status = self.build.build_status
+        timings = TestTimings.forBuilder(status.getBuilder()).latest(self.name)
+        durations = moduleDurations(timings or {})
+        log.msg("Trial: sharding with the durations of %d test modules" % (
+            len(durations),))
+
+        self.logfiles = dict(self.logfiles)
+        for i in range(1, self.shards):
+            self.logfiles["test.log-%d" % (i,)] = "_trial_temp-%d/test.log" % (i,)
+
+        return (self.python or ["python"]) + [
+            "-c",
+            'from binascii import unhexlify; exec(unhexlify(b"%s"))' % (
+                hexlify(self.shardSource),),
+            str(self.shards),
+            base64.b64encode(zlib.compress(json.dumps(durations))),
+            ] + list(trial) + ["--"] + list(tests)
+
+    def collectCommand(self):
+        """
+        Build the command reporting the output and exit status of the run of
+        trial with this step's reactor by L{RunReactorsConcurrently}.
+        """
+        return (self.python or ["python"]) + [
+            "-c",
+            'from binascii import unhexlify; exec(unhexlify(b"%s"))' % (
+                hexlify(self.collectSource),),
+            RunReactorsConcurrently.tempDirectory(self.reactor)]
+
     def commandComplete(self, cmd):
         if not self._needToPullTestDotLog:
             return self._gotTestDotLog(cmd)
@@ -419,10 +568,9 @@ class Trial(ShellCommand):
         # figure out all status, then let the various hook functions return
         # different pieces of it
 
-        # 'cmd' is the original trial command, so cmd.logs['stdio'] is the
-        # trial output. We don't have access to test.log from here.
-        output = cmd.logs['stdio'].getText()
-        counts = countFailedTests(output)
+        # 'cmd' is the original trial command, so self.tail has the end of
+        # the trial output. We don't have access to test.log from here.
+        counts = countFailedTests(self.tail.getText())
 
         total = counts['total']
         failures, errors = counts['failures'], counts['errors']
@@ -503,86 +651,102 @@ class Trial(ShellCommand):
         self.build.build_status.addTestResult(tr)
 
     def createSummary(self, loog):
-        output = loog.getText()
-        problems = ""
-        sio = StringIO.StringIO(output)
-        warnings = {}
-        while 1:
-            line = sio.readline()
-            if line == "":
-                break
-            if line.find(" exceptions.DeprecationWarning: ") != -1:
-                # no source
-                warning = line # TODO: consider stripping basedir prefix here
-                warnings[warning] = warnings.get(warning, 0) + 1
-            elif (line.find(" DeprecationWarning: ") != -1 or
-                line.find(" UserWarning: ") != -1):
-                # next line is the source
-                warning = line + sio.readline()
-                warnings[warning] = warnings.get(warning, 0) + 1
-            elif line.find("Warning: ") != -1:
-                warning = line
-                warnings[warning] = warnings.get(warning, 0) + 1
-
-            if line.find("=" * 60) == 0 or line.find("-" * 60) == 0:
-                problems += line
-                problems += sio.read()
-                break
+        parser = parseTrialOutput(loog.getText())
 
+        problems = parser.getProblems()
         if problems:
             self.addCompleteLog("problems", problems)
-            # now parse the problems for per-test results
-            pio = StringIO.StringIO(problems)
-            pio.readline() # eat the first separator line
-            testname = None
-            done = False
-            while not done:
-                while 1:
-                    line = pio.readline()
-                    if line == "":
-                        done = True
-                        break
-                    if line.find("=" * 60) == 0:
-                        break
-                    if line.find("-" * 60) == 0:
-                        # the last case has --- as a separator before the
-                        # summary counts are printed
-                        done = True
-                        break
-                    if testname is None:
-                        # the first line after the === is like:
-# EXPECTED FAILURE: testLackOfTB (twisted.test.test_failure.FailureTestCase)
-# SKIPPED: testRETR (twisted.test.test_ftp.TestFTPServer)
-# FAILURE: testBatchFile (twisted.conch.test.test_sftp.TestOurServerBatchFile)
-                        r = re.search(r'^([^:]+): (\w+) \(([\w\.]+)\)', line)
-                        if not r:
-                            # TODO: cleanup, if there are no problems,
-                            # we hit here
-                            continue
-                        result, name, case = r.groups()
-                        testname = tuple(case.split(".") + [name])
-                        results = {'SKIPPED': SKIPPED,
-                                   'EXPECTED FAILURE': SUCCESS,
-                                   'UNEXPECTED SUCCESS': WARNINGS,
-                                   'FAILURE': FAILURE,
-                                   'ERROR': FAILURE,
-                                   'SUCCESS': SUCCESS, # not reported
-                                   }.get(result, WARNINGS)
-                        text = result.lower().split()
-                        loog = line
-                        # the next line is all dashes
-                        loog += pio.readline()
-                    else:
-                        # the rest goes into the log
-                        loog += line
-                if testname:
-                    self.addTestResult(testname, results, text, loog)
-                    testname = None
+            for testname, results, text, tlog in parser.results:
+                self.addTestResult(testname, results, text, tlog)
 
+        warnings = normalizeWarnings(
+            parser.warnings,
+            slaveDirectories(self.getProperty('workdir'), self.getWorkdir()))
         if warnings:
-            lines = warnings.keys()
-            lines.sort()
-            self.addCompleteLog("warnings", "".join(lines))
+            self.addCompleteLog("warnings", formatWarnings(warnings))
+        self.checkWarnings(warnings)
+
+        if self.timer.timings:
+            self.addCompleteLog("slowest tests",
+                formatTimings(self.timer.slowest(self.slowestTests)))
+            self.recordTimings(self.timer.timings)
+
+        if self.timer.results:
+            self.recordResults(self.timer.results, self.timer.timings)
+
+    def checkWarnings(self, warnings):
+        """
+        Keep the warnings of trunk builds in the builder's L{WarningIndex},
+        and report the warnings of other builds which are not in it.
+
+        @param warnings: L{dict} mapping normalized warnings to counts
+        """
+        status = self.build.build_status
+        index = WarningIndex.forBuilder(status.getBuilder())
+        try:
+            if isTrunk(self.getProperty('branch')):
+                revision = self.getProperty('got_revision')
+                if revision:
+                    index.record(revision, status.getNumber(), warnings)
+            elif index.exists():
+                new = index.newWarnings(warnings)
+                if new:
+                    self.addCompleteLog("new warnings", formatWarnings(
+                        dict([(warning, warnings[warning])
+                              for warning in new])))
+                    self.text.append("%d new %s" % (
+                        len(new), len(new) == 1 and "warning" or "warnings"))
+        except (IOError, OSError):
+            log.err(None, "Could not check warnings")
+
+    def recordTimings(self, timings):
+        """
+        Keep the per-test timings of this step on the master.
+
+        @param timings: C{(testName, seconds)} pairs
+        """
+        status = self.build.build_status
+        timingStore = TestTimings.forBuilder(status.getBuilder())
+        try:
+            entry = timingStore.record(
+                status.getNumber(), self.name, timings)
+        except (IOError, OSError):
+            log.err(None, "Could not record test timings")
+        else:
+            log.msg("Trial: recorded %d test timings in %s" % (
+                len(timings), entry.path))
+
+    def recordResults(self, results, timings):
+        """
+        Append the results of the tests run by this step to the master's
+        L{TestResultStore}, in a thread, so the reactor is not blocked while
+        the database is written.
+
+        @param results: C{(testName, result)} pairs
+        @param timings: C{(testName, seconds)} pairs
+
+        @return: a L{Deferred} which fires when the results are recorded.
+        """
+        status = self.build.build_status
+        resultStore = TestResultStore.forBuilder(status.getBuilder())
+        args = (status.getBuilder().getName(), status.getNumber(),
+                self.name, self.getProperty('got_revision'),
+                self.getProperty('branch'), results, timings)
+
+        def record():
+            try:
+                return resultStore.record(*args)
+            finally:
+                resultStore.close()
+
+        def recorded(count):
+            log.msg("Trial: recorded %d test results in %s" % (
+                count, resultStore.path.path))
+
+        d = threads.deferToThread(record)
+        d.addCallbacks(recorded, log.err,
+                       errbackArgs=("Could not record test results",))
+        return d
 
     def evaluateCommand(self, cmd):
         return self.results
@@ -840,6 +1004,93 @@ class RemoveTrialTemp(ShellCommand):
             "_trial_temp"]
 
 
+class RunReactorsConcurrently(ShellCommand):
+    """
+    Run trial once for each of several reactors, all at the same time.
+
+    Each run uses _trial_temp-REACTOR/ as its temporary directory, and its
+    output and exit status are left in _trial_temp-REACTOR.out and
+    _trial_temp-REACTOR.rc, for a L{Trial} step with 'concurrent' to report
+    for each reactor. This step only fails if the runs could not be started;
+    its output is a line per reactor with the exit status and the last line
+    of output of each run.
+    """
+    name = "run-reactors"
+    description = ["running", "reactors"]
+    descriptionDone = ["ran", "reactors"]
+    flunkOnFailure = True
+
+    source = (
+        "import os, shutil, subprocess, sys, time\n"
+        "split = sys.argv.index('--', 2)\n"
+        "reactors = sys.argv[1].split(',')\n"
+        "trial, tests = sys.argv[2:split], sys.argv[split + 1:]\n"
+        "started = time.time()\n"
+        "pending = []\n"
+        "for reactor in reactors:\n"
+        "    temp = '_trial_temp-' + reactor\n"
+        "    for path in [temp + '.out', temp + '.rc']:\n"
+        "        if os.path.exists(path):\n"
+        "            os.remove(path)\n"
+        "    if os.path.isdir(temp):\n"
+        "        shutil.rmtree(temp)\n"
+        "    output = open(temp + '.out', 'wb')\n"
+        "    process = subprocess.Popen(\n"
+        "        trial + ['--reactor=' + reactor, '--temp-directory=' + temp] + tests,\n"
+        "        stdout=output, stderr=subprocess.STDOUT)\n"
+        "    pending.append((reactor, temp, process, output))\n"
+        "while pending:\n"
+        "    time.sleep(0.1)\n"
+        "    for run in pending[:]:\n"
+        "        reactor, temp, process, output = run\n"
+        "        rc = process.poll()\n"
+        "        if rc is None:\n"
+        "            continue\n"
+        "        pending.remove(run)\n"
+        "        output.close()\n"
+        "        rcFile = open(temp + '.rc', 'w')\n"
+        "        rcFile.write('%d\\n' % (rc,))\n"
+        "        rcFile.close()\n"
+        "        last = b''\n"
+        "        for line in open(temp + '.out', 'rb'):\n"
+        "            if line.strip():\n"
+        "                last = line.strip()\n"
+        "        sys.stdout.write('%s: exit status %d after %.1fs: %s\\n' % (\n"
+        "            reactor, rc, time.time() - started,\n"
+        "            last.decode('latin-1')))\n"
+        "        sys.stdout.flush()\n")
+
+    @staticmethod
+    def tempDirectory(reactor):
+        """
+        Get the temporary directory of the run of trial with C{reactor}.
+        """
+        return "_trial_temp-%s" % (reactor,)
+
+    def __init__(self, python, trial, reactors, tests, **kwargs):
+        """
+        @param python: the python command, as a list
+        @param trial: the trial command, starting with the interpreter to
+            test, and its arguments, except for the reactor, temporary
+            directory and tests
+        @param reactors: the names of the reactors to run the tests with
+        @param tests: the tests to run, which may be renderable
+        """
+        ShellCommand.__init__(self, **kwargs)
+        self.addFactoryArguments(python=python, trial=trial,
+                                 reactors=reactors, tests=tests)
+        self.logfiles = dict(self.logfiles)
+        for reactor in reactors:
+            self.logfiles["test.log-%s" % (reactor,)] = (
+                "%s/test.log" % (self.tempDirectory(reactor),))
+        self.command = python + [
+            "-c",
+            'from binascii import unhexlify; exec(unhexlify(b"%s"))' % (
+                hexlify(self.source),),
+            ",".join(reactors)] + list(trial) + ["--"] + list(tests)
+
+
+
 class LearnVersion(SetProperty):
     """
     Import a package and set a version property based on its version.
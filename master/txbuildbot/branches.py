@@ -0,0 +1,67 @@
+"""
+Classification of the branches builds are made from.
+
+Branches are named as svn paths by the changes, C{/branches/foo} or
+C{branches/foo}, and as plain names by the git steps and the web forms, and
+the default branch is named C{None} or C{''}.  The same few branches are
+classified over and over, by each step of each build and by the schedulers,
+so each name is parsed once, and its L{BranchInfo} is cached.
+"""
+
+# The prefixes of the svn paths of branches, longest first.
+_SVN_PREFIXES = ('/branches/', 'branches/', '/')
+
+_cache = {}
+
+# The number of names cached; the cache is emptied once it is full, which
+# only happens if a master runs for long enough to see that many branches.
+maxCacheSize = 10000
+
+
+
+class BranchInfo(object):
+    """
+    How a branch name classifies.
+
+    @ivar branch: the name as given.
+    @ivar name: the name without its svn prefix; C{'trunk'} for the default
+        branch.
+    @ivar svnPrefix: the svn prefix cut off C{branch}, or C{''}.
+    @ivar isTrunk: whether the branch is trunk.
+    @ivar isRelease: whether the branch is a release branch.
+    """
+    __slots__ = ('branch', 'name', 'svnPrefix', 'isTrunk', 'isRelease')
+
+    def __init__(self, branch):
+        self.branch = branch
+        name = branch or 'trunk'
+        prefix = ''
+        if branch:
+            for cutoff in _SVN_PREFIXES:
+                if branch.startswith(cutoff):
+                    prefix = cutoff
+                    name = branch[len(cutoff):]
+                    break
+        self.name = name
+        self.svnPrefix = prefix
+        self.isTrunk = name == 'trunk'
+        self.isRelease = name.startswith('releases/')
+
+
+    def __repr__(self):
+        return '<BranchInfo %r: name=%r svnPrefix=%r>' % (
+            self.branch, self.name, self.svnPrefix)
+
+
+
+def branchInfo(branch):
+    """
+    Get the cached L{BranchInfo} of a branch name.
+    """
+    try:
+        return _cache[branch]
+    except KeyError:
+        if len(_cache) >= maxCacheSize:
+            _cache.clear()
+        info = _cache[branch] = BranchInfo(branch)
+        return info
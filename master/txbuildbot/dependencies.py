@@ -0,0 +1,276 @@
+"""
+Dependencies of the interpreters built by the buildmaster, cached on the
+slave.
+
+The tarballs of the dependencies are stored on the slave under their
+checksum, so one is only sent down once it changed on the master, and the
+files installed from each are archived, so they are restored rather than
+installed again by the builds of the same interpreter.
+"""
+
+import hashlib
+import os
+from binascii import hexlify
+
+from twisted.internet import threads
+from twisted.python import log
+
+from buildbot.process import buildstep
+from buildbot.process.properties import WithProperties
+from buildbot.steps.shell import ShellCommand
+from buildbot.steps.transfer import FileDownload
+from buildbot.status.results import SUCCESS
+
+# The checksums of the tarballs on the master, keyed by path, with the size
+# and modification time of the tarball they were computed for.
+_checksums = {}
+
+
+
+def dependencyProperty(basename):
+    """
+    Get the name of the build property holding the path, relative to the
+    builder's directory on the slave, of the tarball of a dependency.
+    """
+    return 'dependency-' + basename
+
+
+
+class DownloadDependency(FileDownload):
+    """
+    Send the tarball of a dependency down to the slave, unless it already has
+    the same one.
+
+    The tarball is stored in C{directory} under its checksum, and the path
+    where it is is set as the build property named by L{dependencyProperty}.
+    The checksum of the slave's tarball is checked before it is used, so one
+    truncated by an interrupted download is sent down again.
+    """
+    # Run with the path of the tarball and its expected checksum; exits with
+    # 0 if the tarball has that checksum.
+    checkSource = (
+        "import hashlib, sys\n"
+        "digest = hashlib.sha1()\n"
+        "try:\n"
+        "    tarball = open(sys.argv[1], 'rb')\n"
+        "except IOError:\n"
+        "    sys.exit(1)\n"
+        "for chunk in iter(lambda: tarball.read(2 ** 16), b''):\n"
+        "    digest.update(chunk)\n"
+        "tarball.close()\n"
+        "sys.exit(digest.hexdigest() != sys.argv[2])\n")
+
+    def __init__(self, basename, directory='dependencies', python='python',
+                 mastersrc=None, slavedest=None, workdir='.', **kwargs):
+        """
+        @param basename: the name of the tarball in the master's
+            C{dependencies} directory, without C{.tar.gz}
+        @param directory: the directory of the slave's builder directory
+            keeping the tarballs
+        @param python: the interpreter checking the tarball on the slave
+        @param mastersrc: the path of the tarball on the master, by default
+            in its C{dependencies} directory
+        """
+        if mastersrc is None:
+            mastersrc = 'dependencies/' + basename + '.tar.gz'
+        FileDownload.__init__(self, mastersrc=mastersrc, slavedest=slavedest,
+                              workdir=workdir, **kwargs)
+        self.addFactoryArguments(basename=basename, directory=directory,
+                                 python=python)
+        self.basename = basename
+        self.directory = directory
+        self.python = python
+
+
+    def checksum(self):
+        """
+        Get the checksum of the tarball on the master.  It is only computed
+        again once the size or modification time of the tarball changed.
+
+        @return: the hexadecimal SHA-1 of the tarball, or C{None} if it cannot
+            be read.
+        """
+        try:
+            status = os.stat(self.mastersrc)
+        except OSError:
+            return None
+        stamp = (status.st_size, status.st_mtime)
+        cached = _checksums.get(self.mastersrc)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        digest = hashlib.sha1()
+        try:
+            tarball = open(self.mastersrc, 'rb')
+        except IOError:
+            return None
+        try:
+            for chunk in iter(lambda: tarball.read(2 ** 16), ''):
+                digest.update(chunk)
+        finally:
+            tarball.close()
+        checksum = digest.hexdigest()
+        _checksums[self.mastersrc] = (stamp, checksum)
+        return checksum
+
+
+    def checkCommand(self):
+        """
+        Get the command running L{checkSource} on the slave, without its
+        arguments.
+        """
+        return [self.python, '-c',
+                'from binascii import unhexlify; exec(unhexlify(b"%s"))' % (
+                    hexlify(self.checkSource),)]
+
+
+    def start(self):
+        # The tarball is read in a thread, so the reactor is not blocked
+        # while a new one is hashed.
+        d = threads.deferToThread(self.checksum)
+        d.addCallback(self.checkSlave)
+        d.addErrback(self.failed)
+
+
+    def checkSlave(self, checksum):
+        """
+        Check whether the slave has the tarball whose checksum is
+        C{checksum}, and send it down if it does not.
+        """
+        if checksum is None:
+            # Let the download report the missing tarball.
+            self.slavedest = '%s/%s.tar.gz' % (self.directory, self.basename)
+            return FileDownload.start(self)
+        self.slavedest = '%s/%s-%s.tar.gz' % (
+            self.directory, checksum[:16], self.basename)
+        self.setProperty(dependencyProperty(self.basename), self.slavedest,
+                         'DownloadDependency')
+        cmd = buildstep.RemoteShellCommand(
+            '.', self.checkCommand() + [self.slavedest, checksum])
+        d = self.runCommand(cmd)
+        def downloadMissing(ignored):
+            if cmd.rc != 0:
+                return FileDownload.start(self)
+            log.msg(format="Using the cached %(tarball)s",
+                    tarball=self.slavedest)
+            self.step_status.setText(['cached', self.basename])
+            # FileDownload.finished expects the download command.
+            buildstep.BuildStep.finished(self, SUCCESS)
+        d.addCallback(downloadMissing)
+        return d
+
+
+
+class InstallDependency(ShellCommand):
+    """
+    Install a dependency with C{python}, or restore the files installed from
+    the same tarball with the same interpreter build.
+
+    The files an installation adds to C{prefix} are archived in C{cache},
+    under a hash of C{buildId}, the version of the interpreter, the tarball,
+    and the prefix.  Only the C{maxEntries} most recently used archives of a
+    dependency are kept, as are only the tarballs of the dependency which
+    are used.
+
+    The paths are relative to the working directory of the step, which is
+    the slave's builder directory by default: C{..} does not resolve to it
+    from inside the build directory when that is a symlink.
+    """
+    source = (
+        "import hashlib, os, shutil, subprocess, sys, tarfile\n"
+        "tarball, name, directory, prefix, build, cache = sys.argv[1:7]\n"
+        "maxEntries = int(sys.argv[7])\n"
+        "source = os.path.join(directory, name)\n"
+        "prefix = os.path.abspath(prefix)\n"
+        "key = hashlib.sha1(repr([\n"
+        "    build, os.path.basename(tarball), list(sys.version_info),\n"
+        "    sys.platform, sys.maxsize, prefix]).encode('utf-8'))\n"
+        "archive = os.path.join(cache, '%s-%s.tar' % (\n"
+        "    key.hexdigest()[:16], name))\n"
+        "def snapshot(top, exclude):\n"
+        "    files = {}\n"
+        "    for dirpath, dirnames, filenames in os.walk(top):\n"
+        "        dirnames[:] = [\n"
+        "            dirname for dirname in dirnames\n"
+        "            if os.path.abspath(os.path.join(dirpath, dirname))\n"
+        "            not in exclude]\n"
+        "        for filename in filenames:\n"
+        "            path = os.path.join(dirpath, filename)\n"
+        "            status = os.lstat(path)\n"
+        "            files[path] = (status.st_size, status.st_mtime)\n"
+        "    return files\n"
+        "if os.path.exists(archive):\n"
+        "    installed = tarfile.open(archive)\n"
+        "    installed.extractall(prefix)\n"
+        "    installed.close()\n"
+        "    os.utime(archive, None)\n"
+        "    print('Restored %s from %s' % (name, archive))\n"
+        "else:\n"
+        "    if os.path.isdir(source):\n"
+        "        shutil.rmtree(source)\n"
+        "    extracted = tarfile.open(tarball)\n"
+        "    extracted.extractall(directory)\n"
+        "    extracted.close()\n"
+        "    exclude = [os.path.abspath(source), os.path.abspath(cache)]\n"
+        "    if not os.path.isdir(prefix):\n"
+        "        os.makedirs(prefix)\n"
+        "    before = snapshot(prefix, exclude)\n"
+        "    sys.stdout.flush()\n"
+        "    rc = subprocess.call(\n"
+        "        [sys.executable, 'setup.py', 'clean', 'install',\n"
+        "         '--prefix', prefix], cwd=source)\n"
+        "    if rc:\n"
+        "        sys.exit(rc)\n"
+        "    after = snapshot(prefix, exclude)\n"
+        "    if not os.path.isdir(cache):\n"
+        "        os.makedirs(cache)\n"
+        "    temporary = '%s.tmp-%d' % (archive, os.getpid())\n"
+        "    installed = tarfile.open(temporary, 'w')\n"
+        "    for path in sorted(after):\n"
+        "        if before.get(path) != after[path]:\n"
+        "            installed.add(path, os.path.relpath(path, prefix),\n"
+        "                          recursive=False)\n"
+        "    installed.close()\n"
+        "    os.rename(temporary, archive)\n"
+        "    print('Archived the installation of %s in %s' % (name, archive))\n"
+        "archives = []\n"
+        "for archiveName in os.listdir(cache):\n"
+        "    if archiveName.endswith('-%s.tar' % (name,)):\n"
+        "        path = os.path.join(cache, archiveName)\n"
+        "        archives.append((os.stat(path).st_mtime, path))\n"
+        "for used, path in sorted(archives, reverse=True)[maxEntries:]:\n"
+        "    if path != archive:\n"
+        "        os.remove(path)\n"
+        "tarballs = os.path.dirname(tarball)\n"
+        "for tarballName in os.listdir(tarballs):\n"
+        "    path = os.path.join(tarballs, tarballName)\n"
+        "    if (tarballName.endswith('-%s.tar.gz' % (name,))\n"
+        "            and tarballName != os.path.basename(tarball)):\n"
+        "        os.remove(path)\n")
+
+    def __init__(self, python, basename, prefix, buildId, directory='build',
+                 cache='dependencies/installed', maxEntries=3, **kwargs):
+        """
+        @param python: the path of the interpreter to install the dependency
+            with
+        @param basename: the name of the dependency's tarball, without
+            C{.tar.gz}, which is also the directory the tarball extracts to
+        @param prefix: the installation prefix
+        @param directory: the directory the tarball is extracted in
+        @param buildId: identifies the build of the interpreter, such as the
+            revision it was built from; may be a renderable
+        @param cache: the directory holding the archives of the installed
+            files
+        @param maxEntries: the number of archives kept for the dependency
+        """
+        kwargs.setdefault('workdir', '.')
+        ShellCommand.__init__(self, **kwargs)
+        self.addFactoryArguments(python=python, basename=basename,
+                                 prefix=prefix, buildId=buildId,
+                                 directory=directory, cache=cache,
+                                 maxEntries=maxEntries)
+        self.command = [
+            python, '-c',
+            'from binascii import unhexlify; exec(unhexlify(b"%s"))' % (
+                hexlify(self.source),),
+            WithProperties('%%(%s)s' % (dependencyProperty(basename),)),
+            basename, directory, prefix, buildId, cache, str(maxEntries)]
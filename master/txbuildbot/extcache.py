@@ -0,0 +1,127 @@
+"""
+Extension modules cached on the slave, and restored by the builds of trees
+with the same C sources instead of being compiled again.
+"""
+
+from binascii import hexlify
+
+from buildbot.steps.shell import Compile
+
+
+
+class CachedBuildExt(Compile):
+    """
+    Build the extension modules of the tree in place with C{buildCommand},
+    unless the cache has the ones built from the same sources.
+
+    The extension modules built are kept in C{cache}, in a directory named
+    after a hash of the interpreter and its ABI, the build command, the C
+    sources of the tree and those of C{setupFiles} which exist.  When that
+    directory exists, the extension modules are copied into the tree rather
+    than compiled.  It is only created once the build succeeded, by renaming
+    a temporary directory, and only the C{maxEntries} most recently used ones
+    are kept.
+
+    The paths are relative to the working directory of the step.
+
+    @cvar setupFiles: the files configuring the build of the extension
+        modules, in the layouts Twisted has used.
+    """
+    name = 'compile'
+
+    setupFiles = ('setup.py', 'setup.cfg', 'pyproject.toml',
+                  'twisted/python/dist.py', 'twisted/python/_setup.py',
+                  'src/twisted/python/dist.py', 'src/twisted/python/_setup.py')
+
+    source = (
+        "import hashlib, os, shutil, subprocess, sys\n"
+        "cache, maxEntries = sys.argv[1], int(sys.argv[2])\n"
+        "separator = sys.argv.index('--')\n"
+        "setupFiles = [os.path.normpath(f) for f in sys.argv[3:separator]]\n"
+        "command = sys.argv[separator + 1:]\n"
+        "def find(suffixes, names=()):\n"
+        "    found = []\n"
+        "    for dirpath, dirnames, filenames in os.walk('.'):\n"
+        "        dirnames[:] = sorted([\n"
+        "            name for name in dirnames\n"
+        "            if not name.startswith(('.', '_trial_temp'))\n"
+        "            and not (dirpath == '.' and name == 'build')])\n"
+        "        for filename in sorted(filenames):\n"
+        "            path = os.path.normpath(os.path.join(dirpath, filename))\n"
+        "            if filename.endswith(suffixes) or path in names:\n"
+        "                found.append(path)\n"
+        "    return found\n"
+        "try:\n"
+        "    import sysconfig\n"
+        "    soabi = sysconfig.get_config_var('SOABI')\n"
+        "except ImportError:\n"
+        "    soabi = None\n"
+        "digest = hashlib.sha1(repr([\n"
+        "    os.path.realpath(sys.executable), sys.version, sys.platform,\n"
+        "    sys.maxsize, soabi, command]).encode('utf-8'))\n"
+        "for path in find(('.c', '.h', '.pyx', '.pxd'), setupFiles):\n"
+        "    content = open(path, 'rb').read()\n"
+        "    digest.update(path.replace(os.sep, '/').encode('utf-8') + b'\\0')\n"
+        "    digest.update(hashlib.sha1(content).hexdigest().encode('ascii'))\n"
+        "key = digest.hexdigest()[:16]\n"
+        "entry = os.path.join(cache, key)\n"
+        "if os.path.isdir(entry):\n"
+        "    restored = 0\n"
+        "    for dirpath, dirnames, filenames in os.walk(entry):\n"
+        "        for filename in filenames:\n"
+        "            cached = os.path.join(dirpath, filename)\n"
+        "            shutil.copy2(cached, os.path.relpath(cached, entry))\n"
+        "            restored += 1\n"
+        "    os.utime(entry, None)\n"
+        "    print('Restored %d extension modules from %s' % (restored, entry))\n"
+        "else:\n"
+        "    print('Building the extension modules for ' + entry)\n"
+        "    sys.stdout.flush()\n"
+        "    rc = subprocess.call(command)\n"
+        "    if rc:\n"
+        "        sys.exit(rc)\n"
+        "    temporary = '%s.tmp-%d' % (entry, os.getpid())\n"
+        "    for path in find(('.so', '.pyd')):\n"
+        "        destination = os.path.join(temporary, path)\n"
+        "        if not os.path.isdir(os.path.dirname(destination)):\n"
+        "            os.makedirs(os.path.dirname(destination))\n"
+        "        shutil.copy2(path, destination)\n"
+        "    if not os.path.isdir(temporary):\n"
+        "        os.makedirs(temporary)\n"
+        "    try:\n"
+        "        os.rename(temporary, entry)\n"
+        "    except OSError:\n"
+        "        shutil.rmtree(temporary)\n"
+        "entries = []\n"
+        "for name in os.listdir(cache):\n"
+        "    if '.tmp-' not in name:\n"
+        "        path = os.path.join(cache, name)\n"
+        "        entries.append((os.stat(path).st_mtime, path))\n"
+        "for used, path in sorted(entries, reverse=True)[maxEntries:]:\n"
+        "    if path != entry:\n"
+        "        print('Removing the cached extension modules ' + path)\n"
+        "        shutil.rmtree(path)\n")
+
+    def __init__(self, python, buildCommand, cache='../build_ext-cache',
+                 maxEntries=10, setupFiles=None, **kwargs):
+        """
+        @param python: the python command, as a list
+        @param buildCommand: the command building the extension modules in
+            place, as a list
+        @param cache: the directory holding the extension modules
+        @param maxEntries: the number of builds of the extension modules to
+            keep
+        @param setupFiles: the setup files hashed with the C sources, if not
+            the default C{setupFiles}
+        """
+        Compile.__init__(self, **kwargs)
+        self.addFactoryArguments(python=python, buildCommand=buildCommand,
+                                 cache=cache, maxEntries=maxEntries,
+                                 setupFiles=setupFiles)
+        if setupFiles is None:
+            setupFiles = self.setupFiles
+        self.command = python + [
+            '-c',
+            'from binascii import unhexlify; exec(unhexlify(b"%s"))' % (
+                hexlify(self.source),),
+            cache, str(maxEntries)] + list(setupFiles) + ['--'] + buildCommand
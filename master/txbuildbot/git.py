@@ -1,3 +1,5 @@
+import re
+
 from twisted.python import log
 from twisted.internet import defer
 
@@ -6,38 +8,97 @@ from buildbot.steps.source.git import Git
 from buildbot.steps.source import Source
 from buildbot.status.results import SUCCESS
 
+from txbuildbot.branches import branchInfo
+
 
 
 def mungeBranch(branch):
     """
     Remove the leading prefix, that comes from svn branches.
     """
-    if not branch:
-        return 'trunk'
-
-    for cutoff in ['/branches/', 'branches/', '/']:
-        if branch.startswith(cutoff):
-            branch = branch[len(cutoff):]
-            break
-    return branch
+    return branchInfo(branch).name
 
 def isTrunk(branch):
     """
     Is the branch trunk?
     """
-    return mungeBranch(branch) == 'trunk'
+    return branchInfo(branch).isTrunk
 
 def isRelease(branch):
     """
     Is the branch a release branch?
     """
-    return mungeBranch(branch).startswith('releases/')
+    return branchInfo(branch).isRelease
+
+
+# The build property naming the local ref trunk was fetched to by TwistedGit,
+# which MergeForward merges instead of fetching trunk again.
+TRUNK_REF_PROPERTY = 'trunk_ref'
+
+
+def _fetchTrunkOnce(step, depth, trunkRef):
+    """
+    Fetch trunk into a shallow checkout, with C{depth} commits of history,
+    unless the checkout has it already.
+
+    Only the first fetch of trunk is limited: fetching again with a depth
+    would make the history deepened since shallow again.
+
+    @param step: the source step of the checkout, with a C{repourl} and a
+        C{_dovccmd} running git commands.
+    @param trunkRef: the local ref trunk is fetched to.
+    @return: a L{Deferred} firing with whether trunk was fetched.
+    """
+    d = step._dovccmd(['rev-parse', '--verify', '--quiet', trunkRef],
+                      abandonOnFailure=False)
+    def fetch(rc):
+        if rc == 0:
+            return False
+        d = step._dovccmd(['fetch', '--depth', str(depth), step.repourl,
+                           '+refs/heads/trunk:' + trunkRef])
+        d.addCallback(lambda _: True)
+        return d
+    d.addCallback(fetch)
+    return d
 
 
 class TwistedGit(Git):
     """
     Temporary support for the transitionary stage between SVN and Git.
+
+    @ivar reference: If given, the path, relative to the working directory,
+        of a bare repository shared by the builders of the slave.  It is
+        updated with the revision to build unless it already has it, and the
+        checkouts borrow its objects, so they are only fetched and stored
+        once per slave.
+
+    @ivar fetchTrunk: If true, the fetches of branches other than trunk also
+        fetch trunk, to L{trunkRef}, and set the build property named by
+        L{TRUNK_REF_PROPERTY} so L{MergeForward} does not fetch it again.
+
+    @ivar depth: If given, the number of commits of history the clones get,
+        rather than all of it, as does the first fetch of trunk with
+        C{fetchTrunk}.  Later fetches only get the new commits, and keep the
+        history the checkout has, which L{MergeForward} deepens further when
+        it needs to.
+
+    @ivar filter: If given, the object filter of the clones, such as
+        C{'blob:none'}, which makes a partial clone getting the files of the
+        commits checked out only.  Later fetches go by URL rather than through
+        the promisor remote, so they are not filtered.
     """
+    trunkRef = 'refs/buildbot/trunk'
+
+    def __init__(self, reference=None, fetchTrunk=False, depth=None,
+                 filter=None, **kwargs):
+        Git.__init__(self, **kwargs)
+        self.addFactoryArguments(reference=reference, fetchTrunk=fetchTrunk,
+                                 depth=depth, filter=filter)
+        self.reference = reference
+        self.fetchTrunk = fetchTrunk
+        self.depth = depth
+        self.filter = filter
+
 
     def startVC(self, branch, revision, patch):
         """
@@ -46,7 +107,7 @@ class TwistedGit(Git):
         * If a "git_revision" property is provided in the Change, use it
           instead of the base revision number.
         """
-        branch = mungeBranch(branch)
+        branch = branchInfo(branch).name
         id = self.getRepository()
         s = self.build.getSourceStamp(id)
         if s.changes:
@@ -56,20 +117,189 @@ class TwistedGit(Git):
         return Git.startVC(self, branch, revision, patch)
 
 
+    def full(self):
+        if self.reference is None:
+            return Git.full(self)
+        return self._withReference(Git.full)
+
+
+    def incremental(self):
+        if self.reference is None:
+            return Git.incremental(self)
+        return self._withReference(Git.incremental)
+
+
+    def _withReference(self, checkout):
+        """
+        Update the reference repository, and make sure the checkout borrows
+        its objects before updating it.
+
+        Checkouts made before the reference repository was used are
+        clobbered, so they are cloned again with it.
+
+        @param checkout: the unbound method updating the checkout.
+        """
+        d = self._updateReference()
+        d.addCallback(lambda _: self._sourcedirIsUpdatable())
+        def checkAlternates(updatable):
+            if not updatable:
+                return True
+            return self._pathExists(
+                self.workdir + '/.git/objects/info/alternates')
+        d.addCallback(checkAlternates)
+        def update(borrowsObjects):
+            if not borrowsObjects:
+                log.msg("The checkout does not use the reference repository, "
+                        "clobbering it")
+                return self.clobber()
+            return checkout(self)
+        d.addCallback(update)
+        return d
+
+
+    def _updateReference(self):
+        """
+        Create the reference repository if needed, and fetch the branch into
+        it unless it already has the revision to build.
+
+        Failures are ignored: the checkout then fetches what it needs from
+        C{repourl} itself.
+
+        The checkouts depend on its objects without it knowing, so it is
+        never garbage collected: pruning the objects of a branch which was
+        force-pushed would corrupt the checkouts still using them.
+        """
+        git = ['--git-dir', self.reference]
+        d = self._dovccmd(['init', '--bare', '--quiet', self.reference],
+                          abandonOnFailure=False)
+        for name, value in [('gc.auto', '0'), ('gc.pruneExpire', 'never')]:
+            d.addCallback(lambda _, name=name, value=value: self._dovccmd(
+                git + ['config', name, value], abandonOnFailure=False))
+        if self.revision:
+            d.addCallback(lambda _: self._dovccmd(
+                git + ['cat-file', '-e', self.revision + '^{commit}'],
+                abandonOnFailure=False))
+        def fetch(rc):
+            if self.revision and rc == 0:
+                return rc
+            refspec = '+refs/heads/%s:refs/heads/%s' % (
+                self.branch, self.branch)
+            return self._dovccmd(git + ['fetch', self.repourl, refspec],
+                                 abandonOnFailure=False)
+        d.addCallback(fetch)
+        return d
+
+
+    def _fetchesTrunk(self):
+        """
+        Is trunk fetched along with the branch?
+        """
+        return self.fetchTrunk and self.branch != 'trunk'
+
+
+    def _fetch(self, _):
+        if self.depth is not None and self._fetchesTrunk():
+            d = _fetchTrunkOnce(self, self.depth, self.trunkRef)
+            d.addCallback(lambda _: Git._fetch(self, None))
+        else:
+            d = Git._fetch(self, _)
+        if self._fetchesTrunk():
+            def fetchedTrunk(res):
+                self.setProperty(TRUNK_REF_PROPERTY, self.trunkRef,
+                                 'TwistedGit')
+                return res
+            d.addCallback(fetchedTrunk)
+        return d
+
+
+    def _pathExists(self, path):
+        """
+        Does C{path}, relative to the slave's builder directory, exist?
+        """
+        cmd = buildstep.RemoteCommand('stat', {'file': path,
+                                               'logEnviron': self.logEnviron})
+        cmd.useLog(self.stdio_log, False)
+        d = self.runCommand(cmd)
+        d.addCallback(lambda _: cmd.rc == 0)
+        return d
+
+
+    def _dovccmd(self, command, abandonOnFailure=True, collectStdout=False,
+                 extra_args={}):
+        if self.reference is not None and command[:1] == ['clone']:
+            command = ['clone', '--reference', self.reference] + command[1:]
+        if command[:1] == ['clone'] and self.filter is not None:
+            command = ['clone', '--filter=' + self.filter] + command[1:]
+        if command[:2] == ['fetch', '-t']:
+            if self._fetchesTrunk():
+                # The branch stays first, so FETCH_HEAD is still the branch.
+                command = command + ['+refs/heads/trunk:' + self.trunkRef]
+        if command[:1] == ['clone'] and self.depth is not None:
+            command = ['clone', '--depth', str(self.depth)] + command[1:]
+        return Git._dovccmd(self, command, abandonOnFailure, collectStdout,
+                            extra_args)
+
+
 
 class MergeForward(Source):
     """
     Merge with trunk.
+
+    @ivar batched: If true, the fetch, the merge and the lookup of the
+        revision to lint against are done by a single shell script run on the
+        slave, rather than by a command each.  This needs a POSIX shell, so
+        it is not for Windows slaves.
+
+    @ivar depth: If given, the checkout is expected to be shallow, as made by
+        L{TwistedGit} with a C{depth}: trunk is first fetched with this many
+        commits of history, and the history is deepened by as many commits at
+        a time until the merge base with trunk is found.  After C{maxDeepen}
+        attempts, the rest of the history is fetched.  This is not supported
+        with C{batched}.
     """
     name = 'merge-forward'
     description = ['merging', 'forward']
     descriptionDone = ['merge', 'forward']
     haltOnFailure = True
 
+    # Run with the repository URL, the kind of branch, and the local ref of
+    # trunk if it was fetched already as arguments; the output ends with the
+    # outcome of the merge and the revision to lint against.
+    mergeScript = (
+        'set -e\n'
+        'repourl="$1"\n'
+        'kind="$2"\n'
+        'trunk="$3"\n'
+        'if [ "$kind" = trunk ]; then\n'
+        '    base="$(git rev-parse HEAD~1)"\n'
+        '    merge=skipped\n'
+        'else\n'
+        '    if [ -z "$trunk" ]; then\n'
+        '        git fetch "$repourl" trunk\n'
+        '        trunk=FETCH_HEAD\n'
+        '    fi\n'
+        '    if [ "$kind" = release ]; then\n'
+        '        merge=skipped\n'
+        '    else\n'
+        '        git merge --no-ff --no-stat "$trunk"\n'
+        '        merge=merged\n'
+        '    fi\n'
+        '    base="$(git merge-base HEAD "$trunk")"\n'
+        'fi\n'
+        'echo "merge: $merge"\n'
+        'echo "lint_revision: $base"\n')
 
-    def __init__(self, repourl, branch='trunk', **kwargs):
+    _lintRevision_re = re.compile(r'^lint_revision: ([0-9a-f]{40})$', re.M)
+
+    def __init__(self, repourl, branch='trunk', batched=False, depth=None,
+                 maxDeepen=10, **kwargs):
+        assert not (batched and depth), \
+            "MergeForward cannot deepen the history of batched merges"
         self.repourl = repourl
         self.branch = branch
+        self.batched = batched
+        self.depth = depth
+        self.maxDeepen = maxDeepen
         kwargs['env'] = {
                 'GIT_AUTHOR_EMAIL': 'buildbot@twistedmatrix.com',
                 'GIT_AUTHOR_NAME': 'Twisted Buildbot',
@@ -77,22 +307,46 @@ class MergeForward(Source):
                 'GIT_COMMITTER_NAME': 'Twisted Buildbot',
                 }
         Source.__init__(self, **kwargs)
-        self.addFactoryArguments(repourl=repourl, branch=branch)
+        self.addFactoryArguments(repourl=repourl, branch=branch,
+                                 batched=batched, depth=depth,
+                                 maxDeepen=maxDeepen)
 
 
     def startVC(self, branch, revision, patch):
         self.stdio_log = self.addLog('stdio')
 
         self.step_status.setText(['merging', 'forward'])
-        d = defer.succeed(None)
-        if not isTrunk(branch):
-            d.addCallback(lambda _: self._fetch())
-        if not (isTrunk(branch) or isRelease(branch)):
-            d.addCallback(lambda _: self._merge())
-        if isTrunk(branch):
-            d.addCallback(lambda _: self._getPreviousVersion())
+        # The source step may have fetched trunk already.
+        trunk = self.getProperty(TRUNK_REF_PROPERTY, None)
+        if self.batched:
+            d = self._runMergeScript(branch, trunk)
         else:
-            d.addCallback(lambda _: self._getMergeBase())
+            info = branchInfo(branch)
+            d = defer.succeed(None)
+            if not info.isTrunk and trunk is None:
+                d.addCallback(lambda _: self._fetch())
+                if self.depth is not None:
+                    trunk = TwistedGit.trunkRef
+            if trunk is None:
+                trunk = 'FETCH_HEAD'
+            if self.depth is not None:
+                if info.isTrunk:
+                    d.addCallback(lambda _: self._deepenUntil(
+                        ['rev-parse', '--verify', '--quiet', 'HEAD~1'],
+                        ['trunk']))
+                else:
+                    # Deepening refetches trunk to its ref, which FETCH_HEAD
+                    # would not survive.
+                    d.addCallback(lambda _: self._deepenUntil(
+                        ['merge-base', 'HEAD', trunk],
+                        [info.name,
+                         '+refs/heads/trunk:' + TwistedGit.trunkRef]))
+            if not (info.isTrunk or info.isRelease):
+                d.addCallback(lambda _: self._merge(trunk))
+            if info.isTrunk:
+                d.addCallback(lambda _: self._getPreviousVersion())
+            else:
+                d.addCallback(lambda _: self._getMergeBase(trunk))
         d.addCallback(self._setLintVersion)
 
         d.addCallback(lambda _: SUCCESS)
@@ -107,21 +361,90 @@ class MergeForward(Source):
         return Source.finished(self, results)
 
     def _fetch(self):
+        if self.depth is not None:
+            d = _fetchTrunkOnce(self, self.depth, TwistedGit.trunkRef)
+            def fetchNewCommits(fetched):
+                if not fetched:
+                    return self._dovccmd(
+                        ['fetch', self.repourl,
+                         '+refs/heads/trunk:' + TwistedGit.trunkRef])
+            d.addCallback(fetchNewCommits)
+            return d
         return self._dovccmd(['fetch', self.repourl, 'trunk'])
 
-    def _merge(self):
+
+    def _deepenUntil(self, command, refspecs, attempts=0):
+        """
+        Deepen the history of a shallow checkout until a git command
+        succeeds.
+
+        @param command: the git command needing more history.
+        @param refspecs: what to fetch from C{repourl} to deepen the history.
+        @param attempts: the number of times the history was deepened
+            already; once it reaches C{maxDeepen}, the rest of the history
+            is fetched instead.
+        """
+        d = self._dovccmd(command, abandonOnFailure=False)
+        def deepen(rc):
+            if rc == 0:
+                return
+            if attempts >= self.maxDeepen:
+                log.msg("The history is still too shallow, unshallowing it")
+                return self._dovccmd(
+                    ['fetch', '--unshallow', self.repourl] + refspecs)
+            d = self._dovccmd(['fetch', '--deepen=%d' % (self.depth,),
+                               self.repourl] + refspecs)
+            d.addCallback(lambda _: self._deepenUntil(command, refspecs,
+                                                      attempts + 1))
+            return d
+        d.addCallback(deepen)
+        return d
+
+    def _merge(self, trunk='FETCH_HEAD'):
         return self._dovccmd(['merge',
                               '--no-ff', '--no-stat',
-                              'FETCH_HEAD'])
+                              trunk])
 
     def _getPreviousVersion(self):
         return self._dovccmd(['rev-parse', 'HEAD~1'],
                               collectStdout=True)
 
-    def _getMergeBase(self):
-        return self._dovccmd(['merge-base', 'HEAD', 'FETCH_HEAD'],
+    def _getMergeBase(self, trunk='FETCH_HEAD'):
+        return self._dovccmd(['merge-base', 'HEAD', trunk],
                               collectStdout=True)
 
+    def _runMergeScript(self, branch, trunk):
+        """
+        Run L{mergeScript} on the slave.
+
+        @param trunk: the local ref of trunk, or C{None} if it is to be
+            fetched.
+
+        @return: a L{Deferred} firing with the revision to lint against.
+        """
+        info = branchInfo(branch)
+        if info.isTrunk:
+            kind = 'trunk'
+        elif info.isRelease:
+            kind = 'release'
+        else:
+            kind = 'branch'
+        cmd = buildstep.RemoteShellCommand(
+            self.workdir,
+            ['/bin/sh', '-c', self.mergeScript, 'merge-forward',
+             self.repourl, kind, trunk or ''],
+            env=self.env, logEnviron=self.logEnviron, collectStdout=True)
+        cmd.useLog(self.stdio_log, False)
+        d = self.runCommand(cmd)
+        def parseOutput(_):
+            match = self._lintRevision_re.search(cmd.stdout)
+            if cmd.rc != 0 or match is None:
+                log.msg("Merge script failed: %s" % (cmd,))
+                raise buildstep.BuildStepFailed()
+            return match.group(1)
+        d.addCallback(parseOutput)
+        return d
+
     def _setLintVersion(self, version):
         self.setProperty("lint_revision", version.strip(), "merge-forward")
 
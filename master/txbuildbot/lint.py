@@ -1,37 +1,238 @@
 import itertools
-from twisted.python import log, util
+from twisted.python import log
 from buildbot.status.builder import SUCCESS, WARNINGS
-from buildbot.steps.shell import ShellCommand
+from buildbot.status.logfile import STDOUT, STDERR
+from buildbot.steps.shell import ShellCommand, SetProperty
 from buildbot.process.properties import Property
 
+from txbuildbot.lintcache import TrunkRevisionIndex, LintBaselineCache
+
 try:
     import cStringIO
     StringIO = cStringIO
 except ImportError:
     import StringIO
 import re
+from binascii import hexlify
+
+
+def iterLogLines(logObj):
+    """
+    Iterate over the lines of output in a log, reading it a chunk at a time
+    rather than loading the whole log into memory.
+
+    @param logObj: the log to read
+    @type logObj: L{buildbot.status.logfile.LogFile}
+
+    @return: iterator of the lines written to stdout and stderr, each with
+        its trailing newline
+    """
+    partial = ''
+    for chunk in logObj.getChunks([STDOUT, STDERR], onlyText=True):
+        lines = (partial + chunk).split('\n')
+        partial = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if partial:
+        yield partial
+
+
+def _iterLines(logText):
+    """
+    Iterate over the lines of lint output, which may be given either as a
+    single string, or as an iterable of lines.
+    """
+    if isinstance(logText, basestring):
+        return StringIO.StringIO(logText)
+    return logText
+
+
+
+def _extractChangedFiles(rc, stdout, stderr):
+    """
+    Parse the output of C{git diff -z --name-status}.
+
+    @return: L{dict} setting C{lint_changed_files} to a L{list} of
+        C{[status, path]} pairs, or an empty L{dict} if git failed.
+    """
+    if rc != 0:
+        return {}
+    fields = stdout.split('\0')
+    return {'lint_changed_files': [
+        [status[:1], path] for status, path in zip(fields[::2], fields[1::2])]}
+
+
+def _filesInPackage(changedFiles, package, deleted=True):
+    """
+    Select the changed Python source files which belong to a package.
+
+    @param changedFiles: C{[status, path]} pairs, as set in the
+        C{lint_changed_files} property by L{LearnChangedFiles}
+    @param package: fully qualified name of the package, or module
+    @param deleted: whether to include files which were deleted
+
+    @return: L{list} of paths
+    """
+    prefix = package.replace('.', '/')
+    return [path for status, path in changedFiles
+            if path.endswith('.py')
+            and (path == prefix + '.py' or path.startswith(prefix + '/'))
+            and (deleted or status != 'D')]
+
+
+def _moduleName(path):
+    """
+    Get the fully qualified name of the module in the source file at C{path}.
+    """
+    name = path[:-len('.py')].replace('/', '.')
+    if name.endswith('.__init__'):
+        name = name[:-len('.__init__')]
+    return name
+
+
+
+class LearnChangedFiles(SetProperty):
+    """
+    Find the files changed between C{lint_revision} and the revision being
+    built, and set the C{lint_changed_files} property to them, for use by
+    incremental L{LintStep}s.
+    """
+    name = 'learn-changed-files'
+    description = ['finding', 'changed', 'files']
+    descriptionDone = ['changed', 'files']
+    command = ['git', 'diff', '-z', '--name-status', '--no-renames',
+               Property('lint_revision', default='HEAD'), 'HEAD']
+    flunkOnFailure = False
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('extract_fn', _extractChangedFiles)
+        SetProperty.__init__(self, **kwargs)
+
+
+    def getText(self, cmd, results):
+        changedFiles = self.property_changes.get('lint_changed_files')
+        if changedFiles is not None:
+            return ['%d' % (len(changedFiles),), 'changed', 'files']
+        return SetProperty.getText(self, cmd, results)
+
+
 
 class LintStep(ShellCommand):
     """
     A L{ShellCommand} that generates summary information of errors generated
     during a build, and new errors generated vs. the most recent trunk build.
 
+    An incremental step only checks the files of a branch build which
+    L{LearnChangedFiles} found to differ from C{lint_revision}, and takes the
+    errors in all other files from the trunk build of C{lint_revision}.  If
+    there is no such trunk build, or the changed files are unknown, the whole
+    tree is checked as usual.
+
     @ivar worse: a L{bool} indicating whether this build is worse with respect
         to reported errors than the most recent trunk build.
+
+    @ivar incremental: whether to only check the files changed by a branch.
+
+    @ivar changedFiles: the C{[status, path]} pairs of the files being
+        checked by an incremental run, or C{None} if the whole tree is
+        checked.
+
+    @ivar baselineErrors: if C{changedFiles} is not C{None}, the errors
+        reported by the trunk build of C{lint_revision}.
     """
     flunkOnWarnings = True
+    incremental = False
+    changedFiles = None
+    baselineErrors = None
 
-    def createSummary(self, logObj):
-        logText = logObj.getText()
-        self.worse = self.processLogs(self.getPreviousLog(), logText)
+    def __init__(self, incremental=False, **kwargs):
+        ShellCommand.__init__(self, **kwargs)
+        self.addFactoryArguments(incremental=incremental)
+        self.incremental = incremental
+
+
+    def start(self):
+        if self.incremental:
+            self._startIncremental()
+        return ShellCommand.start(self)
+
+
+    def _startIncremental(self):
+        """
+        If only the changed files of this build need to be checked, change the
+        command to do so, and get the errors in the other files from trunk.
+        """
+        changedFiles = self.getProperty('lint_changed_files')
+        if not self.getProperty('branch') or changedFiles is None:
+            log.msg("Not a branch build with known changes, checking everything")
+            return
+        targetRevision = self.getProperty('lint_revision')
+        build = self._getLastBuild()
+        if build is None or build.getProperty('got_revision') != targetRevision:
+            log.msg(format="No trunk build of %(revision)s, checking everything",
+                    revision=targetRevision)
+            return
+        package = self.getProperty('test-case-name') or 'twisted'
+        targets = _filesInPackage(changedFiles, package, deleted=False)
+        self.changedFiles = changedFiles
+        self.baselineErrors = self._getBuildErrors(build)
+        if targets:
+            self.command = self.getIncrementalCommand(targets)
+        else:
+            self.command = ['echo', 'No changed files to check']
+
+
+    def getIncrementalCommand(self, paths):
+        """
+        Get the command checking only some files.
+
+        @param paths: the paths of the Python source files to check, relative
+            to the top of the checkout
+        @type paths: L{list} of L{str}
+
+        @return: the command to run
+        """
+        raise NotImplementedError(
+            "Must implement getIncrementalCommand for an incremental Lint step")
+
+
+    def mergeErrors(self, baselineErrors, paths, errors):
+        """
+        Combine the errors found in some files with the errors of a trunk
+        build, as if the whole tree had been checked.
+
+        @param baselineErrors: the errors reported by the trunk build
+        @type baselineErrors: L{dict} of L{set}s
 
+        @param paths: the paths of all changed Python source files, including
+            those which were deleted
+        @type paths: L{list} of L{str}
 
-    def processLogs(self, oldText, newText):
-        currentErrors = self.computeErrors(newText)
-        previousErrors = self.computeErrors(oldText)
+        @param errors: the errors reported for the files in C{paths}
+        @type errors: L{dict} of L{set}s
 
+        @return: L{dict} of L{set}s of errors
+        """
+        raise NotImplementedError(
+            "Must implement mergeErrors for an incremental Lint step")
+
+
+    def createSummary(self, logObj):
+        currentErrors = self.computeErrors(iterLogLines(logObj))
+        if self.changedFiles is None:
+            previousErrors = self.getPreviousErrors()
+        else:
+            previousErrors = self.baselineErrors
+            paths = _filesInPackage(
+                self.changedFiles, self.getProperty('test-case-name') or 'twisted')
+            self.addCompleteLog('changed files', '\n'.join(paths))
+            currentErrors = self.mergeErrors(previousErrors, paths, currentErrors)
+        self.worse = self.processErrors(previousErrors, currentErrors)
+        self._recordTrunkBuild(currentErrors)
+
+
+    def processErrors(self, previousErrors, currentErrors):
         self.addCompleteLog('%s errors' % self.lintChecker, '\n'.join(self.formatErrors(currentErrors)))
-        self.formatErrors(previousErrors)
 
         newErrors = self.computeDifference(currentErrors, previousErrors)
 
@@ -44,7 +245,7 @@ class LintStep(ShellCommand):
 
     def computeErrors(self, logText):
         """
-        @type logText: L{str}
+        @type logText: L{str}, or iterable of L{str} lines
         @param logText: output of lint command
 
         @return: L{dict} of L{set}s containing errors generated by lint, grouped by
@@ -82,30 +283,126 @@ class LintStep(ShellCommand):
         return new
 
 
-    def getPreviousLog(self):
+    def getPreviousErrors(self):
         """
-        Gets the output of lint from the last build of trunk.
+        Gets the errors reported by lint in the last build of trunk.
+
+        The errors are taken from the baseline cache if possible; otherwise the
+        output of that build is parsed, and the result is cached for later
+        builds.
 
-        @return: output of lint from last trunk build
-        @rtype: L{str}
+        @return: L{dict} of L{set}s containing errors from the last trunk
+            build, grouped by type
         """
         build = self._getLastBuild()
         if build is None:
-            log.msg("Found no previous build, returning empty error log")
-            return ""
+            log.msg("Found no previous build, using empty error log")
+            return self.computeErrors("")
+        return self._getBuildErrors(build)
+
+
+    def _getBuildErrors(self, build):
+        """
+        Gets the errors reported by lint in a build of trunk, from the baseline
+        cache or by parsing its output.
+
+        @type build: L{BuildStatus}
+
+        @return: L{dict} of L{set}s containing errors from C{build}
+        """
+        cache = self._getBaselineCache()
+        number = build.getNumber()
+        errors = cache.get(number, self.lintChecker)
+        if errors is not None:
+            log.msg(format="Using cached errors from build %(number)d",
+                    number=number)
+            return errors
+        errors = self.computeErrors(self.getPreviousLog(build))
+        cache.store(number, self.lintChecker, errors)
+        return errors
+
+
+    def getPreviousLog(self, build):
+        """
+        Gets the output of lint from a build of trunk.
+
+        @type build: L{BuildStatus}
+        @param build: the trunk build
+
+        @return: iterator of lines of lint output from C{build}
+        """
         for logObj in build.getLogs():
             if logObj.step.name == self.name and logObj.name == 'stdio':
-                text = logObj.getText()
-                log.msg("Found error log, returning %d bytes" % (len(text),))
-                return text
+                log.msg("Found error log")
+                return iterLogLines(logObj)
         log.msg("Did not find error log, returning empty error log")
-        return ""
+        return iter([])
+
+
+    def _getRevisionIndex(self):
+        """
+        Gets the index of trunk builds for the builder running this step.
+
+        @rtype: L{TrunkRevisionIndex}
+        """
+        return TrunkRevisionIndex.forBuilder(self.build.build_status.getBuilder())
+
+
+    def _getBaselineCache(self):
+        """
+        Gets the cache of trunk errors for the builder running this step.
+
+        @rtype: L{LintBaselineCache}
+        """
+        return LintBaselineCache.forBuilder(self.build.build_status.getBuilder())
+
+
+    def _recordTrunkBuild(self, currentErrors):
+        """
+        If this is a build of trunk, record it in the trunk build index and
+        cache its errors, so that later branch builds can find them without
+        searching or parsing.
+
+        @param currentErrors: errors reported by this build
+        """
+        if self.getProperty('branch'):
+            return
+        revision = self.getProperty('got_revision')
+        if revision:
+            number = self.build.build_status.getNumber()
+            self._getRevisionIndex().record(revision, number)
+            self._getBaselineCache().store(number, self.lintChecker, currentErrors)
+
+
+    def _getIndexedBuild(self, builder, index, targetRevision):
+        """
+        Gets the trunk build of C{targetRevision} recorded in C{index}.
+
+        @return: the build, or C{None} if it is not indexed, or the index entry
+            is stale.
+        @rtype: L{BuildStatus}
+        """
+        number = index.get(targetRevision)
+        if number is None:
+            return None
+        build = builder.getBuild(number)
+        if (build is None or build.getProperty("branch")
+                or build.getProperty('got_revision') != targetRevision):
+            log.msg(format="Ignoring stale index entry %(number)d for %(revision)s",
+                    number=number, revision=targetRevision)
+            return None
+        log.msg(format="Found build %(number)d of trunk at %(revision)s in index",
+                number=number, revision=targetRevision)
+        return build
 
 
     def _getLastBuild(self):
         """
         Gets the L{BuildStatus} object of the most recent build of trunk.
 
+        The trunk build index is consulted first; if it has no usable entry for
+        C{lint_revision}, the most recent builds are searched instead.
+
         @return: most recent build of trunk
         @rtype: L{BuildStatus}
         """
@@ -119,6 +416,11 @@ class LintStep(ShellCommand):
         targetRevision = self.getProperty('lint_revision')
         log.msg(format='Looking for build of %(revision)s', revision=targetRevision)
 
+        index = self._getRevisionIndex()
+        build = self._getIndexedBuild(builder, index, targetRevision)
+        if build is not None:
+            return build
+
         count = 0
         lastTrunkBuild = None
         while count < 200 and number > 0:
@@ -133,6 +435,7 @@ class LintStep(ShellCommand):
                 if revision == targetRevision:
                     log.msg(format="Found build %(number)d of trunk at %(revision)s",
                             number=number, revision=revision)
+                    index.record(revision, number)
                     return build
                 else:
                     log.msg(format="skipping build %(number)d of trunk at %(revision)s",
@@ -181,7 +484,7 @@ class CheckDocumentation(LintStep):
     @staticmethod
     def computeErrors(logText):
         errors = {}
-        for line in StringIO.StringIO(logText):
+        for line in _iterLines(logText):
             try:
                 # Mostly get rid of the trailing \n
                 line = line.strip()
@@ -217,19 +520,60 @@ class CheckDocumentation(LintStep):
         return ShellCommand.getText(self, cmd, results)
 
 
-class TwistedCheckerError(util.FancyEqMixin, object):
+class _LintError(object):
+    """
+    Base class for the errors reported by a lint checker.
+
+    There can be tens of thousands of errors in a single log, and the current
+    and previous logs are held at once, so instances have no C{__dict__}, and
+    their fields are interned: the fields of the same error in both logs are
+    then shared rather than duplicated.
+
+    Errors are equal when all of their C{compareAttributes} are equal.
+    """
+    __slots__ = ()
+    compareAttributes = ()
+
+    def __eq__(self, other):
+        if isinstance(self, other.__class__):
+            return (
+                [getattr(self, name) for name in self.compareAttributes] ==
+                [getattr(other, name) for name in self.compareAttributes])
+        return NotImplemented
+
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+
+    def __getstate__(self):
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # Pickled before the errors had slots, by an older
+            # LintBaselineCache.
+            state = [state[name] for name in self.__slots__]
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, intern(value))
+
+
+
+class TwistedCheckerError(_LintError):
+    __slots__ = ('msg', 'type', 'line', 'indent', 'text')
     regex = re.compile(r"^(?P<type>[WCEFR]\d{4}):(?P<line>\s*\d+),(?P<indent>\d+):(?P<text>.*)")
     compareAttributes = ('type', 'text')
 
     def __init__(self, msg):
-        self.msg = msg
+        self.msg = intern(msg)
         m = self.regex.match(msg)
         if m:
-            d = m.groupdict()
-            self.type = d['type']
-            self.line = d['line']
-            self.indent = d['indent']
-            self.text = d['text']
+            self.type, self.line, self.indent, self.text = map(
+                intern, m.group('type', 'line', 'indent', 'text'))
         else:
             self.type = "UXXXX"
             self.line = "9999"
@@ -290,7 +634,7 @@ class CheckCodesByTwistedChecker(LintStep):
         warnings = {}
         currentModule = None
         warningsCurrentModule = []
-        for line in StringIO.StringIO(logText):
+        for line in _iterLines(logText):
             # Mostly get rid of the trailing \n
             line = line.strip("\n")
             if line.startswith(cls.prefixModuleName):
@@ -298,7 +642,7 @@ class CheckCodesByTwistedChecker(LintStep):
                 if currentModule:
                     warnings[currentModule] = set(map(TwistedCheckerError, warningsCurrentModule))
                 # Initial results for current module
-                moduleName = line.replace(cls.prefixModuleName, "")
+                moduleName = intern(line.replace(cls.prefixModuleName, ""))
                 currentModule = moduleName
                 warningsCurrentModule = []
             elif re.search(cls.regexLineStart, line):
@@ -314,6 +658,23 @@ class CheckCodesByTwistedChecker(LintStep):
         return warnings
 
 
+    def getIncrementalCommand(self, paths):
+        """
+        Check the modules in C{paths} with L{ShardedTwistedChecker}'s script
+        in a single shard, which skips files that are not part of a package,
+        as checking the whole package does.
+        """
+        return ShardedTwistedChecker.shardCommand(paths, 1)
+
+
+    def mergeErrors(self, baselineErrors, paths, errors):
+        merged = dict(baselineErrors)
+        for path in paths:
+            merged.pop(_moduleName(path), None)
+        merged.update(errors)
+        return merged
+
+
     @classmethod
     def formatErrors(cls, newErrors):
         allNewErrors = []
@@ -322,9 +683,8 @@ class CheckCodesByTwistedChecker(LintStep):
             allNewErrors.extend(sorted(newErrors[modulename]))
         return map(str, allNewErrors)
 
-    def processLogs(self, oldText, newText):
-        self.currentErrors = self.computeErrors(newText)
-        previousErrors = self.computeErrors(oldText)
+    def processErrors(self, previousErrors, currentErrors):
+        self.currentErrors = currentErrors
 
         newErrors = self.computeDifference(self.currentErrors, previousErrors)
 
@@ -340,15 +700,116 @@ class CheckCodesByTwistedChecker(LintStep):
         return bool(newErrors)
 
 
-class PyFlakesError(util.FancyEqMixin, object):
+class ShardedTwistedChecker(CheckCodesByTwistedChecker):
+    """
+    Run TwistedChecker over source codes as several concurrent processes,
+    each checking a share of the modules.
+
+    The modules of the package are split into shards of about the same total
+    size, and the output of each shard is written out in turn once they have
+    all finished, so the log has the same format as a single TwistedChecker
+    run.  Checks which compare modules with each other only see the modules
+    in the same shard.
+
+    The script run on the slave takes the packages or modules to check,
+    followed by the number of shards.  Paths of source files may be given
+    instead of module names; files which are missing, or are not part of a
+    package, are skipped.
+
+    @ivar shards: the number of TwistedChecker processes to run.
+    """
+    source = (
+        "import os, subprocess, sys, tempfile\n"
+        "targets, count = sys.argv[1:-1], int(sys.argv[-1])\n"
+        "def moduleName(path):\n"
+        "    name = os.path.splitext(path)[0].replace(os.sep, '.')\n"
+        "    if name.endswith('.__init__'):\n"
+        "        name = name[:-len('.__init__')]\n"
+        "    return name\n"
+        "modules = []\n"
+        "for target in targets:\n"
+        "    if target.endswith('.py'):\n"
+        "        path = target.replace('/', os.sep)\n"
+        "        found = os.path.isfile(path)\n"
+        "        dirpath = os.path.dirname(path)\n"
+        "        while found and dirpath:\n"
+        "            found = os.path.isfile(os.path.join(dirpath, '__init__.py'))\n"
+        "            dirpath = os.path.dirname(dirpath)\n"
+        "        if found:\n"
+        "            modules.append((os.path.getsize(path), moduleName(path)))\n"
+        "        continue\n"
+        "    found = []\n"
+        "    for dirpath, dirnames, filenames in os.walk(target.replace('.', os.sep)):\n"
+        "        if '__init__.py' not in filenames:\n"
+        "            dirnames[:] = []\n"
+        "            continue\n"
+        "        for filename in filenames:\n"
+        "            if filename.endswith('.py'):\n"
+        "                path = os.path.join(dirpath, filename)\n"
+        "                found.append((os.path.getsize(path), moduleName(path)))\n"
+        "    modules.extend(found or [(0, target)])\n"
+        "shards = [[0, []] for i in range(count)]\n"
+        "for size, name in sorted(modules, reverse=True):\n"
+        "    shard = min(shards, key=lambda shard: shard[0])\n"
+        "    shard[0] += size\n"
+        "    shard[1].append(name)\n"
+        "processes = []\n"
+        "for size, names in shards:\n"
+        "    if names:\n"
+        "        output = tempfile.TemporaryFile()\n"
+        "        processes.append((subprocess.Popen(\n"
+        "            ['twistedchecker'] + sorted(names), stdout=output), output))\n"
+        "stdout = getattr(sys.stdout, 'buffer', sys.stdout)\n"
+        "rc = 0\n"
+        "for process, output in processes:\n"
+        "    rc = max(rc, process.wait())\n"
+        "    output.seek(0)\n"
+        "    for chunk in iter(lambda: output.read(65536), b''):\n"
+        "        stdout.write(chunk)\n"
+        "    stdout.flush()\n"
+        "sys.exit(rc)\n")
+
+    def __init__(self, shards=4, **kwargs):
+        CheckCodesByTwistedChecker.__init__(self, **kwargs)
+        self.addFactoryArguments(shards=shards)
+        self.shards = shards
+        self.command = self.shardCommand(
+            [Property('test-case-name', default='twisted')], shards)
+
+
+    @classmethod
+    def shardCommand(cls, targets, shards):
+        """
+        Get the command checking C{targets} in C{shards} concurrent processes.
+
+        @param targets: the names of packages or modules, or the paths of
+            source files, to check
+        @type targets: L{list}
+
+        @type shards: L{int}
+        """
+        return [
+            'python', '-c',
+            'from binascii import unhexlify; exec(unhexlify(b"%s"))' % (
+                hexlify(cls.source),),
+            ] + targets + [str(shards)]
+
+
+    def getIncrementalCommand(self, paths):
+        return self.shardCommand(paths, self.shards)
+
+
+
+class PyFlakesError(_LintError):
+    __slots__ = ('msg', 'file', 'line', 'text')
     regex = re.compile(r"^(?P<file>[^:]*):(?P<line>\d+): (?P<text>.*)")
     compareAttributes = ('file', 'text')
 
     def __init__(self, msg, file, line, text):
-        self.msg = msg
-        self.file = file
-        self.line = line
-        self.text = text
+        self.msg = intern(msg)
+        self.file = intern(file)
+        self.line = intern(line)
+        self.text = intern(text)
 
     @classmethod
     def fromLine(cls, msg):
@@ -388,7 +849,7 @@ class PyFlakes(LintStep):
     @classmethod
     def computeErrors(cls, logText):
         warnings = set() 
-        for line in StringIO.StringIO(logText):
+        for line in _iterLines(logText):
             # Mostly get rid of the trailing \n
             line = line.strip("\n")
             error = PyFlakesError.fromLine(line)
@@ -401,6 +862,18 @@ class PyFlakes(LintStep):
     def formatErrors(cls, newErrors):
         return map(str, sorted(newErrors['pyflakes']))
 
+
+    def getIncrementalCommand(self, paths):
+        return ['pyflakes'] + paths
+
+
+    def mergeErrors(self, baselineErrors, paths, errors):
+        paths = set(paths)
+        merged = set([error for error in baselineErrors.get('pyflakes', ())
+                      if error.file not in paths])
+        merged.update(errors.get('pyflakes', ()))
+        return {'pyflakes': merged}
+
     def evaluateCommand(self, cmd):
         if self.worse:
             return WARNINGS
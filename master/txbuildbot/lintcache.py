@@ -0,0 +1,183 @@
+"""
+Persistent per-builder state used by L{txbuildbot.lint.LintStep} to find and
+reuse the results of trunk lint runs.
+
+Both are kept in the builder's status directory, next to the pickled builds.
+"""
+
+import json
+import zlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from twisted.python import log
+from twisted.python.filepath import FilePath
+
+
+
+class TrunkRevisionIndex(object):
+    """
+    A persistent mapping from the C{got_revision} of trunk builds to their
+    build numbers, for a single builder.
+
+    The index is stored as JSON next to the builder's pickled builds, so
+    finding the build for a given trunk revision does not require loading
+    every recent build from disk.  Entries are only hints: callers must
+    check that the build they refer to still exists and still matches.
+
+    @ivar path: L{FilePath} of the JSON file holding the index.
+    @ivar maxEntries: the number of most recent revisions to remember.
+    """
+    filename = 'trunk-revisions.json'
+    maxEntries = 1000
+
+    def __init__(self, path):
+        self.path = path
+
+
+    @classmethod
+    def forBuilder(cls, builderStatus):
+        """
+        Get the index for the builder whose status is C{builderStatus}.
+
+        @type builderStatus: L{buildbot.status.builder.BuilderStatus}
+        """
+        return cls(FilePath(builderStatus.basedir).child(cls.filename))
+
+
+    def _load(self):
+        """
+        Read the index from disk.
+
+        @return: L{dict} mapping revisions to build numbers; empty if the index
+            is missing or unreadable.
+        """
+        if not self.path.exists():
+            return {}
+        try:
+            return dict(json.loads(self.path.getContent()))
+        except (IOError, ValueError, TypeError):
+            log.msg(format="Ignoring unreadable trunk revision index %(path)s",
+                    path=self.path.path)
+            return {}
+
+
+    def get(self, revision):
+        """
+        Look up the build number recorded for C{revision}.
+
+        @type revision: L{str}
+        @return: the build number, or C{None} if C{revision} is not indexed.
+        """
+        if not revision:
+            return None
+        return self._load().get(revision)
+
+
+    def record(self, revision, number):
+        """
+        Remember that build C{number} was a trunk build of C{revision}.
+
+        If the index grows beyond C{maxEntries}, the oldest builds are
+        forgotten.
+
+        @type revision: L{str}
+        @type number: L{int}
+        """
+        if not revision:
+            return
+        index = self._load()
+        if index.get(revision) == number:
+            return
+        index[revision] = number
+        if len(index) > self.maxEntries:
+            newest = sorted(index.items(), key=lambda item: item[1])
+            index = dict(newest[-self.maxEntries:])
+        self.path.setContent(json.dumps(index))
+
+
+
+class LintBaselineCache(object):
+    """
+    A cache of the errors parsed from the output of trunk lint runs, for a
+    single builder.
+
+    Each entry is the L{dict} of L{set}s returned by
+    L{txbuildbot.lint.LintStep.computeErrors}, pickled and compressed into its
+    own file named after the lint checker and the build number.  Reading an
+    entry marks it as recently used; when more than C{maxEntries} entries are
+    stored, the least recently used ones are removed.
+
+    @ivar path: L{FilePath} of the directory holding the entries.
+    @ivar maxEntries: the number of entries to keep.
+    """
+    dirname = 'lint-baselines'
+    maxEntries = 20
+
+    def __init__(self, path):
+        self.path = path
+
+
+    @classmethod
+    def forBuilder(cls, builderStatus):
+        """
+        Get the cache for the builder whose status is C{builderStatus}.
+
+        @type builderStatus: L{buildbot.status.builder.BuilderStatus}
+        """
+        return cls(FilePath(builderStatus.basedir).child(cls.dirname))
+
+
+    def _entry(self, number, lintChecker):
+        return self.path.child('%s-%d' % (lintChecker, number))
+
+
+    def get(self, number, lintChecker):
+        """
+        Get the errors found by C{lintChecker} in build C{number}.
+
+        @type number: L{int}
+        @type lintChecker: L{str}
+        @return: L{dict} of L{set}s of errors, or C{None} if they are not
+            cached.
+        """
+        entry = self._entry(number, lintChecker)
+        try:
+            data = entry.getContent()
+        except (IOError, OSError):
+            return None
+        try:
+            errors = pickle.loads(zlib.decompress(data))
+        except Exception:
+            log.msg(format="Ignoring unreadable lint baseline %(path)s",
+                    path=entry.path)
+            return None
+        try:
+            entry.touch()
+        except (IOError, OSError):
+            pass
+        return errors
+
+
+    def store(self, number, lintChecker, errors):
+        """
+        Remember the errors found by C{lintChecker} in build C{number}, and
+        evict the least recently used entries.
+
+        @type number: L{int}
+        @type lintChecker: L{str}
+        @type errors: L{dict} of L{set}s
+        """
+        if not self.path.isdir():
+            self.path.makedirs()
+        data = zlib.compress(pickle.dumps(errors, pickle.HIGHEST_PROTOCOL))
+        self._entry(number, lintChecker).setContent(data)
+
+        entries = [child for child in self.path.children()
+                   if not child.basename().endswith('.new')]
+        entries.sort(key=lambda child: child.getModificationTime())
+        for child in entries[:-self.maxEntries]:
+            log.msg(format="Evicting lint baseline %(path)s", path=child.path)
+            child.remove()
@@ -1,8 +1,47 @@
 """
 Steps for translating PyPy.
+
+Translating PyPy takes hours, so the files translated are kept in a cache
+on the master, keyed by the revision and the arguments they were translated
+from, and the builds of the same revision with the same arguments download
+them rather than translate them again.
 """
 
+import hashlib
+import json
+import os
+import shutil
+
+from buildbot.process import buildstep
 from buildbot.steps.shell import ShellCommand
+from buildbot.steps.transfer import FileDownload, FileUpload
+from buildbot.status.results import SKIPPED, FAILURE
+
+from twisted.python import log
+
+# The build property set when the translated files were downloaded from the
+# master's cache.
+CACHED_PROPERTY = 'translation-cached'
+
+
+def translationKey(revision, translationArgs, targetArgs):
+    """
+    Get the key the files translated from a revision with some arguments are
+    cached under.
+    """
+    return hashlib.sha1(json.dumps(
+        [revision, list(translationArgs), list(targetArgs)])).hexdigest()
+
+
+def translationNeeded(step):
+    """
+    Are the translated files of the build not in the master's cache?
+
+    This is suitable for the C{doStepIf} of the steps translating PyPy and
+    storing the translated files in the cache.
+    """
+    return not step.getProperty(CACHED_PROPERTY, False)
+
 
 class Translate(ShellCommand):
     name = "translate"
@@ -18,3 +57,166 @@ class Translate(ShellCommand):
                  *a, **kw):
         self.command = self.command + translationArgs + [self.translationTarget] + targetArgs
         ShellCommand.__init__(self, workdir, *a, **kw)
+
+
+class _TranslationTransfer:
+    """
+    Mixin for the steps transferring the files translated between the slave
+    and the master's cache.
+
+    The binary and the libraries it was linked with are transferred together,
+    as an archive packed and unpacked in the working directory of the step on
+    the slave.
+
+    @ivar cache: the directory of the master holding the translated archives,
+        each in a directory named after its key.  Downloading an archive marks
+        it as recently used.
+
+    @cvar binary: the name of the translated binary.
+    @cvar libraries: the names of the libraries translated along with the
+        binary, which are only there for some translation arguments.
+    @cvar archive: the name of the archive of the translated files.
+    """
+    binary = "pypy-c"
+    libraries = ["libpypy-c.so"]
+    archive = "pypy-c.tar.gz"
+
+    def cachedArchive(self):
+        """
+        Get the path on the master of the archive of the build.
+        """
+        key = translationKey(self.getProperty('got_revision'),
+                             self.translationArgs, self.targetArgs)
+        return os.path.join(self.cache, key, self.archive)
+
+
+    def packCommand(self):
+        """
+        Get the command archiving the binary and the libraries which exist.
+        """
+        return ["sh", "-c", "tar czf %s %s $(ls %s 2>/dev/null)" % (
+            self.archive, self.binary, " ".join(self.libraries))]
+
+
+    def unpackCommand(self):
+        """
+        Get the command extracting the files of the archive.
+        """
+        return ["tar", "xzf", self.archive]
+
+
+class DownloadTranslation(_TranslationTransfer, FileDownload):
+    """
+    Download the files translated from the revision being built with the
+    same arguments from the master's cache, if they are there, unpack them,
+    and set the build property named by L{CACHED_PROPERTY}.
+    """
+    name = "download-translation"
+
+    def __init__(self, translationArgs, targetArgs,
+                 cache="pypy-translations", mastersrc=None,
+                 slavedest=_TranslationTransfer.archive,
+                 workdir="build/pypy/goal", **kw):
+        FileDownload.__init__(self, mastersrc=mastersrc, slavedest=slavedest,
+                              workdir=workdir, **kw)
+        self.addFactoryArguments(translationArgs=translationArgs,
+                                 targetArgs=targetArgs, cache=cache)
+        self.translationArgs = translationArgs
+        self.targetArgs = targetArgs
+        self.cache = cache
+
+
+    def start(self):
+        self.mastersrc = self.cachedArchive()
+        if not os.path.exists(self.mastersrc):
+            return SKIPPED
+        try:
+            os.utime(self.mastersrc, None)
+        except OSError:
+            pass
+        return FileDownload.start(self)
+
+
+    def finished(self, result):
+        if result == SKIPPED or self.cmd.rc not in (None, 0):
+            return FileDownload.finished(self, result)
+        cmd = buildstep.RemoteShellCommand(self.workdir, self.unpackCommand())
+        d = self.runCommand(cmd)
+        def unpacked(ignored):
+            if cmd.rc != 0:
+                self.step_status.setText(["could", "not", "unpack",
+                                          self.archive])
+                return buildstep.BuildStep.finished(self, FAILURE)
+            self.setProperty(CACHED_PROPERTY, True, "DownloadTranslation")
+            return FileDownload.finished(self, result)
+        d.addCallback(unpacked)
+        return d
+
+
+class UploadTranslation(_TranslationTransfer, FileUpload):
+    """
+    Pack the files translated by the build, store them in the master's
+    cache, and remove the least recently used archives beyond
+    C{maxEntries}.
+    """
+    name = "upload-translation"
+    flunkOnFailure = False
+    warnOnFailure = True
+
+    def __init__(self, translationArgs, targetArgs,
+                 cache="pypy-translations", maxEntries=5,
+                 slavesrc=_TranslationTransfer.archive, masterdest=None,
+                 workdir="build/pypy/goal", **kw):
+        kw.setdefault('doStepIf', translationNeeded)
+        FileUpload.__init__(self, slavesrc=slavesrc, masterdest=masterdest,
+                            workdir=workdir, **kw)
+        self.addFactoryArguments(translationArgs=translationArgs,
+                                 targetArgs=targetArgs, cache=cache,
+                                 maxEntries=maxEntries)
+        self.translationArgs = translationArgs
+        self.targetArgs = targetArgs
+        self.cache = cache
+        self.maxEntries = maxEntries
+
+
+    def start(self):
+        # The upload is written to a temporary file which replaces the
+        # archive once it is complete, so a failed upload is never cached.
+        self.masterdest = self.cachedArchive()
+        cmd = buildstep.RemoteShellCommand(self.workdir, self.packCommand())
+        d = self.runCommand(cmd)
+        def packed(ignored):
+            if cmd.rc != 0:
+                self.step_status.setText(["could", "not", "pack",
+                                          self.archive])
+                # FileUpload.finished expects the upload command.
+                return buildstep.BuildStep.finished(self, FAILURE)
+            return FileUpload.start(self)
+        d.addCallback(packed)
+        d.addErrback(self.failed)
+
+
+    def finished(self, result):
+        if result != SKIPPED and self.cmd.rc in (None, 0):
+            self.evict()
+        return FileUpload.finished(self, result)
+
+
+    def evict(self):
+        """
+        Remove the least recently used archives, so only C{maxEntries} are
+        kept.
+        """
+        entries = []
+        for key in os.listdir(self.cache):
+            path = os.path.join(self.cache, key)
+            archive = os.path.join(path, self.archive)
+            if os.path.exists(archive):
+                used = os.path.getmtime(archive)
+            else:
+                used = os.path.getmtime(path)
+            entries.append((used, path))
+        entries.sort()
+        for used, path in entries[:-self.maxEntries]:
+            log.msg(format="Evicting the translation %(path)s", path=path)
+            shutil.rmtree(path, ignore_errors=True)
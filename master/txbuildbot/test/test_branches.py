@@ -0,0 +1,59 @@
+from twisted.trial.unittest import TestCase
+
+from txbuildbot import branches
+from txbuildbot.branches import BranchInfo, branchInfo
+
+
+
+class BranchInfoTests(TestCase):
+    """
+    Tests for L{BranchInfo} and L{branchInfo}.
+    """
+
+    def test_svnPrefix(self):
+        """
+        The svn prefix is cut off the name, and kept.
+        """
+        for branch, name, prefix in [
+                ('/branches/destroy-the-sun-5000', 'destroy-the-sun-5000',
+                 '/branches/'),
+                ('branches/destroy-the-sun-5000', 'destroy-the-sun-5000',
+                 'branches/'),
+                ('/trunk', 'trunk', '/'),
+                ('destroy-the-sun-5000', 'destroy-the-sun-5000', '')]:
+            info = BranchInfo(branch)
+            self.assertEqual((info.branch, info.name, info.svnPrefix),
+                             (branch, name, prefix))
+
+
+    def test_trunk(self):
+        """
+        The default branch is trunk, however it is named.
+        """
+        for branch in [None, '', 'trunk', '/trunk', '/branches/trunk']:
+            info = BranchInfo(branch)
+            self.assertTrue(info.isTrunk)
+            self.assertFalse(info.isRelease)
+            self.assertEqual(info.name, 'trunk')
+
+
+    def test_release(self):
+        info = BranchInfo('/branches/releases/release-23.2-12345')
+        self.assertTrue(info.isRelease)
+        self.assertFalse(info.isTrunk)
+        self.assertFalse(BranchInfo('release-23.2-12345').isRelease)
+
+
+    def test_cached(self):
+        """
+        The same L{BranchInfo} is returned for the same name, until the cache
+        is full.
+        """
+        self.patch(branches, '_cache', {})
+        self.patch(branches, 'maxCacheSize', 2)
+        info = branchInfo('/branches/destroy-the-sun-5000')
+        self.assertIdentical(branchInfo('/branches/destroy-the-sun-5000'),
+                             info)
+        branchInfo('trunk')
+        branchInfo(None)
+        self.assertEqual(branches._cache.keys(), [None])
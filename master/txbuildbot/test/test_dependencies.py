@@ -0,0 +1,249 @@
+import hashlib
+import os
+import subprocess
+import sys
+import tarfile
+
+from twisted.trial import unittest
+from buildbot.status.results import SUCCESS, FAILURE
+from buildbot.test.util.steps import BuildStepMixin
+from buildbot.test.fake.remotecommand import ExpectShell
+
+from txbuildbot.dependencies import (
+    DownloadDependency, InstallDependency, dependencyProperty)
+
+
+
+class InstallDependencyScriptTests(unittest.TestCase):
+    """
+    Tests for the script run on the slave by L{InstallDependency}.
+    """
+
+    # Stands in for the setup.py of a dependency: it installs a module in the
+    # prefix, and counts the installations.
+    fakeSetup = (
+        "import os, sys\n"
+        "prefix = sys.argv[sys.argv.index('--prefix') + 1]\n"
+        "open(os.path.join(prefix, '..', 'installs'), 'a').write('x')\n"
+        "lib = os.path.join(prefix, 'lib')\n"
+        "if not os.path.isdir(lib):\n"
+        "    os.makedirs(lib)\n"
+        "open(os.path.join(lib, 'dep.py'), 'w').write('%s')\n")
+
+    def setUp(self):
+        self.root = os.path.abspath(self.mktemp())
+        # The build directory of the slaves is a symlink, from which ..
+        # does not lead back to the builder's directory.
+        self.build = os.path.join(self.root, 'build')
+        target = os.path.join(self.root, 'checkouts', 'build')
+        os.makedirs(os.path.join(target, 'install', 'bin'))
+        os.symlink(target, self.build)
+        open(os.path.join(self.build, 'install', 'bin', 'python'), 'w').close()
+        self.tarballs = os.path.join(self.root, 'dependencies')
+        os.makedirs(self.tarballs)
+
+
+    def makeTarball(self, checksum, version):
+        source = os.path.join(self.root, 'source', 'dep-1')
+        if not os.path.isdir(source):
+            os.makedirs(source)
+        open(os.path.join(source, 'setup.py'), 'w').write(
+            self.fakeSetup % (version,))
+        path = os.path.join(self.tarballs, checksum + '-dep-1.tar.gz')
+        tarball = tarfile.open(path, 'w:gz')
+        tarball.add(source, 'dep-1')
+        tarball.close()
+        return os.path.join('dependencies', checksum + '-dep-1.tar.gz')
+
+
+    def install(self, tarball, buildId='r1'):
+        process = subprocess.Popen(
+            [sys.executable, '-c', InstallDependency.source,
+             tarball, 'dep-1', 'build', 'build/install', buildId,
+             'dependencies/installed', '3'],
+            cwd=self.root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0, stderr)
+        return stdout
+
+
+    def installs(self):
+        return len(open(os.path.join(self.build, 'installs')).read())
+
+
+    def installed(self):
+        return open(
+            os.path.join(self.build, 'install', 'lib', 'dep.py')).read()
+
+
+    def removeInstall(self):
+        """
+        Remove the installation prefix, as a fresh build of the interpreter
+        would.
+        """
+        os.remove(os.path.join(self.build, 'install', 'lib', 'dep.py'))
+
+
+    def test_restore(self):
+        """
+        The files installed are archived, and restored by the next builds of
+        the same interpreter with the same tarball.
+        """
+        tarball = self.makeTarball('aaaa', 'v1')
+        self.assertIn('Archived the installation', self.install(tarball))
+        self.removeInstall()
+        self.assertIn('Restored dep-1', self.install(tarball))
+        self.assertEqual(self.installed(), 'v1')
+        self.assertEqual(self.installs(), 1)
+        archive = tarfile.open(os.path.join(
+            self.tarballs, 'installed', os.listdir(
+                os.path.join(self.tarballs, 'installed'))[0]))
+        self.assertEqual(archive.getnames(), ['lib/dep.py'])
+
+
+    def test_changedTarball(self):
+        """
+        A dependency is installed again when its tarball changed, and the
+        previous tarball is removed.
+        """
+        self.install(self.makeTarball('aaaa', 'v1'))
+        self.install(self.makeTarball('bbbb', 'v2'))
+        self.assertEqual(self.installed(), 'v2')
+        self.assertEqual(self.installs(), 2)
+        self.assertEqual(sorted(os.listdir(self.tarballs)),
+                         ['bbbb-dep-1.tar.gz', 'installed'])
+
+
+    def test_changedInterpreter(self):
+        """
+        A dependency is installed again by another build of the interpreter.
+        """
+        tarball = self.makeTarball('aaaa', 'v1')
+        self.install(tarball, 'r1')
+        self.removeInstall()
+        self.install(tarball, 'r2')
+        self.assertEqual(self.installs(), 2)
+
+
+    def test_evict(self):
+        """
+        Only the most recently used archives of a dependency are kept.
+        """
+        tarball = self.makeTarball('aaaa', 'v1')
+        for buildId in ['r1', 'r2', 'r3', 'r4']:
+            self.install(tarball, buildId)
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.tarballs, 'installed'))), 3)
+
+
+
+class DownloadDependencyTests(BuildStepMixin, unittest.TestCase):
+    """
+    Tests for L{DownloadDependency}.
+    """
+
+    setUp = BuildStepMixin.setUpBuildStep
+    tearDown = BuildStepMixin.tearDownBuildStep
+
+    def setupDownload(self, content):
+        self.setupStep(DownloadDependency(basename='dep-1'))
+        self.step.mastersrc = os.path.abspath(self.mktemp())
+        if content is not None:
+            open(self.step.mastersrc, 'wb').write(content)
+
+
+    def test_cached(self):
+        """
+        The tarball is stored under its checksum, and is not sent down when
+        the slave has it already.
+        """
+        self.setupDownload('tarball')
+        slavedest = 'dependencies/%s-dep-1.tar.gz' % (
+            hashlib.sha1('tarball').hexdigest()[:16],)
+        self.expectCommands(
+            ExpectShell(workdir='.', command=[
+                'python', '-c', self.step.checkCommand()[2], slavedest,
+                hashlib.sha1('tarball').hexdigest()])
+            + 0)
+        self.expectOutcome(result=SUCCESS, status_text=['cached', 'dep-1'])
+        self.expectProperty(dependencyProperty('dep-1'), slavedest)
+        return self.runStep()
+
+
+    def test_checkTarball(self):
+        """
+        The slave's tarball is only used if it has the checksum of the
+        master's.
+        """
+        tarball = self.mktemp()
+        open(tarball, 'wb').write('tarball')
+        checksum = hashlib.sha1('tarball').hexdigest()
+        check = lambda: subprocess.call(
+            [sys.executable, '-c', DownloadDependency.checkSource, tarball,
+             checksum])
+        self.assertEqual(check(), 0)
+        open(tarball, 'wb').write('tarb')
+        self.assertEqual(check(), 1)
+        os.remove(tarball)
+        self.assertEqual(check(), 1)
+
+
+    def test_checksumCached(self):
+        """
+        The checksum of the master's tarball is only computed again once its
+        size or modification time changed.
+        """
+        self.setupDownload('tarball')
+        self.assertEqual(self.step.checksum(),
+                         hashlib.sha1('tarball').hexdigest())
+        open(self.step.mastersrc, 'wb').write('TARBALL')
+        os.utime(self.step.mastersrc, (0, 0))
+        self.assertEqual(self.step.checksum(),
+                         hashlib.sha1('TARBALL').hexdigest())
+        open(self.step.mastersrc, 'wb').write('tarball')
+        os.utime(self.step.mastersrc, (0, 0))
+        self.assertEqual(self.step.checksum(),
+                         hashlib.sha1('TARBALL').hexdigest())
+
+
+    def test_stepFactory(self):
+        """
+        The step is created again from the arguments it records.
+        """
+        step = DownloadDependency(basename='dep-1', directory='tarballs')
+        stepClass, kwargs = step.getStepFactory()
+        copy = stepClass(**kwargs)
+        self.assertEqual(
+            (copy.basename, copy.directory, copy.mastersrc, copy.workdir),
+            ('dep-1', 'tarballs', 'dependencies/dep-1.tar.gz', '.'))
+
+
+    def test_missing(self):
+        """
+        The step fails if the master does not have the tarball.
+        """
+        self.setupDownload(None)
+        self.expectOutcome(result=FAILURE,
+                           status_text=['downloading', 'to', 'dep-1.tar.gz'])
+        return self.runStep()
+
+
+
+class InstallDependencyTests(unittest.TestCase):
+    """
+    Tests for L{InstallDependency}.
+    """
+
+    def test_command(self):
+        """
+        The paths are relative to the builder's directory.
+        """
+        step = InstallDependency(python='build/install/bin/python',
+                                 basename='dep-1', prefix='build/install',
+                                 buildId='r1')
+        self.assertEqual(step.remote_kwargs['workdir'], '.')
+        self.assertEqual(step.command[:2], ['build/install/bin/python', '-c'])
+        self.assertEqual(step.command[4:], [
+            'dep-1', 'build', 'build/install', 'r1', 'dependencies/installed',
+            '3'])
+        self.assertEqual(step.command[3].fmtstring, '%(dependency-dep-1)s')
@@ -0,0 +1,182 @@
+import os
+import subprocess
+import sys
+
+from twisted.trial import unittest
+
+from txbuildbot.extcache import CachedBuildExt
+
+
+
+class CachedBuildExtScriptTests(unittest.TestCase):
+    """
+    Tests for the script run on the slave by L{CachedBuildExt}.
+    """
+
+    # Stands in for setup.py build_ext -i: it "compiles" each C source into
+    # an extension module, and counts the builds.
+    fakeSetup = (
+        "import os, sys\n"
+        "open('builds', 'a').write('x')\n"
+        "if os.path.exists('fail'):\n"
+        "    sys.exit(3)\n"
+        "for name in os.listdir('twisted'):\n"
+        "    if name.endswith('.c'):\n"
+        "        source = open(os.path.join('twisted', name)).read()\n"
+        "        open(os.path.join('twisted', name[:-2] + '.so'), 'w').write(\n"
+        "            'compiled ' + source)\n")
+
+    def setUp(self):
+        self.tree = os.path.abspath(self.mktemp())
+        os.makedirs(os.path.join(self.tree, 'twisted'))
+        open(os.path.join(self.tree, 'setup.py'), 'w').write(self.fakeSetup)
+        self.write('a.c', 'a')
+
+
+    def write(self, name, content):
+        open(os.path.join(self.tree, 'twisted', name), 'w').write(content)
+
+
+    def read(self, name):
+        return open(os.path.join(self.tree, 'twisted', name)).read()
+
+
+    def build(self, maxEntries=10):
+        process = subprocess.Popen(
+            [sys.executable, '-c', CachedBuildExt.source,
+             '../build_ext-cache', str(maxEntries)]
+            + list(CachedBuildExt.setupFiles) + ['--',
+             sys.executable, 'setup.py', 'build_ext', '-i'],
+            cwd=self.tree, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        return process.returncode, stdout
+
+
+    def builds(self):
+        return len(open(os.path.join(self.tree, 'builds')).read())
+
+
+    def clean(self):
+        """
+        Remove the extension modules, as a fresh checkout would.
+        """
+        for name in os.listdir(os.path.join(self.tree, 'twisted')):
+            if name.endswith('.so'):
+                os.remove(os.path.join(self.tree, 'twisted', name))
+
+
+    def cached(self):
+        return os.listdir(os.path.join(self.tree, '..', 'build_ext-cache'))
+
+
+    def test_restore(self):
+        """
+        The extension modules are restored from the cache when the sources
+        did not change.
+        """
+        rc, output = self.build()
+        self.assertEqual(rc, 0)
+        self.assertIn('Building the extension modules', output)
+        self.clean()
+        rc, output = self.build()
+        self.assertEqual(rc, 0)
+        self.assertIn('Restored 1 extension modules', output)
+        self.assertEqual(self.read('a.so'), 'compiled a')
+        self.assertEqual(self.builds(), 1)
+
+
+    def test_changedSources(self):
+        """
+        The extension modules are built again when a C source, header, or
+        setup file changes.
+        """
+        self.build()
+        self.write('a.c', 'b')
+        self.build()
+        self.assertEqual(self.read('a.so'), 'compiled b')
+        self.write('a.h', 'header')
+        self.build()
+        open(os.path.join(self.tree, 'setup.py'), 'a').write('\n')
+        self.build()
+        self.assertEqual(self.builds(), 4)
+        self.write('b.py', 'python')
+        self.build()
+        self.assertEqual(self.builds(), 4)
+
+
+    def test_setupFiles(self):
+        """
+        The extension modules are built again when any of the setup files
+        given is added or changes, wherever the layout of the tree puts it.
+        """
+        self.build()
+        open(os.path.join(self.tree, 'setup.cfg'), 'w').write('[build]\n')
+        self.build()
+        self.assertEqual(self.builds(), 2)
+        setup = os.path.join(self.tree, 'src', 'twisted', 'python')
+        os.makedirs(setup)
+        open(os.path.join(setup, '_setup.py'), 'w').write('extensions = []\n')
+        self.build()
+        self.assertEqual(self.builds(), 3)
+        open(os.path.join(self.tree, 'pyproject.toml'), 'w').write('\n')
+        self.build()
+        self.assertEqual(self.builds(), 4)
+        self.clean()
+        self.build()
+        self.assertEqual(self.builds(), 4)
+
+
+    def test_failure(self):
+        """
+        A failed build is reported and not cached.
+        """
+        open(os.path.join(self.tree, 'fail'), 'w').close()
+        rc, output = self.build()
+        self.assertEqual(rc, 3)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.tree, '..', 'build_ext-cache')))
+        os.remove(os.path.join(self.tree, 'fail'))
+        self.build()
+        self.assertEqual(self.builds(), 2)
+
+
+    def test_evict(self):
+        """
+        Only the C{maxEntries} most recently used builds are kept.
+        """
+        for source in 'abc':
+            self.write('a.c', source)
+            self.build(maxEntries=2)
+        self.assertEqual(len(self.cached()), 2)
+        self.write('a.c', 'a')
+        self.build(maxEntries=2)
+        self.assertEqual(self.builds(), 4)
+
+
+
+class CachedBuildExtTests(unittest.TestCase):
+    """
+    Tests for L{CachedBuildExt}.
+    """
+
+    def test_command(self):
+        step = CachedBuildExt(
+            python=['python', '-Wall'],
+            buildCommand=['python', '-Wall', 'setup.py', 'build_ext', '-i'],
+            maxEntries=3)
+        self.assertEqual(step.command[:3], ['python', '-Wall', '-c'])
+        self.assertEqual(step.command[4:], [
+            '../build_ext-cache', '3'] + list(CachedBuildExt.setupFiles) + [
+            '--', 'python', '-Wall', 'setup.py', 'build_ext', '-i'])
+
+
+    def test_setupFiles(self):
+        """
+        The setup files hashed with the C sources can be given.
+        """
+        step = CachedBuildExt(
+            python=['python'], buildCommand=['python', 'setup.py', 'build'],
+            setupFiles=['setup.py', 'build.cfg'])
+        self.assertEqual(step.command[3:], [
+            '../build_ext-cache', '10', 'setup.py', 'build.cfg', '--',
+            'python', 'setup.py', 'build'])
@@ -1,12 +1,15 @@
+import os
+import subprocess
+
 import mock
 from twisted.trial.unittest import TestCase
 from buildbot.test.util import sourcesteps
 from buildbot.steps.source.git import Git
-from buildbot.status.results import SUCCESS
-from buildbot.test.fake.remotecommand import ExpectShell
+from buildbot.status.results import SUCCESS, FAILURE
+from buildbot.test.fake.remotecommand import Expect, ExpectShell
 
 from txbuildbot.git import (
-        TwistedGit, MergeForward,
+        TwistedGit, MergeForward, TRUNK_REF_PROPERTY,
         mungeBranch, isTrunk, isRelease)
 
 class TestTwistedGit(sourcesteps.SourceStepMixin, TestCase):
@@ -68,6 +71,322 @@ class TestTwistedGit(sourcesteps.SourceStepMixin, TestCase):
         self.assertEqual(gitStartVC[0][2], "abcdef")
 
 
+
+class TestTwistedGitReference(sourcesteps.SourceStepMixin, TestCase):
+    """
+    Tests for L{TwistedGit} with a reference repository.
+    """
+
+    reference = '../../reference.git'
+
+    def setUp(self):
+        return self.setUpSourceStep()
+
+    def tearDown(self):
+        return self.tearDownSourceStep()
+
+
+    def buildStep(self, revision=None):
+        self.setupStep(
+            TwistedGit(repourl='git://twisted', branch='trunk', mode='full',
+                       method='fresh', reference=self.reference),
+            {'branch': 'trunk', 'revision': revision})
+
+
+    def expectReferenceUpdate(self, revision=None, hasRevision=False):
+        """
+        Expect the reference repository to be initialized, with garbage
+        collection disabled, and the branch fetched into it unless it has the
+        revision.
+        """
+        git = ['git', '--git-dir', self.reference]
+        commands = [
+            ExpectShell(workdir='wkdir', command=['git', '--version'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'init', '--bare', '--quiet',
+                                 self.reference])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=git + ['config', 'gc.auto', '0'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=git + ['config', 'gc.pruneExpire', 'never'])
+            + 0]
+        if revision:
+            commands.append(
+                ExpectShell(workdir='wkdir',
+                            command=git + ['cat-file', '-e',
+                                           revision + '^{commit}'])
+                + (not hasRevision))
+        if not hasRevision:
+            commands.append(
+                ExpectShell(workdir='wkdir',
+                            command=git + ['fetch', 'git://twisted',
+                                           '+refs/heads/trunk:refs/heads/trunk'])
+                + 0)
+        return commands
+
+
+    def expectRevParse(self):
+        return (ExpectShell(workdir='wkdir', command=['git', 'rev-parse', 'HEAD'])
+                + ExpectShell.log('stdio', stdout='f' * 40 + '\n')
+                + 0)
+
+
+    def test_clone(self):
+        """
+        New checkouts are cloned with the reference repository.
+        """
+        self.buildStep()
+        self.expectCommands(*self.expectReferenceUpdate() + [
+            Expect('stat', dict(file='wkdir/.git', logEnviron=True))
+            + 1,
+            Expect('stat', dict(file='wkdir/.git', logEnviron=True))
+            + 1,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'clone', '--reference', self.reference,
+                                 '--branch', 'trunk', 'git://twisted', '.'])
+            + 0,
+            self.expectRevParse()])
+        self.expectOutcome(result=SUCCESS, status_text=['update'])
+        return self.runStep()
+
+
+    def test_existingCheckout(self):
+        """
+        Checkouts borrowing the objects of the reference repository are
+        updated, and the reference repository is not fetched into when it has
+        the revision to build.
+        """
+        self.buildStep('abcdef')
+        self.expectCommands(*self.expectReferenceUpdate('abcdef', True) + [
+            Expect('stat', dict(file='wkdir/.git', logEnviron=True))
+            + 0,
+            Expect('stat', dict(file='wkdir/.git/objects/info/alternates',
+                                logEnviron=True))
+            + 0,
+            Expect('stat', dict(file='wkdir/.git', logEnviron=True))
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'clean', '-f', '-d', '-x'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'fetch', '-t', 'git://twisted',
+                                 'trunk'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'reset', '--hard', 'abcdef'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'branch', '-M', 'trunk'])
+            + 0,
+            self.expectRevParse()])
+        self.expectOutcome(result=SUCCESS, status_text=['update'])
+        return self.runStep()
+
+
+    def test_checkoutWithoutReference(self):
+        """
+        Checkouts made without the reference repository are clobbered, and
+        cloned again with it.
+        """
+        self.buildStep('abcdef')
+        self.expectCommands(*self.expectReferenceUpdate('abcdef') + [
+            Expect('stat', dict(file='wkdir/.git', logEnviron=True))
+            + 0,
+            Expect('stat', dict(file='wkdir/.git/objects/info/alternates',
+                                logEnviron=True))
+            + 1,
+            Expect('rmdir', dict(dir='wkdir', logEnviron=True))
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'clone', '--reference', self.reference,
+                                 '--branch', 'trunk', 'git://twisted', '.'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'reset', '--hard', 'abcdef'])
+            + 0,
+            self.expectRevParse()])
+        self.expectOutcome(result=SUCCESS, status_text=['update'])
+        return self.runStep()
+
+
+class TestTwistedGitFetchTrunk(sourcesteps.SourceStepMixin, TestCase):
+    """
+    Tests for L{TwistedGit} with C{fetchTrunk}.
+    """
+
+    def setUp(self):
+        return self.setUpSourceStep()
+
+    def tearDown(self):
+        return self.tearDownSourceStep()
+
+
+    def fetchBranch(self, branch, fetchCommand):
+        self.setupStep(
+            TwistedGit(repourl='git://twisted', branch='trunk', mode='full',
+                       method='fresh', fetchTrunk=True),
+            {'branch': branch})
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', command=['git', '--version'])
+            + 0,
+            Expect('stat', dict(file='wkdir/.git', logEnviron=True))
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'clean', '-f', '-d', '-x'])
+            + 0,
+            ExpectShell(workdir='wkdir', command=fetchCommand)
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'reset', '--hard', 'FETCH_HEAD'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'branch', '-M', mungeBranch(branch)])
+            + 0,
+            ExpectShell(workdir='wkdir', command=['git', 'rev-parse', 'HEAD'])
+            + ExpectShell.log('stdio', stdout='f' * 40 + '\n')
+            + 0)
+        self.expectOutcome(result=SUCCESS, status_text=['update'])
+
+
+    def test_branch(self):
+        """
+        Trunk is fetched along with a branch, and the ref it is fetched to is
+        set as a build property.
+        """
+        self.fetchBranch('/branches/destroy-the-sun-5000',
+                         ['git', 'fetch', '-t', 'git://twisted',
+                          'destroy-the-sun-5000',
+                          '+refs/heads/trunk:refs/buildbot/trunk'])
+        self.expectProperty(TRUNK_REF_PROPERTY, 'refs/buildbot/trunk')
+        return self.runStep()
+
+
+    def test_trunk(self):
+        """
+        Trunk is only fetched once by trunk builds, and the property is not
+        set.
+        """
+        self.fetchBranch('trunk',
+                         ['git', 'fetch', '-t', 'git://twisted', 'trunk'])
+        d = self.runStep()
+        def check(ignored):
+            self.assertFalse(self.properties.hasProperty(TRUNK_REF_PROPERTY))
+        return d.addCallback(check)
+
+
+
+class TestShallowTwistedGit(sourcesteps.SourceStepMixin, TestCase):
+    """
+    Tests for L{TwistedGit} with C{depth} and C{filter}.
+    """
+
+    def setUp(self):
+        return self.setUpSourceStep()
+
+    def tearDown(self):
+        return self.tearDownSourceStep()
+
+
+    def buildStep(self, branch='trunk'):
+        self.setupStep(
+            TwistedGit(repourl='git://twisted', branch='trunk', mode='full',
+                       method='fresh', depth=50, filter='blob:none',
+                       fetchTrunk=True),
+            {'branch': branch})
+
+
+    def expectRevParse(self):
+        return (ExpectShell(workdir='wkdir', command=['git', 'rev-parse', 'HEAD'])
+                + ExpectShell.log('stdio', stdout='f' * 40 + '\n')
+                + 0)
+
+
+    def test_clone(self):
+        """
+        New checkouts are shallow partial clones.
+        """
+        self.buildStep()
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', command=['git', '--version'])
+            + 0,
+            Expect('stat', dict(file='wkdir/.git', logEnviron=True))
+            + 1,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'clone', '--depth', '50',
+                                 '--filter=blob:none', '--branch', 'trunk',
+                                 'git://twisted', '.'])
+            + 0,
+            self.expectRevParse())
+        self.expectOutcome(result=SUCCESS, status_text=['update'])
+        return self.runStep()
+
+
+    def expectFetch(self, hasTrunk):
+        """
+        Expect an existing checkout to be updated, fetching trunk with the
+        depth first unless it has it already.
+        """
+        commands = [
+            ExpectShell(workdir='wkdir', command=['git', '--version'])
+            + 0,
+            Expect('stat', dict(file='wkdir/.git', logEnviron=True))
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'clean', '-f', '-d', '-x'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'rev-parse', '--verify', '--quiet',
+                                 'refs/buildbot/trunk'])
+            + (not hasTrunk)]
+        if not hasTrunk:
+            commands.append(
+                ExpectShell(workdir='wkdir',
+                            command=['git', 'fetch', '--depth', '50',
+                                     'git://twisted',
+                                     '+refs/heads/trunk:refs/buildbot/trunk'])
+                + 0)
+        return commands + [
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'fetch', '-t', 'git://twisted',
+                                 'destroy-the-sun-5000',
+                                 '+refs/heads/trunk:refs/buildbot/trunk'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'reset', '--hard', 'FETCH_HEAD'])
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'branch', '-M',
+                                 'destroy-the-sun-5000'])
+            + 0,
+            self.expectRevParse()]
+
+
+    def test_firstFetch(self):
+        """
+        The first fetch of trunk into a checkout gets it with the depth, and
+        without the filter.
+        """
+        self.buildStep('/branches/destroy-the-sun-5000')
+        self.expectCommands(*self.expectFetch(hasTrunk=False))
+        self.expectOutcome(result=SUCCESS, status_text=['update'])
+        return self.runStep()
+
+
+    def test_fetch(self):
+        """
+        Once the checkout has trunk, the fetches get the new commits without
+        a depth, which would make the history deepened since shallow again.
+        """
+        self.buildStep('/branches/destroy-the-sun-5000')
+        self.expectCommands(*self.expectFetch(hasTrunk=True))
+        self.expectOutcome(result=SUCCESS, status_text=['update'])
+        return self.runStep()
+
+
+
 class TestMergeForward(sourcesteps.SourceStepMixin, TestCase):
     """
     Tests for L{MergeForward}.
@@ -149,6 +468,336 @@ class TestMergeForward(sourcesteps.SourceStepMixin, TestCase):
         self.expectProperty('lint_revision', 'deadbeef00000000000000000000000000000000')
         return self.runStep()
 
+    def test_trunkFetched(self):
+        """
+        Trunk is not fetched again when the source step fetched it.
+        """
+        self.buildStep('destroy-the-sun-5000')
+        self.properties.setProperty(TRUNK_REF_PROPERTY, 'refs/buildbot/trunk',
+                                    'TwistedGit')
+        self.expectCommands(
+                ExpectShell(workdir='wkdir',
+                            command=['git', 'merge',
+                                '--no-ff', '--no-stat',
+                                'refs/buildbot/trunk'],
+                            env=self.env)
+                + 0,
+                ExpectShell(workdir='wkdir',
+                            command=['git', 'merge-base', 'HEAD',
+                                     'refs/buildbot/trunk'],
+                            env=self.env)
+                + ExpectShell.log('stdio', stdout="deadbeef00000000000000000000000000000000\n")
+                + 0
+        )
+        self.expectOutcome(result=SUCCESS, status_text=['merge', 'forward'])
+        self.expectProperty('lint_revision', 'deadbeef00000000000000000000000000000000')
+        return self.runStep()
+
+
+
+class TestShallowMergeForward(sourcesteps.SourceStepMixin, TestCase):
+    """
+    Tests for L{MergeForward} with C{depth}.
+    """
+
+    env = TestMergeForward.env
+    deepen = ['git', 'fetch', '--deepen=50', 'git://twisted',
+              'destroy-the-sun-5000', '+refs/heads/trunk:refs/buildbot/trunk']
+
+    def setUp(self):
+        return self.setUpSourceStep()
+
+    def tearDown(self):
+        return self.tearDownSourceStep()
+
+
+    def buildStep(self, branch):
+        self.setupStep(MergeForward(repourl='git://twisted', depth=50,
+                                    maxDeepen=2),
+                       {'branch': branch})
+
+
+    def expectMergeBase(self, rc):
+        return (ExpectShell(workdir='wkdir',
+                            command=['git', 'merge-base', 'HEAD',
+                                     'refs/buildbot/trunk'],
+                            env=self.env)
+                + rc)
+
+
+    def expectMerge(self):
+        return [
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'merge', '--no-ff', '--no-stat',
+                                 'refs/buildbot/trunk'],
+                        env=self.env)
+            + 0,
+            self.expectMergeBase(0)
+            + ExpectShell.log('stdio', stdout='d' * 40 + '\n')]
+
+
+    def test_deepen(self):
+        """
+        Trunk is first fetched to a ref with the same depth, and the history
+        is deepened until the merge base is found.
+        """
+        self.buildStep('destroy-the-sun-5000')
+        self.expectCommands(*[
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'rev-parse', '--verify', '--quiet',
+                                 'refs/buildbot/trunk'],
+                        env=self.env)
+            + 1,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'fetch', '--depth', '50',
+                                 'git://twisted',
+                                 '+refs/heads/trunk:refs/buildbot/trunk'],
+                        env=self.env)
+            + 0,
+            self.expectMergeBase(1),
+            ExpectShell(workdir='wkdir', command=self.deepen, env=self.env)
+            + 0,
+            self.expectMergeBase(0)] + self.expectMerge())
+        self.expectOutcome(result=SUCCESS, status_text=['merge', 'forward'])
+        self.expectProperty('lint_revision', 'd' * 40)
+        return self.runStep()
+
+
+    def test_fetchNewCommits(self):
+        """
+        Trunk is fetched without a depth once the checkout has it.
+        """
+        self.buildStep('destroy-the-sun-5000')
+        self.expectCommands(*[
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'rev-parse', '--verify', '--quiet',
+                                 'refs/buildbot/trunk'],
+                        env=self.env)
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'fetch', 'git://twisted',
+                                 '+refs/heads/trunk:refs/buildbot/trunk'],
+                        env=self.env)
+            + 0,
+            self.expectMergeBase(0)] + self.expectMerge())
+        self.expectOutcome(result=SUCCESS, status_text=['merge', 'forward'])
+        return self.runStep()
+
+
+    def test_unshallow(self):
+        """
+        The rest of the history is fetched once it was deepened C{maxDeepen}
+        times without finding the merge base.
+        """
+        self.buildStep('destroy-the-sun-5000')
+        self.properties.setProperty(TRUNK_REF_PROPERTY, 'refs/buildbot/trunk',
+                                    'TwistedGit')
+        self.expectCommands(*[
+            self.expectMergeBase(1),
+            ExpectShell(workdir='wkdir', command=self.deepen, env=self.env)
+            + 0,
+            self.expectMergeBase(1),
+            ExpectShell(workdir='wkdir', command=self.deepen, env=self.env)
+            + 0,
+            self.expectMergeBase(1),
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'fetch', '--unshallow',
+                                 'git://twisted', 'destroy-the-sun-5000',
+                                 '+refs/heads/trunk:refs/buildbot/trunk'],
+                        env=self.env)
+            + 0] + self.expectMerge())
+        self.expectOutcome(result=SUCCESS, status_text=['merge', 'forward'])
+        return self.runStep()
+
+
+    def test_trunk(self):
+        """
+        The history of trunk is deepened until it has the previous revision.
+        """
+        self.buildStep('trunk')
+        self.expectCommands(
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'rev-parse', '--verify', '--quiet',
+                                 'HEAD~1'],
+                        env=self.env)
+            + 0,
+            ExpectShell(workdir='wkdir',
+                        command=['git', 'rev-parse', 'HEAD~1'],
+                        env=self.env)
+            + ExpectShell.log('stdio', stdout='d' * 40 + '\n')
+            + 0)
+        self.expectOutcome(result=SUCCESS, status_text=['merge', 'forward'])
+        self.expectProperty('lint_revision', 'd' * 40)
+        return self.runStep()
+
+
+    def test_batched(self):
+        """
+        The history of batched merges cannot be deepened.
+        """
+        self.assertRaises(AssertionError, MergeForward,
+                          repourl='git://twisted', batched=True, depth=50)
+
+
+
+class TestBatchedMergeForward(sourcesteps.SourceStepMixin, TestCase):
+    """
+    Tests for L{MergeForward} with C{batched}.
+    """
+
+    def setUp(self):
+        return self.setUpSourceStep()
+
+    def tearDown(self):
+        return self.tearDownSourceStep()
+
+
+    def runScript(self, branch, kind, stdout, rc=0, trunk=''):
+        self.setupStep(MergeForward(repourl='git://twisted', batched=True),
+                       {'branch': branch})
+        if trunk:
+            self.properties.setProperty(TRUNK_REF_PROPERTY, trunk, 'test')
+        self.expectCommands(
+                ExpectShell(workdir='wkdir',
+                            command=['/bin/sh', '-c', MergeForward.mergeScript,
+                                     'merge-forward', 'git://twisted', kind,
+                                     trunk],
+                            env=TestMergeForward.env)
+                + ExpectShell.log('stdio', stdout=stdout)
+                + rc
+        )
+
+
+    def test_branch(self):
+        """
+        A single command merges trunk in, and reports the merge base.
+        """
+        self.runScript('/branches/destroy-the-sun-5000', 'branch',
+                       "Merge made by recursive.\nmerge: merged\n"
+                       "lint_revision: " + "d" * 40 + "\n")
+        self.expectOutcome(result=SUCCESS, status_text=['merge', 'forward'])
+        self.expectProperty('lint_revision', 'd' * 40)
+        return self.runStep()
+
+
+    def test_trunkFetched(self):
+        """
+        The ref of trunk fetched by the source step is passed to the script.
+        """
+        self.runScript('destroy-the-sun-5000', 'branch',
+                       "merge: merged\nlint_revision: " + "d" * 40 + "\n",
+                       trunk='refs/buildbot/trunk')
+        self.expectOutcome(result=SUCCESS, status_text=['merge', 'forward'])
+        return self.runStep()
+
+
+    def test_trunk(self):
+        self.runScript('trunk', 'trunk',
+                       "merge: skipped\nlint_revision: " + "e" * 40 + "\n")
+        self.expectOutcome(result=SUCCESS, status_text=['merge', 'forward'])
+        self.expectProperty('lint_revision', 'e' * 40)
+        return self.runStep()
+
+
+    def test_release(self):
+        self.runScript('releases/release-23.2-12345', 'release',
+                       "merge: skipped\nlint_revision: " + "e" * 40 + "\n")
+        self.expectOutcome(result=SUCCESS, status_text=['merge', 'forward'])
+        return self.runStep()
+
+
+    def test_failedMerge(self):
+        self.runScript('destroy-the-sun-5000', 'branch',
+                       "CONFLICT (content): Merge conflict in setup.py\n", 1)
+        self.expectOutcome(result=FAILURE,
+                           status_text=['merge', 'forward', 'failed'])
+        return self.runStep()
+
+
+
+class MergeScriptTests(TestCase):
+    """
+    Tests for L{MergeForward.mergeScript}, run against local repositories.
+    """
+
+    env = dict(os.environ, **TestMergeForward.env)
+
+    def git(self, cwd, *args):
+        process = subprocess.Popen(('git',) + args, cwd=cwd, env=self.env,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+        return output
+
+
+    def commit(self, cwd, name):
+        open(os.path.join(cwd, name), 'w').write(name)
+        self.git(cwd, 'add', name)
+        self.git(cwd, 'commit', '-q', '-m', name)
+        return self.git(cwd, 'rev-parse', 'HEAD').strip()
+
+
+    def setUp(self):
+        root = os.path.abspath(self.mktemp())
+        self.upstream = os.path.join(root, 'upstream')
+        os.makedirs(self.upstream)
+        self.git(self.upstream, 'init', '-q')
+        self.git(self.upstream, 'checkout', '-q', '-b', 'trunk')
+        self.base = self.commit(self.upstream, 'a')
+        self.checkout = os.path.join(root, 'checkout')
+        self.git(root, 'clone', '-q', self.upstream, self.checkout)
+        self.git(self.checkout, 'checkout', '-q', '-b', 'feature')
+        self.commit(self.checkout, 'b')
+        self.trunk = self.commit(self.upstream, 'c')
+
+
+    def runScript(self, kind, trunk=''):
+        process = subprocess.Popen(
+            ['/bin/sh', '-c', MergeForward.mergeScript, 'merge-forward',
+             self.upstream, kind, trunk],
+            cwd=self.checkout, env=self.env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+        return output.splitlines()[-2:]
+
+
+    def test_branch(self):
+        """
+        Trunk is merged into a branch, and the merge base is the head of
+        trunk.
+        """
+        self.assertEqual(self.runScript('branch'),
+                         ['merge: merged', 'lint_revision: ' + self.trunk])
+        self.assertTrue(os.path.exists(os.path.join(self.checkout, 'c')))
+
+
+    def test_trunkFetched(self):
+        """
+        The local ref of trunk is merged when it is given, without fetching.
+        """
+        self.git(self.checkout, 'fetch', '-q', self.upstream,
+                 '+refs/heads/trunk:refs/buildbot/trunk')
+        # Fetching from here would fail.
+        self.upstream = os.path.join(self.upstream, 'missing')
+        self.assertEqual(self.runScript('branch', 'refs/buildbot/trunk'),
+                         ['merge: merged', 'lint_revision: ' + self.trunk])
+
+
+    def test_release(self):
+        """
+        Trunk is not merged into release branches.
+        """
+        self.assertEqual(self.runScript('release'),
+                         ['merge: skipped', 'lint_revision: ' + self.base])
+        self.assertFalse(os.path.exists(os.path.join(self.checkout, 'c')))
+
+
+    def test_trunk(self):
+        self.assertEqual(self.runScript('trunk'),
+                         ['merge: skipped', 'lint_revision: ' + self.base])
+
+
 
 class UtilsTestCase(TestCase):
     """
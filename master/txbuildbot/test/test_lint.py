@@ -1,15 +1,49 @@
+import os
+import pickle
+import stat
+import subprocess
+import sys
+
 from twisted.trial import unittest
 from buildbot.status.results import SUCCESS, WARNINGS
 from buildbot.test.util.steps import BuildStepMixin
 from buildbot.test.fake.remotecommand import ExpectShell
 
-from txbuildbot.lint import LintStep
+from buildbot.status.logfile import STDOUT, STDERR, HEADER
+from buildbot.test.fake.remotecommand import FakeLogFile
+
+from txbuildbot.lint import LintStep, iterLogLines, _extractChangedFiles
 from txbuildbot.lint import CheckDocumentation
 from txbuildbot.lint import CheckCodesByTwistedChecker, TwistedCheckerError
+from txbuildbot.lint import ShardedTwistedChecker
 from txbuildbot.lint import PyFlakes, PyFlakesError
+from txbuildbot.lintcache import TrunkRevisionIndex, LintBaselineCache
+
+
+## TODO: Add tests for getPreviousLog
+
+class IterLogLinesTests(unittest.TestCase):
+    """
+    Tests for L{iterLogLines}.
+    """
+
+    def test_splitsChunks(self):
+        """
+        L{iterLogLines} reassembles lines split across chunks of stdout and
+        stderr, and skips headers.
+        """
+        logObj = FakeLogFile('stdio', None)
+        logObj.chunks = [
+            (HEADER, 'header\n'),
+            (STDOUT, 'first li'),
+            (STDOUT, 'ne\nsecond line\nthi'),
+            (STDERR, 'rd line\n'),
+            (STDOUT, 'last'),
+            ]
+        self.assertEqual(list(iterLogLines(logObj)), [
+            'first line\n', 'second line\n', 'third line\n', 'last'])
 
 
-## TODO: Add tests for getLastBuild/getPreviousLog
 
 class TestComputeDiffference(unittest.TestCase):
     """
@@ -81,15 +115,15 @@ class LintStepMixin(BuildStepMixin):
         @param step: step to run
 
         @type oldText: L(str)
-        @param oldText: Value to be returned from L{LintStep.getPreviousLog}
+        @param oldText: Lint output of the previous trunk build
 
         @type newText: L{str}
         @param oldText: Log to be generated by remote command.
 
         @return: None
         """
-        BuildStepMixin.setupStep(self, step)
-        self.step.getPreviousLog = lambda: oldText
+        step = BuildStepMixin.setupStep(self, step)
+        step.getPreviousErrors = lambda: step.computeErrors(oldText)
         self.expectCommands(
                 ExpectShell(command=command or step.__class__.command, workdir='wkdir', usePTY='slave-config')
                 + ExpectShell.log('stdio', stdout=newText)
@@ -170,6 +204,401 @@ class TestLintStep(LintStepMixin, unittest.TestCase):
         self.expectLogfile('test-lint errors', '%r' % {'old': set(['a', 'b', 'c']), 'new': set(['a', 'b'])}) 
         return self.runStep()
 
+class FakeBuildStatus(object):
+    """
+    A stand-in for a L{BuildStatus} loaded from disk.
+    """
+
+    def __init__(self, number, branch, revision):
+        self.number = number
+        self.properties = {'branch': branch, 'got_revision': revision}
+
+    def getNumber(self):
+        return self.number
+
+    def getProperty(self, name, default=None):
+        return self.properties.get(name, default)
+
+    def getLogs(self):
+        return []
+
+
+
+class FakeBuilderStatus(object):
+    """
+    A stand-in for a L{BuilderStatus} which records which builds are loaded.
+
+    @ivar loaded: list of build numbers passed to L{getBuild}.
+    """
+
+    def __init__(self, basedir, builds):
+        self.basedir = basedir
+        self.builds = dict((build.getNumber(), build) for build in builds)
+        self.loaded = []
+
+    def getBuild(self, number):
+        self.loaded.append(number)
+        return self.builds.get(number)
+
+
+
+class TrunkBuildsMixin(BuildStepMixin):
+    """
+    Mixin for running a L{FakeLintStep} in a build following earlier builds of
+    the same builder.
+    """
+
+    setUp = BuildStepMixin.setUpBuildStep
+    tearDown = BuildStepMixin.tearDownBuildStep
+
+    def makeStep(self, lintRevision, builds):
+        """
+        Set up a step running as the build after C{builds}, looking for the
+        trunk build of C{lintRevision}.
+
+        @return: the L{FakeBuilderStatus} holding C{builds}.
+        """
+        self.setupStep(FakeLintStep({}, {}))
+        self.properties.setProperty('lint_revision', lintRevision, 'test')
+        basedir = self.mktemp()
+        os.makedirs(basedir)
+        builder = FakeBuilderStatus(basedir, builds)
+        self.step.build.build_status.getNumber = lambda: len(builds)
+        self.step.build.build_status.getBuilder = lambda: builder
+        return builder
+
+
+    def trunkBuilds(self, count):
+        return [FakeBuildStatus(n, None, 'rev%d' % (n,)) for n in range(count)]
+
+
+
+class GetLastBuildTests(TrunkBuildsMixin, unittest.TestCase):
+    """
+    Tests for L{LintStep._getLastBuild}.
+    """
+
+    def test_scanRecordsIndex(self):
+        """
+        When there is no index, L{LintStep._getLastBuild} searches backwards
+        through the builds, and records the build it finds in the index.
+        """
+        builds = self.trunkBuilds(10)
+        builder = self.makeStep('rev3', builds)
+        self.assertIdentical(self.step._getLastBuild(), builds[3])
+        self.assertEqual(builder.loaded, [9, 8, 7, 6, 5, 4, 3])
+        self.assertEqual(self.step._getRevisionIndex().get('rev3'), 3)
+
+
+    def test_indexedLookup(self):
+        """
+        When the index has an entry for C{lint_revision},
+        L{LintStep._getLastBuild} loads only that build.
+        """
+        builds = self.trunkBuilds(10)
+        builder = self.makeStep('rev3', builds)
+        self.step._getRevisionIndex().record('rev3', 3)
+        self.assertIdentical(self.step._getLastBuild(), builds[3])
+        self.assertEqual(builder.loaded, [3])
+
+
+    def test_staleIndex(self):
+        """
+        When the index entry for C{lint_revision} refers to a build of another
+        revision, L{LintStep._getLastBuild} falls back to searching.
+        """
+        builds = self.trunkBuilds(10)
+        builder = self.makeStep('rev3', builds)
+        self.step._getRevisionIndex().record('rev3', 5)
+        self.assertIdentical(self.step._getLastBuild(), builds[3])
+        self.assertEqual(builder.loaded, [5, 9, 8, 7, 6, 5, 4, 3])
+        self.assertEqual(self.step._getRevisionIndex().get('rev3'), 3)
+
+
+    def test_indexedBranchBuild(self):
+        """
+        An index entry which refers to a build of a branch is ignored.
+        """
+        builds = self.trunkBuilds(4) + [FakeBuildStatus(4, 'branch', 'rev3')]
+        builder = self.makeStep('rev3', builds)
+        self.step._getRevisionIndex().record('rev3', 4)
+        self.assertIdentical(self.step._getLastBuild(), builds[3])
+        self.assertEqual(builder.loaded, [4, 4, 3])
+
+
+    def test_recordTrunkBuild(self):
+        """
+        A lint step run on trunk records its build in the index, and caches
+        its errors.
+        """
+        builder = self.makeStep('rev3', self.trunkBuilds(10))
+        self.properties.setProperty('got_revision', 'rev10', 'test')
+        self.step._recordTrunkBuild({'new': set(['a'])})
+        self.assertEqual(
+            TrunkRevisionIndex.forBuilder(builder).get('rev10'), 10)
+        self.assertEqual(
+            LintBaselineCache.forBuilder(builder).get(10, 'test-lint'),
+            {'new': set(['a'])})
+
+
+    def test_branchBuildNotRecorded(self):
+        """
+        A lint step run on a branch does not record its build in the index.
+        """
+        builder = self.makeStep('rev3', self.trunkBuilds(10))
+        self.properties.setProperty('branch', 'some-branch', 'test')
+        self.properties.setProperty('got_revision', 'rev10', 'test')
+        self.step._recordTrunkBuild({'new': set(['a'])})
+        self.assertIdentical(
+            TrunkRevisionIndex.forBuilder(builder).get('rev10'), None)
+        self.assertIdentical(
+            LintBaselineCache.forBuilder(builder).get(10, 'test-lint'), None)
+
+
+
+class GetPreviousErrorsTests(TrunkBuildsMixin, unittest.TestCase):
+    """
+    Tests for L{LintStep.getPreviousErrors}.
+    """
+
+    def makeStep(self, lintRevision, builds):
+        builder = TrunkBuildsMixin.makeStep(self, lintRevision, builds)
+        self.parsed = []
+        def getPreviousLog(build):
+            self.parsed.append(build.getNumber())
+            return 'old'
+        self.step.getPreviousLog = getPreviousLog
+        self.step.oldErrors = {'old': set(['a'])}
+        return builder
+
+
+    def test_noPreviousBuild(self):
+        """
+        When there is no previous trunk build, there are no previous errors.
+        """
+        self.makeStep('rev3', [])
+        self.step.newErrors = {}
+        self.assertEqual(self.step.getPreviousErrors(), {})
+
+
+    def test_parsesOnce(self):
+        """
+        The output of a trunk build is parsed the first time its errors are
+        needed, and the cached errors are used after that.
+        """
+        builder = self.makeStep('rev3', self.trunkBuilds(10))
+        self.assertEqual(self.step.getPreviousErrors(), {'old': set(['a'])})
+        self.assertEqual(self.step.getPreviousErrors(), {'old': set(['a'])})
+        self.assertEqual(self.parsed, [3])
+        self.assertEqual(
+            LintBaselineCache.forBuilder(builder).get(3, 'test-lint'),
+            {'old': set(['a'])})
+
+
+    def test_usesTrunkErrors(self):
+        """
+        Errors cached by a trunk build are used without parsing its output.
+        """
+        builder = self.makeStep('rev3', self.trunkBuilds(10))
+        LintBaselineCache.forBuilder(builder).store(
+            3, 'test-lint', {'trunk': set(['b'])})
+        self.assertEqual(self.step.getPreviousErrors(), {'trunk': set(['b'])})
+        self.assertEqual(self.parsed, [])
+
+
+
+class ExtractChangedFilesTests(unittest.TestCase):
+    """
+    Tests for L{_extractChangedFiles}.
+    """
+
+    def test_extract(self):
+        """
+        L{_extractChangedFiles} parses the output of C{git diff -z
+        --name-status} into C{[status, path]} pairs.
+        """
+        stdout = 'M\0twisted/a.py\0D\0twisted/b c.py\0A\0docs/x.txt\0'
+        self.assertEqual(_extractChangedFiles(0, stdout, ''), {
+            'lint_changed_files': [
+                ['M', 'twisted/a.py'],
+                ['D', 'twisted/b c.py'],
+                ['A', 'docs/x.txt']]})
+
+
+    def test_noChanges(self):
+        """
+        When nothing changed, the property is set to an empty list.
+        """
+        self.assertEqual(_extractChangedFiles(0, '', ''),
+                         {'lint_changed_files': []})
+
+
+    def test_failure(self):
+        """
+        When git fails, no property is set.
+        """
+        self.assertEqual(_extractChangedFiles(128, '', 'fatal: bad revision'),
+                         {})
+
+
+
+class IncrementalLintTests(BuildStepMixin, unittest.TestCase):
+    """
+    Tests for incremental L{LintStep}s.
+    """
+
+    setUp = BuildStepMixin.setUpBuildStep
+    tearDown = BuildStepMixin.tearDownBuildStep
+
+    def setupIncremental(self, step, baseline, changedFiles, command,
+                         newText, lintRevision='rev3'):
+        """
+        Set up C{step} to run on a branch after ten trunk builds, the last of
+        which is cached with the errors found in C{baseline}.
+
+        @param command: the command C{step} is expected to run
+        @param newText: the output of C{command}
+        """
+        step = self.setupStep(step)
+        builds = [FakeBuildStatus(n, None, 'rev%d' % (n,)) for n in range(10)]
+        basedir = self.mktemp()
+        os.makedirs(basedir)
+        builder = FakeBuilderStatus(basedir, builds)
+        step.build.build_status.getNumber = lambda: len(builds)
+        step.build.build_status.getBuilder = lambda: builder
+        LintBaselineCache.forBuilder(builder).store(
+            3, step.lintChecker, step.computeErrors(baseline))
+        self.properties.setProperty('branch', 'some-branch', 'test')
+        self.properties.setProperty('lint_revision', lintRevision, 'test')
+        self.properties.setProperty('lint_changed_files', changedFiles, 'test')
+        self.expectCommands(
+                ExpectShell(command=command, workdir='wkdir', usePTY='slave-config')
+                + ExpectShell.log('stdio', stdout=newText)
+                + 0
+        )
+
+
+    def test_pyflakes(self):
+        """
+        An incremental L{PyFlakes} step only checks the changed files, and
+        takes the errors in the other files from the trunk build of
+        C{lint_revision}.
+        """
+        self.setupIncremental(PyFlakes(incremental=True),
+            baseline='\n'.join([
+                "twisted/a.py:1: 'os' imported but unused",
+                "twisted/b.py:2: 'sys' imported but unused",
+                "twisted/gone.py:3: 're' imported but unused",
+                ]),
+            changedFiles=[['M', 'twisted/a.py'], ['D', 'twisted/gone.py'],
+                          ['A', 'twisted/c.py'], ['M', 'setup.py']],
+            command=['pyflakes', 'twisted/a.py', 'twisted/c.py'],
+            newText="twisted/c.py:4: undefined name 'x'\n")
+        self.expectOutcome(result=WARNINGS, status_text=['pyflakes', 'warnings'])
+        self.expectLogfile('changed files', '\n'.join([
+            'twisted/a.py', 'twisted/gone.py', 'twisted/c.py']))
+        self.expectLogfile('pyflakes errors', '\n'.join([
+            "twisted/b.py:2: 'sys' imported but unused",
+            "twisted/c.py:4: undefined name 'x'",
+            ]))
+        self.expectLogfile('new pyflakes errors',
+            "twisted/c.py:4: undefined name 'x'")
+        return self.runStep()
+
+
+    def test_twistedchecker(self):
+        """
+        An incremental L{CheckCodesByTwistedChecker} step checks the changed
+        modules in a single shard, and takes the errors in the other modules
+        from the trunk build of C{lint_revision}.
+        """
+        self.setupIncremental(CheckCodesByTwistedChecker(incremental=True),
+            baseline='\n'.join([
+                '************* Module twisted.a',
+                'W9208:  1,0: Missing docstring',
+                '************* Module twisted.b',
+                'W9208:  2,0: Missing docstring',
+                '************* Module twisted.sub',
+                'W9208:  3,0: Missing docstring',
+                ]),
+            changedFiles=[['M', 'twisted/b.py'], ['D', 'twisted/sub/__init__.py']],
+            command=ShardedTwistedChecker.shardCommand(['twisted/b.py'], 1),
+            newText='\n'.join([
+                '************* Module twisted.b',
+                'W9013: 28,0: Expected 3 blank lines, found 2',
+                ]))
+        self.expectOutcome(result=WARNINGS, status_text=['check', 'results', 'warnings'])
+        self.expectLogfile('twistedchecker twisted.a errors', '\n'.join([
+            '************* Module twisted.a',
+            'W9208:  1,0: Missing docstring',
+            ]))
+        self.expectLogfile('new twistedchecker errors', '\n'.join([
+            '************* Module twisted.b',
+            'W9013: 28,0: Expected 3 blank lines, found 2',
+            ]))
+        return self.runStep()
+
+
+    def test_shardedTwistedchecker(self):
+        """
+        An incremental L{ShardedTwistedChecker} step checks the changed
+        modules in its shards.
+        """
+        self.setupIncremental(ShardedTwistedChecker(shards=3, incremental=True),
+            baseline='',
+            changedFiles=[['M', 'twisted/b.py']],
+            command=ShardedTwistedChecker.shardCommand(['twisted/b.py'], 3),
+            newText='')
+        self.expectOutcome(result=SUCCESS, status_text=['check', 'results'])
+        return self.runStep()
+
+
+    def test_noChangedFiles(self):
+        """
+        When no source files were changed, nothing is checked, and the errors
+        are those of the trunk build.
+        """
+        self.setupIncremental(PyFlakes(incremental=True),
+            baseline="twisted/b.py:2: 'sys' imported but unused\n",
+            changedFiles=[['M', 'README']],
+            command=['echo', 'No changed files to check'],
+            newText='No changed files to check\n')
+        self.expectOutcome(result=SUCCESS, status_text=['pyflakes'])
+        self.expectLogfile('pyflakes errors',
+            "twisted/b.py:2: 'sys' imported but unused")
+        return self.runStep()
+
+
+    def test_noTrunkBuild(self):
+        """
+        When there is no trunk build of C{lint_revision}, the whole tree is
+        checked.
+        """
+        self.setupIncremental(PyFlakes(incremental=True),
+            baseline="twisted/b.py:2: 'sys' imported but unused\n",
+            changedFiles=[['M', 'twisted/a.py']],
+            command=['pyflakes', 'twisted'],
+            newText="twisted/b.py:2: 'sys' imported but unused\n",
+            lintRevision='unknown')
+        # The most recent trunk build is used instead, which has no log.
+        self.expectOutcome(result=WARNINGS, status_text=['pyflakes', 'warnings'])
+        return self.runStep()
+
+
+    def test_notIncremental(self):
+        """
+        A step which is not incremental checks the whole tree.
+        """
+        self.setupIncremental(PyFlakes(),
+            baseline="twisted/b.py:2: 'sys' imported but unused\n",
+            changedFiles=[['M', 'twisted/a.py']],
+            command=['pyflakes', 'twisted'],
+            newText="twisted/b.py:2: 'sys' imported but unused\n")
+        self.expectOutcome(result=SUCCESS, status_text=['pyflakes'])
+        return self.runStep()
+
+
+
 class PydoctorTests(LintStepMixin, unittest.TestCase):
     """
     Tests for L{CheckDocumentation}
@@ -230,6 +659,72 @@ class PydoctorTests(LintStepMixin, unittest.TestCase):
             ]))
         return self.runStep()
 
+class TwistedCheckerErrorTests(unittest.TestCase):
+    """
+    Tests for L{TwistedCheckerError}.
+    """
+
+    def test_compact(self):
+        """
+        L{TwistedCheckerError}s have no instance dictionary, and share the
+        strings of equal errors.
+        """
+        first = TwistedCheckerError('W9208:  8,0:MockVisitor: Missing docstring')
+        second = TwistedCheckerError(''.join(['W9208: 18,0:MockVisitor: ',
+                                              'Missing docstring']))
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertIdentical(first.type, second.type)
+        self.assertIdentical(first.text, second.text)
+
+
+    def test_comparison(self):
+        """
+        L{TwistedCheckerError}s are equal and hash equal when their type and
+        text are, and sort by position.
+        """
+        first = TwistedCheckerError('W9208:  8,0:MockVisitor: Missing docstring')
+        moved = TwistedCheckerError('W9208: 18,0:MockVisitor: Missing docstring')
+        other = TwistedCheckerError('W9208:  1,0: Missing docstring')
+        self.assertEqual(first, moved)
+        self.assertFalse(first != moved)
+        self.assertEqual(hash(first), hash(moved))
+        self.assertNotEqual(first, other)
+        self.assertEqual([str(e) for e in sorted([moved, first, other])],
+                         [str(other), str(first), str(moved)])
+
+
+    def test_pickle(self):
+        """
+        L{TwistedCheckerError}s survive pickling with their fields interned.
+        """
+        error = TwistedCheckerError('C0301: 19,0: Line too long (81/79)')
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(error, protocol))
+            self.assertEqual(loaded, error)
+            self.assertEqual(str(loaded), str(error))
+            self.assertEqual(repr(loaded), repr(error))
+            self.assertIdentical(loaded.text, error.text)
+
+
+    def test_unpickleInstanceDictionary(self):
+        """
+        L{TwistedCheckerError}s pickled when they had an instance dictionary,
+        as in the entries of an older L{LintBaselineCache}, are unpickled with
+        their fields in the right slots.
+        """
+        loaded = pickle.loads(
+            '\x80\x02]q\x00ctxbuildbot.lint\nTwistedCheckerError\nq\x01)'
+            '\x81q\x02}q\x03(U\x03msgq\x04U"C0301: 19,0: Line too long '
+            '(81/79)q\x05U\x06indentq\x06U\x010q\x07U\x04lineq\x08U\x03 '
+            '19q\tU\x04typeq\nU\x05C0301q\x0bU\x04textq\x0cU\x16 Line too '
+            'long (81/79)q\ruba.')
+        error = TwistedCheckerError('C0301: 19,0: Line too long (81/79)')
+        self.assertEqual(loaded, [error])
+        self.assertEqual(repr(loaded[0]), repr(error))
+        self.assertEqual((loaded[0].line, loaded[0].indent), (' 19', '0'))
+
+
+
 class CheckCodesByTwistedCheckerTests(LintStepMixin, unittest.TestCase):
     """
     Tests for L{CheckCodesByTwistedChecker}
@@ -261,6 +756,18 @@ class CheckCodesByTwistedCheckerTests(LintStepMixin, unittest.TestCase):
         'W9208: 18,0:TestTestVisitor: Missing docstring',
         ]
 
+    def test_computeErrorsFromLines(self):
+        """
+        L{CheckCodesByTwistedChecker.computeErrors} accepts an iterable of
+        lines, as well as a single string.
+        """
+        errors = CheckCodesByTwistedChecker.computeErrors(
+            iter([line + "\n" for line in self.logText]))
+        self.assertEqual(
+            errors,
+            CheckCodesByTwistedChecker.computeErrors("\n".join(self.logText)))
+
+
     def test_coputeErrors(self):
         errors = CheckCodesByTwistedChecker.computeErrors("\n".join(self.logText))
         self.assertEqual(errors, {
@@ -342,6 +849,175 @@ class CheckCodesByTwistedCheckerTests(LintStepMixin, unittest.TestCase):
             ]))
         return self.runStep()
 
+class ShardedTwistedCheckerTests(LintStepMixin, unittest.TestCase):
+    """
+    Tests for L{ShardedTwistedChecker}.
+    """
+
+    setUp = LintStepMixin.setUpBuildStep
+    tearDown = LintStepMixin.tearDownBuildStep
+
+    logText = CheckCodesByTwistedCheckerTests.logText
+
+    def command(self, package, shards):
+        step = ShardedTwistedChecker(shards=shards)
+        return step.command[:3] + [package, str(shards)]
+
+
+    def test_newErrors(self):
+        """
+        L{ShardedTwistedChecker} runs its sharding script with the package and
+        number of shards, and reports new errors like
+        L{CheckCodesByTwistedChecker}.
+        """
+        self.setupStep(ShardedTwistedChecker(shards=3),
+                command=self.command('twisted', 3),
+                oldText="\n".join(self.logText[:4]),
+                newText="\n".join(self.logText),
+                )
+        self.expectOutcome(result=WARNINGS, status_text=['check', 'results', 'warnings'])
+        self.expectLogfile('new twistedchecker errors', '\n'.join([
+            '************* Module twisted.python.threadpool',
+            'C0103: 55,8:ThreadPool.__init__: Invalid name "q" (should match ((([a-z_])|([a-z]+_[a-z]))[a-zA-Z0-9]+)$)',
+            'C0103: 88,8:ThreadPool.__setstate__: Invalid name "__dict__" (should match ((([a-z_])|([a-z]+_[a-z]))[a-zA-Z0-9]+)$)',
+            'W9402:211,0: The first letter of comment should be capitalized',
+            '************* Module twisted.python.util',
+            'C0301: 19,0: Line too long (81/79)',
+            '************* Module twisted.trial._utilpy3',
+            'W9201: 17,0:acquireAttribute: The opening/closing of docstring should be on a line by themselves',
+            'W9202: 17,0:acquireAttribute: Missing epytext markup @param for argument "attr"',
+            'W9202: 17,0:acquireAttribute: Missing epytext markup @param for argument "objects"',
+            'W9013: 28,0: Expected 3 blank lines, found 2',
+            '************* Module twisted.trial.test.test_test_visitor',
+            'W9208:  1,0: Missing docstring',
+            'W9208:  8,0:MockVisitor: Missing docstring',
+            'W9208: 18,0:TestTestVisitor: Missing docstring',
+            ]))
+        return self.runStep()
+
+
+
+class ShardedTwistedCheckerScriptTests(unittest.TestCase):
+    """
+    Tests for the script run on the slave by L{ShardedTwistedChecker}.
+    """
+
+    def setUp(self):
+        """
+        Create a package to check, and a fake twistedchecker which reports one
+        error for each module it is given.
+        """
+        self.root = os.path.abspath(self.mktemp())
+        for path in ['pkg/__init__.py', 'pkg/a.py', 'pkg/b.py',
+                     'pkg/sub/__init__.py', 'pkg/sub/c.py',
+                     'pkg/data/d.py', 'pkg/notes.txt']:
+            path = os.path.join(self.root, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').write('x = 1\n')
+        bin = os.path.join(self.root, 'bin')
+        os.makedirs(bin)
+        checker = os.path.join(bin, 'twistedchecker')
+        open(checker, 'w').write(
+            '#!%s\n'
+            'import sys\n'
+            'for name in sys.argv[1:]:\n'
+            '    print("************* Module " + name)\n'
+            '    print("W9208:  1,0: Missing docstring")\n' % (sys.executable,))
+        os.chmod(checker, stat.S_IRWXU)
+        self.env = dict(os.environ, PATH=bin + os.pathsep + os.environ['PATH'])
+
+
+    def runChecker(self, package, shards):
+        """
+        Run the script on the space separated targets in C{package}.
+        """
+        command = ShardedTwistedChecker(shards=shards).command
+        process = subprocess.Popen(
+            [sys.executable] + command[1:3] + package.split() + [str(shards)],
+            cwd=self.root, env=self.env, stdout=subprocess.PIPE)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0)
+        return output
+
+
+    def test_checksEachModuleOnce(self):
+        """
+        Every module of the package is checked by exactly one shard.
+        """
+        output = self.runChecker('pkg', 2)
+        modules = [line for line in output.splitlines()
+                   if line.startswith('*')]
+        self.assertEqual(sorted(modules), [
+            '************* Module pkg',
+            '************* Module pkg.a',
+            '************* Module pkg.b',
+            '************* Module pkg.sub',
+            '************* Module pkg.sub.c',
+            ])
+        self.assertEqual(
+            sorted(CheckCodesByTwistedChecker.computeErrors(output)),
+            ['pkg', 'pkg.a', 'pkg.b', 'pkg.sub', 'pkg.sub.c'])
+
+
+    def test_files(self):
+        """
+        Source files given by path are checked if they are part of a package,
+        and skipped if they are missing or outside of any package.
+        """
+        output = self.runChecker(
+            'pkg/a.py pkg/sub/__init__.py pkg/data/d.py pkg/gone.py', 1)
+        self.assertEqual(output.splitlines(), [
+            '************* Module pkg.a',
+            'W9208:  1,0: Missing docstring',
+            '************* Module pkg.sub',
+            'W9208:  1,0: Missing docstring',
+            ])
+
+
+    def test_noFiles(self):
+        """
+        When every file given is skipped, nothing is checked.
+        """
+        self.assertEqual(self.runChecker('pkg/gone.py', 2), '')
+
+
+    def test_module(self):
+        """
+        A target which is not a package is checked as a single module.
+        """
+        output = self.runChecker('pkg.a', 2)
+        self.assertEqual(output.splitlines()[0], '************* Module pkg.a')
+        self.assertEqual(len(output.splitlines()), 2)
+
+
+
+class PyFlakesErrorTests(unittest.TestCase):
+    """
+    Tests for L{PyFlakesError}.
+    """
+
+    line = "twisted/conch/manhole_tap.py:14: 'session' imported but unused"
+
+    def test_compact(self):
+        """
+        L{PyFlakesError}s have no instance dictionary.
+        """
+        self.assertFalse(hasattr(PyFlakesError.fromLine(self.line), '__dict__'))
+
+
+    def test_pickle(self):
+        """
+        L{PyFlakesError}s survive pickling.
+        """
+        error = PyFlakesError.fromLine(self.line)
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(error, protocol))
+            self.assertEqual(loaded, error)
+            self.assertEqual(repr(loaded), repr(error))
+
+
+
 class PyFlakesTests(LintStepMixin, unittest.TestCase):
     """
     Tests for L{PyFlakes}
@@ -358,6 +1034,17 @@ class PyFlakesTests(LintStepMixin, unittest.TestCase):
         "twisted/test/test_jelly.py:572: local variable 'n2' is assigned to but never used",
         ]
 
+    def test_computeErrorsFromLines(self):
+        """
+        L{PyFlakes.computeErrors} accepts an iterable of lines, as well as a
+        single string.
+        """
+        errors = PyFlakes.computeErrors(
+            iter([line + "\n" for line in self.logText]))
+        self.assertEqual(
+            errors, PyFlakes.computeErrors("\n".join(self.logText)))
+
+
     def test_coputeErrors(self):
         errors = PyFlakes.computeErrors("\n".join(self.logText))
         self.assertEqual(errors, {
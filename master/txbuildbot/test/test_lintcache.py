@@ -0,0 +1,127 @@
+import json
+import os
+
+from twisted.trial import unittest
+from twisted.python.filepath import FilePath
+
+from txbuildbot.lintcache import TrunkRevisionIndex, LintBaselineCache
+
+
+class TrunkRevisionIndexTests(unittest.TestCase):
+    """
+    Tests for L{TrunkRevisionIndex}.
+    """
+
+    def setUp(self):
+        self.path = FilePath(self.mktemp())
+        self.index = TrunkRevisionIndex(self.path)
+
+
+    def test_missing(self):
+        """
+        A missing index has no entries.
+        """
+        self.assertIdentical(self.index.get('abc'), None)
+
+
+    def test_record(self):
+        """
+        A recorded revision can be looked up by a new index on the same file.
+        """
+        self.index.record('abc', 12)
+        self.assertEqual(TrunkRevisionIndex(self.path).get('abc'), 12)
+
+
+    def test_emptyRevision(self):
+        """
+        Empty revisions are neither recorded nor looked up.
+        """
+        self.index.record('', 12)
+        self.assertFalse(self.path.exists())
+        self.assertIdentical(self.index.get(None), None)
+
+
+    def test_corrupt(self):
+        """
+        An index which can't be parsed is treated as empty, and is replaced
+        on the next record.
+        """
+        self.path.setContent('{not json')
+        self.assertIdentical(self.index.get('abc'), None)
+        self.index.record('abc', 12)
+        self.assertEqual(self.index.get('abc'), 12)
+
+
+    def test_maxEntries(self):
+        """
+        Only the C{maxEntries} most recent builds are remembered.
+        """
+        self.index.maxEntries = 3
+        for number in range(5):
+            self.index.record('rev%d' % (number,), number)
+        self.assertEqual(json.loads(self.path.getContent()),
+                         {'rev2': 2, 'rev3': 3, 'rev4': 4})
+
+
+
+class LintBaselineCacheTests(unittest.TestCase):
+    """
+    Tests for L{LintBaselineCache}.
+    """
+
+    def setUp(self):
+        self.path = FilePath(self.mktemp())
+        self.cache = LintBaselineCache(self.path)
+
+
+    def setAge(self, number, lintChecker, age):
+        """
+        Make the entry for C{number} look C{age} seconds old.
+        """
+        entry = self.path.child('%s-%d' % (lintChecker, number))
+        when = entry.getModificationTime() - age
+        os.utime(entry.path, (when, when))
+
+
+    def test_missing(self):
+        """
+        An entry that was not stored is not found.
+        """
+        self.assertIdentical(self.cache.get(3, 'pyflakes'), None)
+
+
+    def test_store(self):
+        """
+        A stored entry can be read back by a new cache on the same directory,
+        and is kept separately for each lint checker.
+        """
+        errors = {'pyflakes': set(['a', 'b'])}
+        self.cache.store(3, 'pyflakes', errors)
+        self.assertEqual(LintBaselineCache(self.path).get(3, 'pyflakes'), errors)
+        self.assertIdentical(self.cache.get(3, 'twistedchecker'), None)
+
+
+    def test_corrupt(self):
+        """
+        An entry that can't be read is treated as missing.
+        """
+        self.cache.store(3, 'pyflakes', {})
+        self.path.child('pyflakes-3').setContent('garbage')
+        self.assertIdentical(self.cache.get(3, 'pyflakes'), None)
+
+
+    def test_evictsLeastRecentlyUsed(self):
+        """
+        When more than C{maxEntries} entries are stored, the ones which were
+        least recently used are removed.
+        """
+        self.cache.maxEntries = 2
+        self.cache.store(1, 'pyflakes', {'1': set()})
+        self.setAge(1, 'pyflakes', 30)
+        self.cache.store(2, 'pyflakes', {'2': set()})
+        self.setAge(2, 'pyflakes', 20)
+        self.cache.get(1, 'pyflakes')
+        self.cache.store(3, 'pyflakes', {'3': set()})
+        self.assertEqual(self.cache.get(1, 'pyflakes'), {'1': set()})
+        self.assertIdentical(self.cache.get(2, 'pyflakes'), None)
+        self.assertEqual(self.cache.get(3, 'pyflakes'), {'3': set()})
@@ -0,0 +1,189 @@
+import os
+import shutil
+import stat
+import subprocess
+
+from twisted.trial import unittest
+from buildbot.status.results import SKIPPED, FAILURE
+from buildbot.test.util.steps import BuildStepMixin
+from buildbot.test.fake.remotecommand import ExpectShell
+
+from txbuildbot.pypy import (
+    CACHED_PROPERTY, DownloadTranslation, UploadTranslation, translationKey,
+    translationNeeded)
+
+
+
+class TranslationKeyTests(unittest.TestCase):
+    """
+    Tests for L{translationKey}.
+    """
+
+    def test_key(self):
+        """
+        The key depends on the revision and on each list of arguments.
+        """
+        key = translationKey('abc', ['-Ojit'], ['--withmod-foo'])
+        self.assertEqual(key, translationKey('abc', ('-Ojit',),
+                                             ('--withmod-foo',)))
+        self.assertNotEqual(key, translationKey('abd', ['-Ojit'],
+                                                ['--withmod-foo']))
+        self.assertNotEqual(key, translationKey('abc', ['-Ojit',
+                                                        '--withmod-foo'], []))
+
+
+
+class TranslationCacheTests(BuildStepMixin, unittest.TestCase):
+    """
+    Tests for L{DownloadTranslation} and L{UploadTranslation}.
+    """
+
+    setUp = BuildStepMixin.setUpBuildStep
+    tearDown = BuildStepMixin.tearDownBuildStep
+
+    def setupTransfer(self, stepClass):
+        cache = os.path.abspath(self.mktemp())
+        self.setupStep(stepClass(translationArgs=['-Ojit'], targetArgs=[],
+                                 cache=cache))
+        self.properties.setProperty('got_revision', 'abc', 'Mercurial')
+        return os.path.join(cache, translationKey('abc', ['-Ojit'], []),
+                            'pypy-c.tar.gz')
+
+
+    def test_notCached(self):
+        """
+        Nothing is downloaded when the cache does not have the binary, and
+        the translation is needed.
+        """
+        self.setupTransfer(DownloadTranslation)
+        self.expectOutcome(result=SKIPPED,
+                           status_text=['download-translation', 'skipped'])
+        d = self.runStep()
+        def check(ignored):
+            self.assertTrue(translationNeeded(self.step))
+        return d.addCallback(check)
+
+
+    def test_cachedArchive(self):
+        """
+        The archive of the translated files is uploaded to the cache, under
+        the key of the revision and the arguments of the translation.
+        """
+        path = self.setupTransfer(UploadTranslation)
+        self.assertEqual(self.step.cachedArchive(), path)
+        self.assertIdentical(self.step.doStepIf, translationNeeded)
+
+
+    def test_packFailed(self):
+        """
+        Nothing is uploaded when the translated files cannot be packed.
+        """
+        self.setupTransfer(UploadTranslation)
+        self.expectCommands(
+            ExpectShell(workdir='build/pypy/goal',
+                        command=self.step.packCommand())
+            + 2)
+        self.expectOutcome(result=FAILURE, status_text=[
+            'could', 'not', 'pack', 'pypy-c.tar.gz'])
+        return self.runStep()
+
+
+    def test_evict(self):
+        """
+        Once a binary is uploaded, only the C{maxEntries} most recently used
+        binaries are kept.
+        """
+        self.setupTransfer(UploadTranslation)
+        self.step.maxEntries = 2
+        os.makedirs(self.step.cache)
+        for key, used in [('old', 1), ('used', 3), ('new', 2)]:
+            os.makedirs(os.path.join(self.step.cache, key))
+            archive = os.path.join(self.step.cache, key, 'pypy-c.tar.gz')
+            open(archive, 'w').close()
+            os.utime(archive, (used, used))
+        self.step.evict()
+        self.assertEqual(sorted(os.listdir(self.step.cache)), ['new', 'used'])
+
+
+    def test_stepFactory(self):
+        """
+        The steps are created again from the arguments they record.
+        """
+        for stepClass in [DownloadTranslation, UploadTranslation]:
+            step = stepClass(translationArgs=['-Ojit'], targetArgs=[],
+                             cache='cache')
+            factoryClass, kwargs = step.getStepFactory()
+            copy = factoryClass(**kwargs)
+            self.assertEqual(
+                (copy.translationArgs, copy.targetArgs, copy.cache,
+                 copy.workdir),
+                (['-Ojit'], [], 'cache', 'build/pypy/goal'))
+
+
+    def test_translationNeeded(self):
+        self.setupTransfer(DownloadTranslation)
+        self.properties.setProperty(CACHED_PROPERTY, True, 'test')
+        self.assertFalse(translationNeeded(self.step))
+
+
+
+class TranslationArchiveTests(unittest.TestCase):
+    """
+    Tests for the commands packing and unpacking the translated files.
+    """
+
+    def setUp(self):
+        self.step = UploadTranslation(translationArgs=[], targetArgs=[])
+        self.goal = os.path.abspath(self.mktemp())
+        self.restored = os.path.abspath(self.mktemp())
+        os.makedirs(self.goal)
+        os.makedirs(self.restored)
+
+
+    def transfer(self):
+        """
+        Pack the translated files, and unpack them elsewhere.
+        """
+        self.assertEqual(
+            subprocess.call(self.step.packCommand(), cwd=self.goal), 0)
+        shutil.copy(os.path.join(self.goal, 'pypy-c.tar.gz'), self.restored)
+        self.assertEqual(
+            subprocess.call(self.step.unpackCommand(), cwd=self.restored), 0)
+
+
+    def test_library(self):
+        """
+        The library translated along with the binary is restored with it.
+        """
+        open(os.path.join(self.goal, 'pypy-c'), 'w').write('binary')
+        os.chmod(os.path.join(self.goal, 'pypy-c'), 0755)
+        open(os.path.join(self.goal, 'libpypy-c.so'), 'w').write('library')
+        self.transfer()
+        binary = os.path.join(self.restored, 'pypy-c')
+        self.assertEqual(open(binary).read(), 'binary')
+        self.assertTrue(os.stat(binary).st_mode & stat.S_IXUSR)
+        self.assertEqual(
+            open(os.path.join(self.restored, 'libpypy-c.so')).read(),
+            'library')
+
+
+    def test_binaryOnly(self):
+        """
+        The binary is packed on its own when no library was translated.
+        """
+        open(os.path.join(self.goal, 'pypy-c'), 'w').write('binary')
+        self.transfer()
+        self.assertEqual(sorted(os.listdir(self.restored)),
+                         ['pypy-c', 'pypy-c.tar.gz'])
+
+
+    def test_noBinary(self):
+        """
+        Packing fails when there is no binary.
+        """
+        open(os.path.join(self.goal, 'libpypy-c.so'), 'w').write('library')
+        devnull = open(os.devnull, 'w')
+        self.addCleanup(devnull.close)
+        self.assertNotEqual(
+            subprocess.call(self.step.packCommand(), cwd=self.goal,
+                            stderr=devnull), 0)
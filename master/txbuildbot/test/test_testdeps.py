@@ -0,0 +1,281 @@
+import json
+import os
+import subprocess
+import sys
+
+from twisted.trial import unittest
+from twisted.python.filepath import FilePath
+from buildbot.status.results import SUCCESS, SKIPPED
+from buildbot.test.util.steps import BuildStepMixin
+from buildbot.test.fake.remotecommand import ExpectShell
+
+from txbuildbot.testdeps import (
+    RecordTestDependencies, TestDependencyIndex, moduleForFile)
+from txbuildbot.test.test_lint import FakeBuilderStatus
+from twisted_steps import Trial
+
+
+
+class ModuleForFileTests(unittest.TestCase):
+    """
+    Tests for L{moduleForFile}.
+    """
+
+    def test_module(self):
+        self.assertEqual(moduleForFile('twisted/internet/tcp.py'),
+                         'twisted.internet.tcp')
+
+
+    def test_package(self):
+        self.assertEqual(moduleForFile('twisted/internet/__init__.py'),
+                         'twisted.internet')
+
+
+    def test_notPython(self):
+        self.assertIdentical(moduleForFile('twisted/topfiles/NEWS'), None)
+
+
+
+class TestDependencyIndexTests(unittest.TestCase):
+    """
+    Tests for L{TestDependencyIndex}.
+    """
+
+    imports = {
+        'pkg': [],
+        'pkg.base': [],
+        'pkg.util': ['pkg.base'],
+        'pkg.other': [],
+        'pkg.sub': [],
+        'pkg.sub.thing': [],
+        'pkg.test': [],
+        'pkg.test.test_base': ['pkg.base'],
+        'pkg.test.test_util': ['pkg.util'],
+        'pkg.test.test_other': ['pkg.other'],
+        'pkg.test.helpers': ['pkg.sub.thing'],
+        'pkg.test.test_thing': ['pkg.test.helpers'],
+        }
+
+    def setUp(self):
+        self.index = TestDependencyIndex(FilePath(self.mktemp()))
+        self.index.store('abc', self.imports)
+
+
+    def test_noIndex(self):
+        """
+        When there is no index, the affected tests are unknown.
+        """
+        index = TestDependencyIndex(FilePath(self.mktemp()))
+        self.assertIdentical(index.load(), None)
+        self.assertIdentical(index.affectedTests(['pkg/base.py']), None)
+
+
+    def test_unreadable(self):
+        """
+        A corrupt index is ignored.
+        """
+        self.index.path.setContent('{"imports": ')
+        self.assertIdentical(self.index.affectedTests(['pkg/base.py']), None)
+
+
+    def test_roundtrip(self):
+        self.assertEqual(self.index.load(), self.imports)
+
+
+    def test_indirect(self):
+        """
+        Test modules which import a changed module through other modules are
+        affected.
+        """
+        self.assertEqual(self.index.affectedTests(['pkg/base.py']),
+                         ['pkg.test.test_base', 'pkg.test.test_util'])
+        self.assertEqual(self.index.affectedTests(['pkg/sub/thing.py']),
+                         ['pkg.test.test_thing'])
+
+
+    def test_package(self):
+        """
+        Changing a package affects every module in it.
+        """
+        self.assertEqual(self.index.affectedTests(['pkg/sub/__init__.py']),
+                         ['pkg.test.test_thing'])
+
+
+    def test_changedTestsExcluded(self):
+        """
+        The changed test modules themselves are left out, as are files which
+        are not Python modules.
+        """
+        self.assertEqual(
+            self.index.affectedTests(
+                ['pkg/test/test_base.py', 'pkg/other.py', 'README']),
+            ['pkg.test.test_other'])
+
+
+
+class RecordTestDependenciesScriptTests(unittest.TestCase):
+    """
+    Tests for the script run on the slave by L{RecordTestDependencies}.
+    """
+
+    files = {
+        'pkg/__init__.py': '',
+        'pkg/base.py': 'import os\n',
+        'pkg/util.py': 'from pkg import base\nimport pkg.sub.thing as thing\n',
+        'pkg/sub/__init__.py': 'from .thing import X\n',
+        'pkg/sub/thing.py': 'from ..base import Y\nfrom . import other\n',
+        'pkg/sub/other.py': 'def f(:\n',
+        'pkg/data/ignored.py': 'import pkg\n',
+        }
+
+    def test_imports(self):
+        """
+        The imports of each module in the package are found, including
+        relative imports, and resolved to modules in the package.  Modules
+        which cannot be parsed import nothing.
+        """
+        root = os.path.abspath(self.mktemp())
+        for path, content in self.files.items():
+            path = os.path.join(root, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').write(content)
+        process = subprocess.Popen(
+            [sys.executable, '-c', RecordTestDependencies.source, 'pkg',
+             'imports.json'],
+            cwd=root, stdout=subprocess.PIPE)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0)
+        self.assertEqual(output, '')
+        imports = open(os.path.join(root, 'imports.json')).read()
+        self.assertEqual(json.loads(imports), {
+            'pkg': [],
+            'pkg.base': [],
+            'pkg.util': ['pkg', 'pkg.base', 'pkg.sub.thing'],
+            'pkg.sub': ['pkg.sub.thing'],
+            'pkg.sub.thing': ['pkg.base', 'pkg.sub', 'pkg.sub.other'],
+            'pkg.sub.other': [],
+            })
+
+
+
+class RecordTestDependenciesTests(BuildStepMixin, unittest.TestCase):
+    """
+    Tests for L{RecordTestDependencies}.
+    """
+
+    setUp = BuildStepMixin.setUpBuildStep
+    tearDown = BuildStepMixin.tearDownBuildStep
+
+    def test_dependenciesLog(self):
+        """
+        The imports are read from the C{dependencies} log, which the slave
+        sends the file the script writes them to as, and stored in the
+        builder's index.
+        """
+        step = self.setupStep(RecordTestDependencies(python=['python']))
+        basedir = self.mktemp()
+        os.makedirs(basedir)
+        builder = FakeBuilderStatus(basedir, [])
+        step.build.build_status.getBuilder = lambda: builder
+        self.properties.setProperty('got_revision', 'abc', 'test')
+        imports = {'pkg': [], 'pkg.test.test_base': ['pkg']}
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command=step.command[:3] + [
+                            'twisted', '_test_dependencies.json'],
+                        logfiles={'dependencies': '_test_dependencies.json'})
+            + ExpectShell.log('stdio', stdout='')
+            + ExpectShell.log('dependencies', stdout=json.dumps(imports))
+            + 0)
+        self.expectOutcome(result=SUCCESS,
+                           status_text=['test', 'dependencies', 'of',
+                                        '2 modules'])
+        d = self.runStep()
+        def check(ignored):
+            index = TestDependencyIndex.forBuilder(builder)
+            self.assertEqual(index.affectedTests(['pkg/__init__.py']),
+                             ['pkg.test.test_base'])
+        d.addCallback(check)
+        return d
+
+
+
+class TrialAffectedTestsTests(BuildStepMixin, unittest.TestCase):
+    """
+    Tests for L{Trial} running the tests affected by the changes.
+    """
+
+    setUp = BuildStepMixin.setUpBuildStep
+    tearDown = BuildStepMixin.tearDownBuildStep
+
+    def setupTrial(self, files, imports):
+        # Trial does not record its factory arguments, as it is only ever
+        # added to factories in class form.
+        trial = Trial(testpath=None, testChanges=True)
+        trial.addFactoryArguments(testpath=None, testChanges=True)
+        step = self.setupStep(trial)
+        # The fake step only feeds the observers added after it is set up.
+        for logname, observer in step._pendingLogObservers:
+            step.addLogObserver(logname, observer)
+        basedir = self.mktemp()
+        os.makedirs(basedir)
+        builder = FakeBuilderStatus(basedir, [])
+        step.build.allFiles = lambda: files
+        step.build.build_status.getBuilder = lambda: builder
+        if imports is not None:
+            TestDependencyIndex.forBuilder(builder).store('abc', imports)
+
+
+    def test_affectedTests(self):
+        """
+        The changed files are given to trial with C{--testmodule}, followed by
+        the test modules which depend on them.
+        """
+        self.setupTrial(['pkg/base.py'], TestDependencyIndexTests.imports)
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command=['trial', '--reporter=bwverbose',
+                                 '--testmodule=pkg/base.py',
+                                 'pkg.test.test_base', 'pkg.test.test_util'],
+                        logfiles={'test.log': '_trial_temp/test.log'})
+            + ExpectShell.log('stdio', stdout='Ran 2 tests in 0.1s\n\nPASSED\n')
+            + 0)
+        self.expectOutcome(result=SUCCESS, status_text=['2 tests', 'passed'])
+        return self.runStep()
+
+
+    def test_noIndex(self):
+        """
+        Without an index, only the changed files are given to trial.
+        """
+        self.setupTrial(['pkg/base.py'], None)
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command=['trial', '--reporter=bwverbose',
+                                 '--testmodule=pkg/base.py'],
+                        logfiles={'test.log': '_trial_temp/test.log'})
+            + ExpectShell.log('stdio', stdout='Ran 1 tests in 0.1s\n\nPASSED\n')
+            + 0)
+        self.expectOutcome(result=SUCCESS, status_text=['1 test', 'passed'])
+        return self.runStep()
+
+
+    def test_nothingToRun(self):
+        """
+        When no Python files changed, the step is skipped.
+        """
+        self.setupTrial(['README'], TestDependencyIndexTests.imports)
+        self.expectOutcome(result=SKIPPED, status_text=['tests', 'skipped'])
+        return self.runStep()
+
+
+    def test_tooMany(self):
+        """
+        When more than C{maxAffectedTests} test modules are affected, the step
+        is skipped.
+        """
+        self.setupTrial(['pkg/base.py'], TestDependencyIndexTests.imports)
+        self.step.maxAffectedTests = 1
+        self.expectOutcome(result=SKIPPED, status_text=['tests', 'skipped'])
+        return self.runStep()
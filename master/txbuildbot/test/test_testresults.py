@@ -0,0 +1,116 @@
+from twisted.trial import unittest
+from twisted.python.filepath import FilePath
+
+from txbuildbot.testresults import TestResultStore
+
+
+
+class FakeBuilderStatus(object):
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+
+
+class TestResultStoreTests(unittest.TestCase):
+    """
+    Tests for L{TestResultStore}.
+    """
+
+    def setUp(self):
+        self.store = TestResultStore(FilePath(self.mktemp()))
+        self.addCleanup(self.store.close)
+
+
+    def recordRuns(self, builder, test, results, branch='trunk', step='trial'):
+        for build, result in enumerate(results):
+            self.store.record(builder, build, step, 'rev%d' % (build,), branch,
+                              [(test, result)])
+
+
+    def test_forBuilder(self):
+        """
+        The store is shared by the builders of a master.
+        """
+        self.assertEqual(
+            TestResultStore.forBuilder(FakeBuilderStatus('/m/builder1')).path,
+            FilePath('/m/test-results.sqlite'))
+
+
+    def test_history(self):
+        """
+        Each recorded result is kept, with its duration if it is known.
+        """
+        self.assertEqual(
+            self.store.record('b1', 3, 'trial', 'abc', 'trunk',
+                              [('a.test', 'OK'), ('b.test', 'FAILURE')],
+                              [('a.test', 1.5)]),
+            2)
+        self.store.record('b1', 4, 'trial', 'def', 'trunk',
+                          [('a.test', 'ERROR')])
+        self.store.close()
+        self.assertEqual(self.store.history('a.test'), [
+            ('b1', 3, 'trial', 'abc', 'trunk', 'OK', 1.5),
+            ('b1', 4, 'trial', 'def', 'trunk', 'ERROR', None)])
+        self.assertEqual(self.store.history('b.test'), [
+            ('b1', 3, 'trial', 'abc', 'trunk', 'FAILURE', None)])
+
+
+    def test_flakeRates(self):
+        """
+        The flake rate of a test is the fraction of its consecutive runs in
+        each builder where one passed and the other failed.  Skips are left
+        out.
+        """
+        self.recordRuns('b1', 'flaky',
+                        ['OK', 'FAILURE', 'OK', 'SKIPPED', 'OK'])
+        self.recordRuns('b2', 'flaky', ['OK', 'OK', 'ERROR'])
+        self.recordRuns('b1', 'broken',
+                        ['OK', 'FAILURE', 'FAILURE', 'FAILURE'])
+        self.recordRuns('b1', 'stable', ['OK', 'OK', 'OK', 'OK'])
+        self.assertEqual(self.store.flakeRates(minRuns=4), {
+            'flaky': (3 / 5.0, 7),
+            'broken': (1 / 3.0, 4),
+            })
+        self.assertEqual(self.store.flakeRates(minRuns=5),
+                         {'flaky': (3 / 5.0, 7)})
+
+
+    def test_branchesIgnored(self):
+        """
+        By default, only the builds of trunk are considered.
+        """
+        self.recordRuns('b1', 'test', ['OK', 'FAILURE', 'OK'],
+                        branch='feature')
+        self.assertEqual(self.store.flakeRates(minRuns=1), {})
+        self.assertEqual(self.store.failureStreaks(), {})
+        self.assertEqual(self.store.flakeRates(minRuns=1, trunkOnly=False),
+                         {'test': (1.0, 3)})
+
+
+    def test_failureStreaks(self):
+        """
+        The tests whose last runs failed are reported, with the number of
+        consecutive failures for each builder.
+        """
+        self.recordRuns('b1', 'broken', ['OK', 'FAILURE', 'ERROR', 'SKIPPED'])
+        self.recordRuns('b2', 'broken', ['FAILURE'])
+        self.recordRuns('b2', 'broken', ['OK'], step='other')
+        self.recordRuns('b1', 'fixed', ['FAILURE', 'OK'])
+        self.assertEqual(self.store.failureStreaks(), {
+            'broken': {('b1', 'trial'): 2, ('b2', 'trial'): 1}})
+
+
+    def test_maxBuilds(self):
+        """
+        Only the results of the C{maxBuilds} most recent builds of each step
+        of a builder are kept.
+        """
+        self.store.maxBuilds = 2
+        self.recordRuns('b1', 'test', ['OK', 'FAILURE', 'ERROR', 'OK'])
+        self.recordRuns('b1', 'test', ['OK'], step='other')
+        self.recordRuns('b2', 'test', ['OK'])
+        self.assertEqual(self.store.history('test'), [
+            ('b1', 0, 'other', 'rev0', 'trunk', 'OK', None),
+            ('b1', 2, 'trial', 'rev2', 'trunk', 'ERROR', None),
+            ('b1', 3, 'trial', 'rev3', 'trunk', 'OK', None),
+            ('b2', 0, 'trial', 'rev0', 'trunk', 'OK', None)])
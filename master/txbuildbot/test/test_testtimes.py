@@ -0,0 +1,322 @@
+import base64
+import json
+import os
+import subprocess
+import sys
+import zlib
+
+from twisted.trial import unittest
+from twisted.python.filepath import FilePath
+
+from txbuildbot.testtimes import TrialTestTimer, TestTimings, formatTimings
+from txbuildbot.testtimes import testModule, moduleDurations
+from twisted_steps import Trial, countFailedTests
+
+
+
+class TrialTestTimerTests(unittest.TestCase):
+    """
+    Tests for L{TrialTestTimer}.
+    """
+
+    def feed(self, output):
+        timer = TrialTestTimer()
+        for line in output.splitlines():
+            timer.outLineReceived(line)
+        return timer
+
+
+    def test_timings(self):
+        """
+        L{TrialTestTimer} pairs each test with the time printed after it.
+        """
+        timer = self.feed(
+            "twisted.test.test_a.ATests.test_one ... [OK]\n"
+            "(0.048 secs)\n"
+            "twisted.test.test_a.ATests.test_two ... [FAILURE]\n"
+            "(1.500 secs)\n")
+        self.assertEqual(timer.timings, [
+            ('twisted.test.test_a.ATests.test_one', 0.048),
+            ('twisted.test.test_a.ATests.test_two', 1.5)])
+
+
+    def test_results(self):
+        """
+        L{TrialTestTimer} collects the result of each test, with or without
+        timings.
+        """
+        timer = self.feed(
+            "twisted.test.test_a.ATests.test_one ... [OK]\n"
+            "(0.048 secs)\n"
+            "twisted.test.test_a.ATests.test_two ... [SUCCESS!?!]\n"
+            "twisted.test.test_a.ATests.test_three ... [ERROR]\n")
+        self.assertEqual(timer.results, [
+            ('twisted.test.test_a.ATests.test_one', 'OK'),
+            ('twisted.test.test_a.ATests.test_two', 'SUCCESS!?!'),
+            ('twisted.test.test_a.ATests.test_three', 'ERROR')])
+
+
+    def test_testOutput(self):
+        """
+        Output written by a test between its name and its time is ignored.
+        """
+        timer = self.feed(
+            "twisted.test.test_a.ATests.test_one ... printed\n"
+            "(2.000 secs)\n"
+            "[OK]\n"
+            "(0.250 secs)\n")
+        self.assertEqual(timer.timings, [
+            ('twisted.test.test_a.ATests.test_one', 2.0)])
+
+
+    def test_resultAfterOutput(self):
+        """
+        The result of a test which wrote output is on a line of its own.
+        """
+        timer = self.feed(
+            "twisted.test.test_a.ATests.test_one ... printed [1]\n"
+            "more output\n"
+            "[FAILURE]\n")
+        self.assertEqual(timer.results, [
+            ('twisted.test.test_a.ATests.test_one', 'FAILURE')])
+
+
+    def test_stopsAtSummary(self):
+        """
+        Nothing after the first separator line is collected.
+        """
+        timer = self.feed(
+            "twisted.test.test_a.ATests.test_one ... [OK]\n"
+            "(0.048 secs)\n"
+            + "=" * 79 + "\n"
+            "twisted.test.test_a.ATests.test_two ... [OK]\n"
+            "(1.500 secs)\n")
+        self.assertEqual(timer.timings, [
+            ('twisted.test.test_a.ATests.test_one', 0.048)])
+
+
+    def test_withoutTimes(self):
+        """
+        The output of C{--reporter=bwverbose} has no timings.
+        """
+        timer = self.feed(
+            "twisted.test.test_a.ATests.test_one ... [OK]\n"
+            "twisted.test.test_a.ATests.test_two ... [OK]\n")
+        self.assertEqual(timer.timings, [])
+
+
+    def test_slowest(self):
+        """
+        L{TrialTestTimer.slowest} returns the slowest tests, slowest first.
+        """
+        timer = TrialTestTimer()
+        timer.timings = [('a', 1.0), ('b', 3.0), ('c', 0.5), ('d', 2.0)]
+        self.assertEqual(timer.slowest(3), [('b', 3.0), ('d', 2.0), ('a', 1.0)])
+
+
+    def test_formatTimings(self):
+        """
+        L{formatTimings} writes one test per line, with its time first.
+        """
+        self.assertEqual(
+            formatTimings([('twisted.test.test_a', 12.5), ('b', 0.001)]),
+            "   12.500s  twisted.test.test_a\n"
+            "    0.001s  b\n")
+
+
+
+class ModuleDurationsTests(unittest.TestCase):
+    """
+    Tests for L{testModule} and L{moduleDurations}.
+    """
+
+    def test_testModule(self):
+        """
+        L{testModule} strips the test case class and method from a test name.
+        """
+        self.assertEqual(
+            testModule('twisted.test.test_defer.DeferredTests.test_callback'),
+            'twisted.test.test_defer')
+        self.assertEqual(testModule('pkg.test_x.lowercase.test_y'), 'pkg.test_x')
+
+
+    def test_moduleDurations(self):
+        """
+        L{moduleDurations} adds up the time of the tests in each module.
+        """
+        self.assertEqual(moduleDurations({
+            'pkg.test_a.ATests.test_one': 1.5,
+            'pkg.test_a.OtherTests.test_two': 0.5,
+            'pkg.test_b.BTests.test_one': 3.0,
+            }), {'pkg.test_a': 2.0, 'pkg.test_b': 3.0})
+
+
+
+class TestTimingsTests(unittest.TestCase):
+    """
+    Tests for L{TestTimings}.
+    """
+
+    def setUp(self):
+        self.timings = TestTimings(FilePath(self.mktemp()))
+
+
+    def test_missing(self):
+        """
+        There are no timings for builds which were not recorded.
+        """
+        self.assertIdentical(self.timings.get(1, 'trial'), None)
+
+
+    def test_roundtrip(self):
+        """
+        The timings recorded for a step of a build can be read back.
+        """
+        self.timings.record(3, 'trial', [('a', 1.5), ('b', 0.25)])
+        self.timings.record(3, 'trial_1', [('a', 2.0)])
+        self.assertEqual(self.timings.get(3, 'trial'), {'a': 1.5, 'b': 0.25})
+        self.assertEqual(self.timings.get(3, 'trial_1'), {'a': 2.0})
+
+
+    def test_unreadable(self):
+        """
+        Corrupt timings are ignored.
+        """
+        entry = self.timings.record(3, 'trial', [('a', 1.5)])
+        entry.setContent('{"tests": ')
+        self.assertIdentical(self.timings.get(3, 'trial'), None)
+
+
+    def test_removesOldest(self):
+        """
+        When more than C{maxEntries} timings are stored, those of the oldest
+        builds are removed.
+        """
+        self.timings.maxEntries = 2
+        for number in [9, 10, 11]:
+            self.timings.record(number, 'trial', [('a', float(number))])
+        self.assertIdentical(self.timings.get(9, 'trial'), None)
+        self.assertEqual(self.timings.get(10, 'trial'), {'a': 10.0})
+        self.assertEqual(self.timings.get(11, 'trial'), {'a': 11.0})
+        self.assertEqual(sorted(os.listdir(self.timings.path.path)),
+                         ['10-trial.json', '11-trial.json'])
+
+
+    def test_latest(self):
+        """
+        L{TestTimings.latest} returns the timings of a step in the most recent
+        build which recorded them.
+        """
+        self.timings.record(9, 'trial', [('a', 9.0)])
+        self.timings.record(10, 'trial', [('a', 10.0)])
+        self.timings.record(11, 'select-trial', [('a', 11.0)])
+        self.assertEqual(self.timings.latest('trial'), {'a': 10.0})
+        self.assertIdentical(self.timings.latest('iocp'), None)
+
+
+
+class ShardScriptTests(unittest.TestCase):
+    """
+    Tests for the script run on the slave by L{Trial} to run tests in shards.
+    """
+
+    # Stands in for trial: each test module has a passing test, and those in
+    # test_a also have a failing one.  The temporary directory is created.
+    fakeTrial = (
+        "import os, sys\n"
+        "for arg in sys.argv[1:]:\n"
+        "    if arg.startswith('--temp-directory='):\n"
+        "        os.mkdir(arg.split('=', 1)[1])\n"
+        "modules = [arg for arg in sys.argv[1:] if not arg.startswith('--')]\n"
+        "failed = [name for name in modules if name.endswith('test_a')]\n"
+        "for name in modules:\n"
+        "    print(name + '.Tests.test_one ... [OK]')\n"
+        "    print('(0.001 secs)')\n"
+        "    if name in failed:\n"
+        "        print(name + '.Tests.test_two ... [FAILURE]')\n"
+        "        print('(0.002 secs)')\n"
+        "print('')\n"
+        "for name in failed:\n"
+        "    print('=' * 79)\n"
+        "    print('[FAIL]')\n"
+        "    print('Traceback (most recent call last):')\n"
+        "    print('')\n"
+        "    print(name + '.Tests.test_two')\n"
+        "print('-' * 79)\n"
+        "print('Ran %d tests in 0.010s' % (len(modules) + len(failed),))\n"
+        "print('')\n"
+        "if failed:\n"
+        "    print('FAILED (failures=%d, successes=%d)' % (len(failed), len(modules)))\n"
+        "    sys.exit(1)\n"
+        "print('PASSED (successes=%d)' % (len(modules),))\n")
+
+    def setUp(self):
+        self.root = os.path.abspath(self.mktemp())
+        test = os.path.join(self.root, 'pkg', 'test')
+        os.makedirs(test)
+        for path in ['pkg/__init__.py', 'pkg/test/__init__.py',
+                     'pkg/test/test_a.py', 'pkg/test/test_b.py',
+                     'pkg/test/test_c.py', 'pkg/test/helpers.py']:
+            open(os.path.join(self.root, path), 'w').close()
+
+
+    def runShards(self, shards, durations, tests=['pkg']):
+        trial = [sys.executable, '-c', self.fakeTrial]
+        command = [sys.executable, '-c', Trial.shardSource, str(shards),
+                   base64.b64encode(zlib.compress(json.dumps(durations)))]
+        process = subprocess.Popen(
+            command + trial + ['--'] + tests, cwd=self.root,
+            stdout=subprocess.PIPE)
+        output = process.communicate()[0]
+        return process.returncode, output
+
+
+    def test_combined(self):
+        """
+        The outputs of the shards are combined into the output of a single
+        trial run, which fails if any shard failed.
+        """
+        rc, output = self.runShards(2, {'pkg.test.test_a': 5.0})
+        self.assertEqual(rc, 1)
+        counts = countFailedTests(output)
+        self.assertEqual(
+            (counts['total'], counts['failures'], counts['successes']),
+            (4, 1, 3))
+        self.assertEqual(output.count("Ran "), 1)
+        self.assertEqual(output.count("\n[FAIL]\n"), 1)
+
+        timer = TrialTestTimer()
+        for line in output.splitlines():
+            timer.outLineReceived(line)
+        self.assertEqual(
+            sorted([name for name, seconds in timer.timings]),
+            ['pkg.test.test_a.Tests.test_one',
+             'pkg.test.test_a.Tests.test_two',
+             'pkg.test.test_b.Tests.test_one',
+             'pkg.test.test_c.Tests.test_one'])
+
+
+    def test_balanced(self):
+        """
+        The slowest module gets a shard of its own, and each shard uses its own
+        temporary directory.
+        """
+        rc, output = self.runShards(
+            2, {'pkg.test.test_a': 5.0, 'pkg.test.test_b': 1.0})
+        lines = [line for line in output.splitlines() if 'test_one' in line]
+        self.assertEqual(lines, [
+            'pkg.test.test_a.Tests.test_one ... [OK]',
+            'pkg.test.test_b.Tests.test_one ... [OK]',
+            'pkg.test.test_c.Tests.test_one ... [OK]'])
+        self.assertTrue(os.path.isdir(os.path.join(self.root, '_trial_temp-1')))
+
+
+    def test_passed(self):
+        """
+        When every shard passes, the combined run passes.
+        """
+        rc, output = self.runShards(
+            4, {}, ['pkg.test.test_b', 'pkg.test.test_c'])
+        self.assertEqual(rc, 0)
+        self.assertEqual(output.splitlines()[-1], 'PASSED (successes=2)')
+        self.assertEqual(countFailedTests(output)['total'], 2)
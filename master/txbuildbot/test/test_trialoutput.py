@@ -0,0 +1,243 @@
+from twisted.trial import unittest
+
+from buildbot.status.builder import SUCCESS, FAILURE, WARNINGS, SKIPPED
+
+from txbuildbot.trialoutput import TrialOutputParser, parseTrialOutput
+from txbuildbot.trialoutput import TrailingOutput, TrialTestCaseCounter
+from txbuildbot.trialoutput import countFailedTests
+
+
+
+SEPARATOR = "=" * 79 + "\n"
+DASHES = "-" * 79 + "\n"
+
+PROBLEMS = (
+    SEPARATOR +
+    "FAILURE: testBatchFile (twisted.conch.test.test_sftp.TestBatchFile)\n" +
+    DASHES +
+    "Traceback (most recent call last):\n"
+    "FailTest: not equal\n" +
+    SEPARATOR +
+    "SKIPPED: testRETR (twisted.test.test_ftp.TestFTPServer)\n" +
+    DASHES +
+    "no server\n" +
+    SEPARATOR +
+    "WEIRD: testOdd (twisted.test.test_odd.Tests)\n" +
+    DASHES +
+    "odd\n" +
+    DASHES +
+    "Ran 12 tests in 0.242s\n"
+    "\n"
+    "FAILED (skips=1, failures=1, successes=10)\n")
+
+
+
+class CountFailedTestsTests(unittest.TestCase):
+    """
+    Tests for L{countFailedTests}.
+    """
+
+    def test_failed(self):
+        counts = countFailedTests(PROBLEMS)
+        self.assertEqual(counts, {
+            'total': 12, 'failures': 1, 'errors': 0, 'skips': 1,
+            'expectedFailures': 0, 'unexpectedSuccesses': 0,
+            'successes': 10})
+
+
+    def test_passed(self):
+        counts = countFailedTests(
+            "Ran 3 tests in 0.1s\n\n"
+            "PASSED (expectedFailures=1, unexpectedSuccesses=2, "
+            "successes=3)\n")
+        self.assertEqual(
+            (counts['total'], counts['expectedFailures'],
+             counts['unexpectedSuccesses'], counts['successes']),
+            (3, 1, 2, 3))
+
+
+    def test_tracebacksAfterTotal(self):
+        """
+        Output between the total and the status line is skipped, and the
+        names of individual failed tests are not mistaken for the status.
+        """
+        counts = countFailedTests(
+            "test_a ... [FAIL]\n"
+            "Ran 2 tests in 0.1s\n"
+            "FAILED (errors=9)\n"
+            "Traceback (most recent call last):\n"
+            "ImportError: no module named errors=3\n"
+            "\n"
+            "FAILED (errors=1, failures=1)\n")
+        self.assertEqual((counts['total'], counts['errors'],
+                          counts['failures']), (2, 1, 1))
+        self.assertNotIn('successes', counts)
+
+
+    def test_unparseable(self):
+        counts = countFailedTests("Traceback (most recent call last):\n")
+        self.assertIdentical(counts['total'], None)
+        self.assertEqual(counts['failures'], 0)
+
+
+    def test_incompleteLastLine(self):
+        """
+        A last line without a newline is ignored.
+        """
+        counts = countFailedTests("Ran 2 tests in 0.1s\n\nFAILED (errors=1)")
+        self.assertEqual((counts['total'], counts['errors']), (2, 0))
+
+
+
+class TrialTestCaseCounterTests(unittest.TestCase):
+    """
+    Tests for L{TrialTestCaseCounter}.
+    """
+
+    def test_progress(self):
+        """
+        Each per-test line reports the number of tests run as progress, until
+        the report of the problems.
+        """
+        progress = []
+        counter = TrialTestCaseCounter()
+        counter.step = self
+        self.setProgress = lambda metric, value: progress.append(
+            (metric, value))
+        for line in ["twisted.test.test_a.ATests.test_one ... [OK]",
+                     "printed by a test",
+                     "  twisted.test.test_a.ATests.test_two ... [FAIL]\r",
+                     "=" * 79,
+                     "twisted.test.test_a.ATests.test_two ... [OK]"]:
+            counter.outLineReceived(line)
+        self.assertEqual(progress, [('tests', 1), ('tests', 2)])
+
+
+
+class TrialOutputParserTests(unittest.TestCase):
+    """
+    Tests for L{TrialOutputParser} and L{parseTrialOutput}.
+    """
+
+    def test_problems(self):
+        """
+        Everything from the first separator line on is the report of the
+        problems.
+        """
+        parser = parseTrialOutput(
+            "twisted.test.test_a.ATests.test_one ... [OK]\n" + PROBLEMS)
+        self.assertEqual(parser.getProblems(), PROBLEMS)
+
+
+    def test_noProblems(self):
+        parser = parseTrialOutput(
+            "twisted.test.test_a.ATests.test_one ... [OK]\n")
+        self.assertEqual(parser.getProblems(), "")
+        self.assertEqual(parser.results, [])
+
+
+    def test_results(self):
+        """
+        Each block of the report gives the result of a test, and its log.
+        """
+        parser = parseTrialOutput(PROBLEMS)
+        self.assertEqual(parser.results, [
+            (('twisted', 'conch', 'test', 'test_sftp', 'TestBatchFile',
+              'testBatchFile'), FAILURE, ['failure'],
+             "FAILURE: testBatchFile "
+             "(twisted.conch.test.test_sftp.TestBatchFile)\n" + DASHES +
+             "Traceback (most recent call last):\n"
+             "FailTest: not equal\n"),
+            (('twisted', 'test', 'test_ftp', 'TestFTPServer', 'testRETR'),
+             SKIPPED, ['skipped'],
+             "SKIPPED: testRETR (twisted.test.test_ftp.TestFTPServer)\n" +
+             DASHES + "no server\n"),
+            (('twisted', 'test', 'test_odd', 'Tests', 'testOdd'),
+             WARNINGS, ['weird'],
+             "WEIRD: testOdd (twisted.test.test_odd.Tests)\n" +
+             DASHES + "odd\n"),
+            ])
+
+
+    def test_lastTestAtEnd(self):
+        """
+        A test at the end of truncated output is still reported.
+        """
+        parser = parseTrialOutput(
+            SEPARATOR +
+            "EXPECTED FAILURE: testLack (twisted.test.test_failure.Tests)\n" +
+            DASHES +
+            "todo")
+        self.assertEqual(parser.results, [
+            (('twisted', 'test', 'test_failure', 'Tests', 'testLack'),
+             SUCCESS, ['expected', 'failure'],
+             "EXPECTED FAILURE: testLack (twisted.test.test_failure.Tests)\n" +
+             DASHES + "todo")])
+
+
+    def test_warnings(self):
+        """
+        Warnings before the report of the problems are counted.  Deprecation
+        and user warnings include the source line which follows them.
+        """
+        parser = parseTrialOutput(
+            "a.py:1: exceptions.DeprecationWarning: old\n"
+            "b.py:2: DeprecationWarning: older\n"
+            "  old()\n"
+            "c.py:3: UserWarning: careful\n"
+            "  careful()\n"
+            "d.py:4: RuntimeWarning: odd\n"
+            "a.py:1: exceptions.DeprecationWarning: old\n" +
+            SEPARATOR +
+            "e.py:5: RuntimeWarning: ignored\n")
+        self.assertEqual(parser.warnings, {
+            "a.py:1: exceptions.DeprecationWarning: old\n": 2,
+            "b.py:2: DeprecationWarning: older\n  old()\n": 1,
+            "c.py:3: UserWarning: careful\n  careful()\n": 1,
+            "d.py:4: RuntimeWarning: odd\n": 1,
+            })
+
+
+    def test_warningAtEnd(self):
+        """
+        A deprecation warning at the end of the output has no source line.
+        """
+        parser = TrialOutputParser()
+        parser.lineReceived("b.py:2: DeprecationWarning: older\n")
+        parser.finish()
+        self.assertEqual(parser.warnings,
+                         {"b.py:2: DeprecationWarning: older\n": 1})
+
+
+
+class TrailingOutputTests(unittest.TestCase):
+    """
+    Tests for L{TrailingOutput}.
+    """
+
+    def test_short(self):
+        """
+        Output shorter than C{maxSize} is kept whole, stdout and stderr in the
+        order received.
+        """
+        tail = TrailingOutput()
+        tail.outReceived("Ran 1 tests")
+        tail.errReceived(" warning\n")
+        tail.outReceived("\nPASSED\n")
+        self.assertEqual(tail.getText(), "Ran 1 tests warning\n\nPASSED\n")
+
+
+    def test_trailing(self):
+        """
+        Only the last C{maxSize} characters are returned, and the chunks which
+        are not needed for them are dropped.
+        """
+        tail = TrailingOutput()
+        tail.maxSize = 10
+        output = ""
+        for n in range(20):
+            chunk = str(n) * 4
+            output += chunk
+            tail.outReceived(chunk)
+            self.assertEqual(tail.getText(), output[-10:])
+        self.assertEqual(list(tail._chunks), ["18181818", "19191919"])
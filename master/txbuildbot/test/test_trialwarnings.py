@@ -0,0 +1,176 @@
+import os
+
+from twisted.trial import unittest
+from twisted.python.filepath import FilePath
+from buildbot.status.results import SUCCESS
+from buildbot.test.util.steps import BuildStepMixin
+from buildbot.test.fake.remotecommand import ExpectShell
+
+from txbuildbot.trialwarnings import (
+    WarningIndex, formatWarnings, normalizeWarnings, slaveDirectories)
+from txbuildbot.test.test_lint import FakeBuilderStatus
+from twisted_steps import Trial
+
+
+
+class NormalizeWarningsTests(unittest.TestCase):
+    """
+    Tests for L{slaveDirectories}, L{normalizeWarnings} and
+    L{formatWarnings}.
+    """
+
+    def test_slaveDirectories(self):
+        self.assertEqual(
+            slaveDirectories('/slave/debian8', 'Twisted'),
+            ['/slave/debian8/Twisted/', '/slave/debian8/'])
+        self.assertEqual(
+            slaveDirectories('C:\\slave\\win7\\', 'Twisted/build'),
+            ['C:\\slave\\win7\\Twisted\\build\\', 'C:\\slave\\win7\\'])
+        self.assertEqual(slaveDirectories(None, 'Twisted'), [])
+
+
+    def test_normalize(self):
+        """
+        The directories are removed, the longest first, and the counts of
+        warnings which become the same are added up.
+        """
+        self.assertEqual(
+            normalizeWarnings({
+                "/s/b1/Twisted/twisted/a.py:1: DeprecationWarning: x\n": 2,
+                "/s/b2/Twisted/twisted/a.py:1: DeprecationWarning: x\n": 3,
+                "/s/b1/venv/site.py:9: UserWarning: y\n  y()\n": 1,
+                }, ['/s/b1/', '/s/b1/Twisted/', '/s/b2/Twisted/']),
+            {"twisted/a.py:1: DeprecationWarning: x\n": 5,
+             "venv/site.py:9: UserWarning: y\n  y()\n": 1})
+
+
+    def test_format(self):
+        self.assertEqual(
+            formatWarnings({"b: Warning: y\n": 1,
+                            "a: UserWarning: x\n  x()\n": 12}),
+            "   12  a: UserWarning: x\n  x()\n"
+            "    1  b: Warning: y\n")
+
+
+
+class WarningIndexTests(unittest.TestCase):
+    """
+    Tests for L{WarningIndex}.
+    """
+
+    def setUp(self):
+        self.index = WarningIndex(FilePath(self.mktemp()))
+
+
+    def test_empty(self):
+        self.assertFalse(self.index.exists())
+        self.assertEqual(self.index.newWarnings(['a']), ['a'])
+        self.assertIdentical(self.index.firstSeen('a'), None)
+
+
+    def test_unreadable(self):
+        self.index.path.setContent('{')
+        self.assertEqual(self.index.newWarnings(['a']), ['a'])
+
+
+    def test_firstSeen(self):
+        """
+        The revision a warning was first seen in is kept for as long as it is
+        seen.
+        """
+        self.index.record('r1', 1, ['a'])
+        self.index.record('r2', 2, ['a', 'b'])
+        self.assertTrue(self.index.exists())
+        self.assertEqual(self.index.firstSeen('a'), 'r1')
+        self.assertEqual(self.index.firstSeen('b'), 'r2')
+        self.assertEqual(self.index.newWarnings(['c', 'b', 'a', 'd']),
+                         ['c', 'd'])
+
+
+    def test_forgotten(self):
+        """
+        Warnings not seen for C{maxAge} builds are forgotten.
+        """
+        self.index.maxAge = 2
+        self.index.record('r1', 1, ['a', 'b'])
+        self.index.record('r2', 2, ['a'])
+        self.assertEqual(self.index.newWarnings(['a', 'b']), [])
+        self.index.record('r3', 3, ['a'])
+        self.assertEqual(self.index.newWarnings(['a', 'b']), ['b'])
+        self.index.record('r4', 4, ['b'])
+        self.assertEqual(self.index.firstSeen('b'), 'r4')
+        self.assertEqual(self.index.firstSeen('a'), 'r1')
+
+
+
+class TrialWarningsTests(BuildStepMixin, unittest.TestCase):
+    """
+    Tests for the warnings reported by L{Trial}.
+    """
+
+    setUp = BuildStepMixin.setUpBuildStep
+    tearDown = BuildStepMixin.tearDownBuildStep
+
+    output = (
+        "/s/b1/wkdir/twisted/a.py:1: DeprecationWarning: old\n"
+        "  old()\n"
+        "/s/b1/wkdir/twisted/b.py:2: RuntimeWarning: odd\n"
+        "/s/b1/wkdir/twisted/b.py:2: RuntimeWarning: odd\n"
+        "Ran 2 tests in 0.1s\n\nPASSED (successes=2)\n")
+
+    def runTrial(self, branch, knownWarnings=None):
+        # Trial does not record its factory arguments, as it is only ever
+        # added to factories in class form.
+        trial = Trial(testpath=None, tests='twisted')
+        trial.addFactoryArguments(testpath=None, tests='twisted')
+        step = self.setupStep(trial)
+        for logname, observer in step._pendingLogObservers:
+            step.addLogObserver(logname, observer)
+        basedir = self.mktemp()
+        os.makedirs(basedir)
+        builder = FakeBuilderStatus(basedir, [])
+        step.build.build_status.getBuilder = lambda: builder
+        step.build.build_status.getNumber = lambda: 5
+        self.properties.setProperty('workdir', '/s/b1', 'slave')
+        self.properties.setProperty('branch', branch, 'test')
+        self.properties.setProperty('got_revision', 'abc', 'test')
+        self.index = WarningIndex.forBuilder(builder)
+        if knownWarnings is not None:
+            self.index.record('r1', 1, knownWarnings)
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command=['trial', '--reporter=bwverbose', 'twisted'],
+                        logfiles={'test.log': '_trial_temp/test.log'})
+            + ExpectShell.log('stdio', stdout=self.output)
+            + 0)
+
+
+    def test_trunk(self):
+        """
+        Trunk builds log the normalized warnings with their counts, and record
+        them in the index.
+        """
+        self.runTrial('trunk')
+        self.expectOutcome(result=SUCCESS, status_text=['2 tests', 'passed'])
+        self.expectLogfile('warnings',
+            "    1  twisted/a.py:1: DeprecationWarning: old\n  old()\n"
+            "    2  twisted/b.py:2: RuntimeWarning: odd\n")
+        d = self.runStep()
+        def check(ignored):
+            self.assertEqual(
+                self.index.firstSeen("twisted/b.py:2: RuntimeWarning: odd\n"),
+                'abc')
+        return d.addCallback(check)
+
+
+    def test_newWarnings(self):
+        """
+        Builds of branches report the warnings which are not in the index.
+        """
+        self.runTrial('feature',
+                      ["twisted/a.py:1: DeprecationWarning: old\n  old()\n"])
+        self.expectOutcome(result=SUCCESS,
+                           status_text=['2 tests', 'passed', '1 new warning'])
+        self.expectLogfile('new warnings',
+            "    2  twisted/b.py:2: RuntimeWarning: odd\n")
+        return self.runStep()
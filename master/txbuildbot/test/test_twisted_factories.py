@@ -0,0 +1,131 @@
+import os
+import stat
+import subprocess
+
+from twisted.trial import unittest
+
+from twisted_factories import (
+    CPythonBuildFactory, FullTwistedBuildFactory, PyPyTranslationFactory,
+    TRIAL_FLAGS, TIMING_FLAGS)
+
+
+
+class IncrementalCPythonBuildTests(unittest.TestCase):
+    """
+    Tests for the commands run by L{CPythonBuildFactory} with C{incremental}.
+    """
+
+    # Stands in for configure: it writes the Makefile, and counts its runs.
+    fakeConfigure = (
+        "#!/bin/sh\n"
+        "echo x >> runs\n"
+        "echo \"$@\" > Makefile\n")
+
+    def setUp(self):
+        self.tree = os.path.abspath(self.mktemp())
+        os.makedirs(self.tree)
+        self.write('configure', self.fakeConfigure)
+        os.chmod(os.path.join(self.tree, 'configure'), stat.S_IRWXU)
+        self.write('Makefile.pre.in', 'all:\n')
+
+
+    def write(self, name, content):
+        open(os.path.join(self.tree, name), 'w').write(content)
+
+
+    def configure(self):
+        subprocess.check_call(
+            ['/bin/sh', '-c',
+             CPythonBuildFactory.incrementalConfigureCommand],
+            cwd=self.tree, stdout=open(os.devnull, 'w'))
+        return len(open(os.path.join(self.tree, 'runs')).readlines())
+
+
+    def test_unchanged(self):
+        """
+        configure is only run once while its inputs do not change.
+        """
+        self.assertEqual(self.configure(), 1)
+        self.assertEqual(self.configure(), 1)
+        self.assertEqual(
+            open(os.path.join(self.tree, 'Makefile')).read(),
+            '--prefix=%s/install\n' % (self.tree,))
+
+
+    def test_changed(self):
+        """
+        configure is run again when configure or Makefile.pre.in change, or
+        when the Makefile is missing.
+        """
+        self.configure()
+        self.write('Makefile.pre.in', 'all: python\n')
+        self.assertEqual(self.configure(), 2)
+        self.write('configure', self.fakeConfigure + '# changed\n')
+        self.assertEqual(self.configure(), 3)
+        os.remove(os.path.join(self.tree, 'Makefile'))
+        self.assertEqual(self.configure(), 4)
+
+
+    def test_steps(self):
+        """
+        The incremental build updates the checkout in place, and runs make
+        with a job per CPU.
+        """
+        factory = CPythonBuildFactory(
+            'default', 'python2.7', [], incremental=True)
+        checkout, configure, install = [
+            kwargs for step, kwargs in factory.steps[:3]]
+        self.assertEqual(checkout['mode'], 'update')
+        self.assertEqual(configure['command'],
+                         CPythonBuildFactory.incrementalConfigureCommand)
+        self.assertIn('make -j', install['command'])
+
+
+
+class PyPyTranslationFactoryTests(unittest.TestCase):
+    """
+    Tests for L{PyPyTranslationFactory}.
+    """
+
+    def test_installPrefix(self):
+        """
+        The projects are installed in a prefix of their own, which the
+        checkout's C{site-packages} directory points at.
+        """
+        factory = PyPyTranslationFactory([], [], ['dep-1'])
+        steps = dict((kwargs.get('name'), kwargs)
+                     for step, kwargs in factory.steps)
+        self.assertEqual(steps['install-dep-1']['prefix'], 'build/install')
+        path = steps['add-install-path']
+        self.assertEqual(path['slavedest'], 'site-packages/install.pth')
+        self.assertEqual(
+            os.path.normpath(os.path.join('build', 'site-packages',
+                                          path['s'].strip())),
+            'build/install/site-packages')
+
+
+
+class TestTimingsTests(unittest.TestCase):
+    """
+    Tests for the C{testTimings} option of the Twisted build factories.
+    """
+
+    def trialMode(self, **kwargs):
+        factory = FullTwistedBuildFactory([], python=["python"],
+                                          uncleanWarnings=False, **kwargs)
+        return factory.getTrialMode()
+
+
+    def test_default(self):
+        """
+        The default reporter is used unless the timings are wanted.
+        """
+        self.assertEqual(self.trialMode(), TRIAL_FLAGS)
+        self.assertEqual(self.trialMode(testTimings=True), TIMING_FLAGS)
+
+
+    def test_shards(self):
+        """
+        Sharding needs the timings.
+        """
+        self.assertEqual(self.trialMode(trialShards=4), TIMING_FLAGS)
@@ -0,0 +1,192 @@
+import os
+import subprocess
+import sys
+
+from twisted.trial import unittest
+from buildbot.status.results import FAILURE
+from buildbot.test.util.steps import BuildStepMixin
+from buildbot.test.fake.remotecommand import ExpectShell
+
+from twisted_factories import TwistedReactorsBuildFactory
+from twisted_steps import Trial, RunReactorsConcurrently
+from txbuildbot.testresults import TestResultStore
+from txbuildbot.test.test_lint import FakeBuilderStatus
+
+
+
+class ConcurrentReactorsScriptTests(unittest.TestCase):
+    """
+    Tests for the scripts run on the slave by L{RunReactorsConcurrently} and
+    by L{Trial} with C{concurrent}.
+    """
+
+    # Stands in for trial: it prints its reactor and temporary directory,
+    # which it creates, and fails with the poll reactor.
+    fakeTrial = (
+        "import os, sys\n"
+        "args = dict(arg.split('=', 1) for arg in sys.argv[1:]\n"
+        "            if arg.startswith('--'))\n"
+        "os.mkdir(args['--temp-directory'])\n"
+        "print(args['--reactor'] + ' ' + args['--temp-directory'])\n"
+        "print(' '.join([arg for arg in sys.argv[1:]\n"
+        "                if not arg.startswith('--')]))\n"
+        "sys.exit(args['--reactor'] == 'poll')\n")
+
+    def setUp(self):
+        self.root = os.path.abspath(self.mktemp())
+        os.makedirs(os.path.join(self.root, '_trial_temp-select'))
+        open(os.path.join(self.root, '_trial_temp-poll.rc'), 'w').write('7\n')
+
+
+    def runScript(self, command):
+        process = subprocess.Popen(command, cwd=self.root,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        return process.returncode, stdout, stderr
+
+
+    def runReactors(self):
+        return self.runScript(
+            [sys.executable, '-c', RunReactorsConcurrently.source,
+             'select,poll', sys.executable, '-c', self.fakeTrial, '--',
+             'twisted.test', 'twisted.python'])
+
+
+    def test_runReactors(self):
+        """
+        Trial is run with each reactor, in its own temporary directory, and
+        the exit status and last line of each run are reported.
+        """
+        rc, stdout, stderr = self.runReactors()
+        self.assertEqual(rc, 0)
+        lines = sorted(stdout.splitlines())
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('poll: exit status 1 after '))
+        self.assertTrue(lines[0].endswith(': twisted.test twisted.python'))
+        self.assertTrue(lines[1].startswith('select: exit status 0 after '))
+        for reactor in ['select', 'poll']:
+            self.assertTrue(os.path.isdir(
+                os.path.join(self.root, '_trial_temp-' + reactor)))
+
+
+    def test_collect(self):
+        """
+        The output and exit status of the run with a reactor are reported.
+        """
+        self.runReactors()
+        rc, stdout, stderr = self.runScript(
+            [sys.executable, '-c', Trial.collectSource, '_trial_temp-poll'])
+        self.assertEqual(rc, 1)
+        self.assertEqual(stdout.splitlines(),
+                         ['poll _trial_temp-poll',
+                          'twisted.test twisted.python'])
+
+
+    def test_collectMissing(self):
+        """
+        When the run with a reactor left no results, the step fails.
+        """
+        rc, stdout, stderr = self.runScript(
+            [sys.executable, '-c', Trial.collectSource, '_trial_temp-epoll'])
+        self.assertEqual(rc, 1)
+        self.assertEqual(stdout, '')
+        self.assertIn('_trial_temp-epoll', stderr)
+
+
+
+class ConcurrentTrialTests(BuildStepMixin, unittest.TestCase):
+    """
+    Tests for L{Trial} with C{concurrent}, and L{RunReactorsConcurrently}.
+    """
+
+    setUp = BuildStepMixin.setUpBuildStep
+    tearDown = BuildStepMixin.tearDownBuildStep
+
+    def test_runReactors(self):
+        """
+        Trial is run by the interpreter of the builder, with its flags.
+        """
+        factory = TwistedReactorsBuildFactory(
+            source=[], python=['python2.7', '-Wall'],
+            reactors=['select', 'poll'], concurrentReactors=True)
+        [kwargs] = [kwargs for step, kwargs in factory.steps
+                    if step is RunReactorsConcurrently]
+        self.setupStep(RunReactorsConcurrently(**kwargs))
+        command = self.step.command
+        self.assertEqual(command[:3], ['python2.7', '-Wall', '-c'])
+        self.assertEqual(
+            command[4:8],
+            ['select,poll', 'python2.7', '-Wall', './bin/trial'])
+        self.assertEqual(command[-2], '--')
+        self.assertEqual(self.step.logfiles, {
+            'test.log-select': '_trial_temp-select/test.log',
+            'test.log-poll': '_trial_temp-poll/test.log'})
+
+
+    def test_collect(self):
+        """
+        L{Trial} with C{concurrent} runs the collecting script, and reports
+        the results as if it ran trial.
+        """
+        # Trial does not record its factory arguments, as it is only ever
+        # added to factories in class form.
+        kwargs = dict(testpath=None, tests='twisted', reactor='poll',
+                      concurrent=True, python=['python'])
+        trial = Trial(**kwargs)
+        trial.addFactoryArguments(**kwargs)
+        self.setupStep(trial)
+        # The fake step only feeds the observers added after it is set up.
+        for logname, observer in self.step._pendingLogObservers:
+            self.step.addLogObserver(logname, observer)
+        basedir = self.mktemp()
+        os.makedirs(basedir)
+        builder = FakeBuilderStatus(basedir, [])
+        self.step.build.build_status.getBuilder = lambda: builder
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command=trial.collectCommand(), logfiles={})
+            + ExpectShell.log('stdio', stdout=(
+                "Ran 3 tests in 0.1s\n\nFAILED (failures=1, successes=2)\n"))
+            + 1)
+        self.expectOutcome(result=FAILURE,
+                           status_text=['tests', '1 failure', '(poll)'])
+        return self.runStep()
+
+
+
+class RecordResultsTests(BuildStepMixin, unittest.TestCase):
+    """
+    Tests for L{Trial.recordResults}.
+    """
+
+    setUp = BuildStepMixin.setUpBuildStep
+    tearDown = BuildStepMixin.tearDownBuildStep
+
+    def test_recordResults(self):
+        """
+        The results are appended to the master's L{TestResultStore} in a
+        thread.
+        """
+        trial = Trial(testpath=None, tests='twisted')
+        trial.addFactoryArguments(testpath=None, tests='twisted')
+        step = self.setupStep(trial)
+        basedir = os.path.join(self.mktemp(), 'builder')
+        os.makedirs(basedir)
+        builder = FakeBuilderStatus(basedir, [])
+        builder.getName = lambda: 'b1'
+        step.build.build_status.getBuilder = lambda: builder
+        step.build.build_status.getNumber = lambda: 7
+        self.properties.setProperty('got_revision', 'abc', 'test')
+        self.properties.setProperty('branch', 'trunk', 'test')
+        d = step.recordResults([('a.test', 'OK'), ('b.test', 'FAILURE')],
+                               [('a.test', 0.5)])
+        def check(ignored):
+            store = TestResultStore.forBuilder(builder)
+            self.addCleanup(store.close)
+            self.assertEqual(store.history('b.test'), [
+                ('b1', 7, 'trial', 'abc', 'trunk', 'FAILURE', None)])
+            self.assertEqual(store.failureStreaks(),
+                             {'b.test': {('b1', 'trial'): 1}})
+        d.addCallback(check)
+        return d
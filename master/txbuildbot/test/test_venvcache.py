@@ -0,0 +1,160 @@
+import os
+import stat
+import subprocess
+import sys
+
+from twisted.trial import unittest
+
+from txbuildbot.venvcache import CachedVirtualEnv
+
+
+
+class CachedVirtualEnvScriptTests(unittest.TestCase):
+    """
+    Tests for the script run on the slave by L{CachedVirtualEnv}.
+    """
+
+    # Stands in for virtualenv: it creates the directory of the virtualenv,
+    # with a pip which records its arguments and writes a 1000 byte file.
+    fakeVirtualEnv = (
+        "#!%(python)s\n"
+        "import os, sys\n"
+        "env = sys.argv[-1]\n"
+        "os.makedirs(os.path.join(env, 'bin'))\n"
+        "pip = os.path.join(env, 'bin', 'pip')\n"
+        "open(pip, 'w').write(\n"
+        "    '#!%(python)s\\n'\n"
+        "    'import os, sys\\n'\n"
+        "    'env = os.path.dirname(os.path.dirname(sys.argv[0]))\\n'\n"
+        "    'open(os.path.join(env, \"installed\"), \"w\").write(\\n'\n"
+        "    '    \" \".join(sys.argv[1:]) + \" \" * 1000)\\n')\n"
+        "os.chmod(pip, 0o755)\n"
+        "open(os.path.join(env, 'created'), 'a').write('x')\n")
+
+    def setUp(self):
+        self.root = os.path.abspath(self.mktemp())
+        self.workdir = os.path.join(self.root, 'Twisted')
+        os.makedirs(self.workdir)
+        bin = os.path.join(self.root, 'bin')
+        os.makedirs(bin)
+        virtualenv = os.path.join(bin, 'virtualenv')
+        open(virtualenv, 'w').write(
+            self.fakeVirtualEnv % {'python': sys.executable})
+        os.chmod(virtualenv, stat.S_IRWXU)
+        self.env = dict(os.environ)
+        self.env['PATH'] = bin + os.pathsep + self.env.get('PATH', '')
+
+
+    def prepare(self, requirements, maxSize=10 ** 6):
+        process = subprocess.Popen(
+            [sys.executable, '-c', CachedVirtualEnv.source,
+             '../venv-cache', '../venv', str(maxSize)] + requirements,
+            cwd=self.workdir, env=self.env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0, stderr)
+        return stdout
+
+
+    def venv(self, *path):
+        return os.path.join(self.root, 'venv', *path)
+
+
+    def cached(self):
+        return sorted(os.listdir(os.path.join(self.root, 'venv-cache')))
+
+
+    def test_create(self):
+        """
+        The virtualenv is created in the cache, with the requirements
+        installed, and linked to.
+        """
+        output = self.prepare(['b==2', 'a==1'])
+        self.assertIn('Creating the virtualenv', output)
+        self.assertTrue(os.path.islink(self.venv()))
+        self.assertEqual(len(self.cached()), 1)
+        self.assertTrue(open(self.venv('installed')).read().startswith(
+            'install a==1 b==2 '))
+
+
+    def test_reuse(self):
+        """
+        The virtualenv is reused while the requirements are the same.
+        """
+        self.prepare(['a==1', 'b==2'])
+        output = self.prepare(['b==2', 'a==1'])
+        self.assertIn('Using the cached virtualenv', output)
+        self.assertEqual(open(self.venv('created')).read(), 'x')
+        self.assertEqual(len(self.cached()), 1)
+
+
+    def test_changedRequirements(self):
+        """
+        Another virtualenv is used when the requirements change, and the
+        previous one is kept.
+        """
+        self.prepare(['a==1'])
+        first = os.path.realpath(self.venv())
+        self.prepare(['a==2'])
+        self.assertNotEqual(os.path.realpath(self.venv()), first)
+        self.assertTrue(open(self.venv('installed')).read().startswith(
+            'install a==2 '))
+        self.assertEqual(len(self.cached()), 2)
+        self.prepare(['a==1'])
+        self.assertEqual(os.path.realpath(self.venv()), first)
+
+
+    def test_incomplete(self):
+        """
+        A virtualenv whose requirements were not all installed is created
+        again.
+        """
+        self.prepare(['a==1'])
+        env = os.path.realpath(self.venv())
+        os.remove(os.path.join(env, '.requirements-installed'))
+        self.assertIn('Creating the virtualenv', self.prepare(['a==1']))
+        self.assertEqual(open(self.venv('created')).read(), 'x')
+
+
+    def test_replaceDirectory(self):
+        """
+        A virtualenv created in place by previous builds is replaced by the
+        link.
+        """
+        os.makedirs(self.venv('bin'))
+        self.prepare(['a==1'])
+        self.assertTrue(os.path.islink(self.venv()))
+
+
+    def test_evict(self):
+        """
+        The least recently used virtualenvs are removed when the cache is too
+        big, but never the one in use.
+        """
+        self.prepare(['a==1'], maxSize=3000)
+        first = os.path.realpath(self.venv())
+        self.prepare(['a==2'], maxSize=3000)
+        # Make the first virtualenv the most recently used.
+        self.prepare(['a==1'], maxSize=3000)
+        output = self.prepare(['a==3'], maxSize=3000)
+        self.assertIn('Removing the cached virtualenv', output)
+        self.assertEqual(len(self.cached()), 2)
+        self.assertIn(os.path.basename(first), self.cached())
+        self.prepare(['a==4'], maxSize=10)
+        self.assertEqual(self.cached(),
+                         [os.path.basename(os.path.realpath(self.venv()))])
+
+
+
+class CachedVirtualEnvTests(unittest.TestCase):
+    """
+    Tests for L{CachedVirtualEnv}.
+    """
+
+    def test_command(self):
+        step = CachedVirtualEnv(python=['python2.7'], path='../venv',
+                                requirements=['twistedchecker==0.4.0'],
+                                maxSize=1000)
+        self.assertEqual(step.command[:2], ['python2.7', '-c'])
+        self.assertEqual(step.command[3:], [
+            '../venv-cache', '../venv', '1000', 'twistedchecker==0.4.0'])
@@ -0,0 +1,267 @@
+"""
+An index of which test modules depend on which modules of the source tree,
+used to run the tests affected by a change first.
+
+L{RecordTestDependencies} finds the imports of every module in the tree on
+trunk builds, and keeps them in the builder's status directory as a
+L{TestDependencyIndex}.  Branch builds then use the index to find the test
+modules which import a changed module, directly or not.
+"""
+
+import json
+
+from twisted.python import log
+from twisted.python.filepath import FilePath
+
+from buildbot.steps.shell import ShellCommand
+from buildbot.process.properties import Property
+from buildbot.status.logfile import STDOUT
+
+from txbuildbot.git import isTrunk
+
+from binascii import hexlify
+
+
+
+def isTrunkBuild(step):
+    """
+    Is C{step} part of a build of trunk?
+
+    Suitable as the C{doStepIf} of a step.
+    """
+    return isTrunk(step.getProperty('branch'))
+
+
+def isBranchBuild(step):
+    """
+    Is C{step} part of a build of a branch other than trunk?
+
+    Suitable as the C{doStepIf} of a step.
+    """
+    return not isTrunkBuild(step)
+
+
+def moduleForFile(path):
+    """
+    Get the name of the module in the Python source file at C{path}.
+
+    @param path: a path relative to the top of the checkout, using C{/} as a
+        separator, as in L{buildbot.process.build.Build.allFiles}
+    @return: the module name, or C{None} if C{path} is not a Python source
+        file.
+    """
+    if not path.endswith('.py'):
+        return None
+    name = path[:-len('.py')].replace('/', '.')
+    if name.endswith('.__init__'):
+        name = name[:-len('.__init__')]
+    return name
+
+
+
+class TestDependencyIndex(object):
+    """
+    The modules imported by each module of the source tree, as found by the
+    last trunk build of a builder.
+
+    @ivar path: L{FilePath} of the JSON file holding the index.
+    """
+    filename = 'test-dependencies.json'
+
+    def __init__(self, path):
+        self.path = path
+
+
+    @classmethod
+    def forBuilder(cls, builderStatus):
+        """
+        Get the index for the builder whose status is C{builderStatus}.
+
+        @type builderStatus: L{buildbot.status.builder.BuilderStatus}
+        """
+        return cls(FilePath(builderStatus.basedir).child(cls.filename))
+
+
+    def store(self, revision, imports):
+        """
+        Replace the index.
+
+        @param revision: the revision the imports were found in
+        @param imports: L{dict} mapping each module name to a L{list} of the
+            names of the modules it imports
+        """
+        self.path.setContent(json.dumps({
+            'revision': revision,
+            'imports': imports,
+            }))
+
+
+    def load(self):
+        """
+        Read the index.
+
+        @return: L{dict} mapping each module name to a L{list} of the names of
+            the modules it imports, or C{None} if there is no usable index.
+        """
+        if not self.path.exists():
+            return None
+        try:
+            return json.loads(self.path.getContent())['imports']
+        except (IOError, ValueError, KeyError, TypeError):
+            log.msg(format="Ignoring unreadable test dependency index %(path)s",
+                    path=self.path.path)
+            return None
+
+
+    def affectedTests(self, files):
+        """
+        Find the test modules which depend on the given files.
+
+        A module depends on the modules it imports, and on the packages
+        containing it, and on everything they depend on in turn.  Test
+        modules are modules whose name starts with C{test_}.
+
+        The modules of the changed files themselves are not included: they
+        may have been added or removed since the index was built, so they are
+        better given to trial with C{--testmodule}.
+
+        @param files: the paths of the changed files, relative to the top of
+            the checkout
+        @type files: iterable of L{str}
+
+        @return: sorted L{list} of test module names, or C{None} if there is
+            no usable index.
+        """
+        imports = self.load()
+        if imports is None:
+            return None
+
+        dependents = {}
+        for module, imported in imports.iteritems():
+            parts = module.split('.')
+            packages = ['.'.join(parts[:i]) for i in range(1, len(parts))]
+            for name in imported + packages:
+                dependents.setdefault(name, set()).add(module)
+
+        changed = set([module for module in map(moduleForFile, files)
+                       if module is not None])
+        affected = set(changed)
+        pending = list(changed)
+        while pending:
+            module = pending.pop()
+            for dependent in dependents.get(module, ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    pending.append(dependent)
+
+        return sorted([name for name in affected - changed
+                       if name.rpartition('.')[2].startswith('test_')])
+
+
+
+class RecordTestDependencies(ShellCommand):
+    """
+    Find the modules imported by each module of the package being tested,
+    without importing them, and keep them as the builder's
+    L{TestDependencyIndex}.
+
+    This should only be run on trunk builds.
+
+    The imports are written to C{dependenciesFile} on the slave, and read
+    back from its C{dependencies} log rather than the stdio log.
+
+    @ivar dependenciesFile: the path of the file the imports are written to,
+        relative to the workdir.
+    """
+    name = 'record-test-dependencies'
+    description = ['finding', 'test', 'dependencies']
+    descriptionDone = ['test', 'dependencies']
+    flunkOnFailure = False
+    warnOnFailure = True
+
+    dependenciesFile = '_test_dependencies.json'
+    logfiles = {'dependencies': dependenciesFile}
+
+    source = (
+        "import ast, json, os, sys\n"
+        "root = sys.argv[1].replace('.', os.sep)\n"
+        "modules = {}\n"
+        "for dirpath, dirnames, filenames in os.walk(root):\n"
+        "    if '__init__.py' not in filenames:\n"
+        "        dirnames[:] = []\n"
+        "        continue\n"
+        "    for filename in filenames:\n"
+        "        if filename.endswith('.py'):\n"
+        "            path = os.path.join(dirpath, filename)\n"
+        "            name = os.path.splitext(path)[0].replace(os.sep, '.')\n"
+        "            if filename == '__init__.py':\n"
+        "                modules[name[:-len('.__init__')]] = (path, True)\n"
+        "            else:\n"
+        "                modules[name] = (path, False)\n"
+        "imports = {}\n"
+        "for name, (path, isPackage) in modules.items():\n"
+        "    found = set()\n"
+        "    imports[name] = found\n"
+        "    try:\n"
+        "        tree = ast.parse(open(path, 'rb').read(), path)\n"
+        "    except (SyntaxError, ValueError, TypeError):\n"
+        "        continue\n"
+        "    base = name.split('.')\n"
+        "    if not isPackage:\n"
+        "        base.pop()\n"
+        "    for node in ast.walk(tree):\n"
+        "        if isinstance(node, ast.Import):\n"
+        "            targets = [alias.name for alias in node.names]\n"
+        "        elif isinstance(node, ast.ImportFrom):\n"
+        "            module = node.module or ''\n"
+        "            if node.level:\n"
+        "                parts = base[:len(base) - node.level + 1]\n"
+        "                module = '.'.join(parts + [module]).strip('.')\n"
+        "            targets = [module + '.' + alias.name for alias in node.names]\n"
+        "            targets.append(module)\n"
+        "        else:\n"
+        "            continue\n"
+        "        for target in targets:\n"
+        "            while target and target not in modules:\n"
+        "                target = target.rpartition('.')[0]\n"
+        "            if target and target != name:\n"
+        "                found.add(target)\n"
+        "for name in imports:\n"
+        "    imports[name] = sorted(imports[name])\n"
+        "output = open(sys.argv[2], 'w')\n"
+        "output.write(json.dumps(imports))\n"
+        "output.close()\n")
+
+    def __init__(self, python, **kwargs):
+        ShellCommand.__init__(self, **kwargs)
+        self.addFactoryArguments(python=python)
+        self.command = python + [
+            '-c',
+            'from binascii import unhexlify; exec(unhexlify(b"%s"))' % (
+                hexlify(self.source),),
+            Property('test-case-name', default='twisted'),
+            self.dependenciesFile]
+
+
+    def commandComplete(self, cmd):
+        self.modules = None
+        if cmd.rc != 0 or 'dependencies' not in cmd.logs:
+            return
+        output = ''.join(cmd.logs['dependencies'].getChunks(
+            [STDOUT], onlyText=True))
+        try:
+            imports = json.loads(output)
+        except ValueError:
+            log.msg("Could not parse the test dependencies")
+            return
+        index = TestDependencyIndex.forBuilder(
+            self.build.build_status.getBuilder())
+        index.store(self.getProperty('got_revision'), imports)
+        self.modules = len(imports)
+
+
+    def getText(self, cmd, results):
+        if getattr(self, 'modules', None) is not None:
+            return ['test', 'dependencies', 'of',
+                    '%d modules' % (self.modules,)]
+        return ShellCommand.getText(self, cmd, results)
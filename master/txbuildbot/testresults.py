@@ -0,0 +1,208 @@
+"""
+The results of the tests run by the trial steps of every builder, kept in a
+single SQLite database on the master, so that flaky tests and tests which
+keep failing can be found without loading the status of old builds.
+"""
+
+import sqlite3
+from itertools import groupby
+
+from twisted.python.filepath import FilePath
+
+from txbuildbot.git import isTrunk
+
+
+
+class TestResultStore(object):
+    """
+    A table of test results, one row per test run by a trial step, with the
+    builder, build number, step name, revision and branch of the build, the
+    result printed by trial and the time the test took.  Only the results of
+    the C{maxBuilds} most recent builds of each step of a builder are kept.
+
+    @ivar path: L{FilePath} of the SQLite database.
+    @ivar maxBuilds: the number of builds of each step whose results are
+        kept.
+
+    @cvar passed: the results of tests which passed.
+    @cvar failed: the results of tests which failed.
+    """
+    filename = 'test-results.sqlite'
+    passed = frozenset(['OK'])
+    failed = frozenset(['FAILURE', 'ERROR'])
+    maxBuilds = 500
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS results ("
+        " builder TEXT NOT NULL,"
+        " build INTEGER NOT NULL,"
+        " step TEXT NOT NULL,"
+        " revision TEXT,"
+        " branch TEXT,"
+        " trunk INTEGER NOT NULL,"
+        " test TEXT NOT NULL,"
+        " result TEXT NOT NULL,"
+        " duration REAL)",
+        "CREATE INDEX IF NOT EXISTS results_test"
+        " ON results (test, builder, step, build)",
+        "CREATE INDEX IF NOT EXISTS results_build"
+        " ON results (builder, step, build)",
+        ]
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+
+
+    @classmethod
+    def forBuilder(cls, builderStatus):
+        """
+        Get the store shared by all the builders of the master of the builder
+        whose status is C{builderStatus}.
+
+        @type builderStatus: L{buildbot.status.builder.BuilderStatus}
+        """
+        return cls(FilePath(builderStatus.basedir).parent().child(cls.filename))
+
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path.path)
+            with connection:
+                for statement in self.schema:
+                    connection.execute(statement)
+            self._connection = connection
+        return self._connection
+
+
+    def close(self):
+        """
+        Close the database, if it is open.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+    def record(self, builder, build, step, revision, branch, results,
+               timings=()):
+        """
+        Append the results of the tests run by a trial step, and remove
+        those of the builds of the step older than the C{maxBuilds} most
+        recent ones, in a single transaction.
+
+        @param builder: the name of the builder
+        @param build: the build number
+        @param step: the name of the step
+        @param revision: the revision tested
+        @param branch: the branch tested
+
+        @param results: C{(testName, result)} pairs
+        @param timings: C{(testName, seconds)} pairs, for the tests whose
+            duration is known
+
+        @return: the number of results recorded
+        """
+        durations = dict(timings)
+        trunk = int(isTrunk(branch))
+        rows = [(builder, build, step, revision, branch, trunk,
+                 test, result, durations.get(test))
+                for test, result in results]
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT INTO results (builder, build, step, revision, branch,"
+                " trunk, test, result, duration)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            connection.execute(
+                "DELETE FROM results"
+                " WHERE builder = ? AND step = ? AND build <= ?",
+                (builder, step, build - self.maxBuilds))
+        return len(rows)
+
+
+    def history(self, test):
+        """
+        Get every recorded run of a test.
+
+        @param test: the name of the test
+
+        @return: L{list} of C{(builder, build, step, revision, branch, result,
+            duration)} tuples, ordered by builder, step and build.
+        """
+        return self._connect().execute(
+            "SELECT builder, build, step, revision, branch, result, duration"
+            " FROM results WHERE test = ?"
+            " ORDER BY builder, step, build, rowid", (test,)).fetchall()
+
+
+    def _runs(self, trunkOnly):
+        """
+        Get the passing and failing runs of every test.
+
+        @return: iterable of C{(test, builder, step, runs)}, where C{runs} is
+            a L{list} of booleans telling whether each run failed, oldest
+            first.
+        """
+        results = list(self.passed | self.failed)
+        query = ("SELECT test, builder, step, result FROM results"
+                 " WHERE result IN (%s)" % (", ".join("?" * len(results)),))
+        if trunkOnly:
+            query += " AND trunk = 1"
+        query += " ORDER BY test, builder, step, build, rowid"
+        rows = self._connect().execute(query, results)
+        for key, group in groupby(rows, lambda row: row[:3]):
+            test, builder, step = key
+            yield test, builder, step, [row[3] in self.failed for row in group]
+
+
+    def flakeRates(self, minRuns=10, trunkOnly=True):
+        """
+        Find the tests which flip between passing and failing.
+
+        The flake rate of a test is the fraction of its consecutive runs by
+        the same step of a builder where one run passed and the other failed.
+        Skipped tests and expected failures are left out.
+
+        @param minRuns: the number of passing or failing runs a test needs
+            for its flake rate to be reported
+        @param trunkOnly: whether to only consider builds of trunk, where a
+            failure is more likely to be spurious
+
+        @return: L{dict} mapping the names of the tests which flipped at least
+            once to C{(rate, runs)} pairs.
+        """
+        flips = {}
+        pairs = {}
+        runs = {}
+        for test, builder, step, failures in self._runs(trunkOnly):
+            runs[test] = runs.get(test, 0) + len(failures)
+            pairs[test] = pairs.get(test, 0) + len(failures) - 1
+            flips[test] = flips.get(test, 0) + len(
+                [1 for before, after in zip(failures, failures[1:])
+                 if before != after])
+        return dict((test, (float(flips[test]) / pairs[test], runs[test]))
+                    for test in flips
+                    if flips[test] and runs[test] >= minRuns)
+
+
+    def failureStreaks(self, trunkOnly=True):
+        """
+        Find the tests which are currently failing, and for how long.
+
+        @param trunkOnly: whether to only consider builds of trunk
+
+        @return: L{dict} mapping the name of each test whose last run failed
+            to a L{dict} mapping C{(builder, step)} pairs to the number of
+            consecutive failing runs at the end of its history there.
+        """
+        streaks = {}
+        for test, builder, step, failures in self._runs(trunkOnly):
+            streak = 0
+            for failed in reversed(failures):
+                if not failed:
+                    break
+                streak += 1
+            if streak:
+                streaks.setdefault(test, {})[builder, step] = streak
+        return streaks
@@ -0,0 +1,249 @@
+"""
+Per-test timings of trial runs.
+
+L{TrialTestTimer} collects the time taken by each test from the output of
+trial's timing reporter, and L{TestTimings} keeps the timings of recent builds
+in the builder's status directory, so the tests which dominate the run time of
+each builder can be found, and the test suite can be split into shards which
+take about the same time.
+"""
+
+import json
+import re
+
+from twisted.python import log
+from twisted.python.filepath import FilePath
+
+from buildbot.process.buildstep import LogLineObserver
+
+
+
+class TrialTestTimer(LogLineObserver):
+    """
+    Collect the time taken by each test from the output of
+    C{trial --reporter=timing}, which follows the line naming each test with a
+    line like C{(0.012 secs)}.
+
+    The result of each test is collected as well, from the end of the line
+    naming the test, or from a line of its own if the test wrote output.
+
+    @ivar timings: L{list} of C{(testName, seconds)} pairs, in the order the
+        tests were run.
+
+    @ivar results: L{list} of C{(testName, result)} pairs, in the order the
+        tests were run, where C{result} is the result printed by trial, like
+        C{"OK"}, C{"FAILURE"} or C{"ERROR"}.
+    """
+    _start_re = re.compile(r'^([\w\.]+) \.\.\. ')
+    _time_re = re.compile(r'^\((\d+\.\d+) secs\)$')
+    _result_re = re.compile(r'^\[([^\]]+)\]$')
+    finished = False
+
+    def __init__(self):
+        LogLineObserver.__init__(self)
+        self.timings = []
+        self.results = []
+        self._current = None
+        self._unfinished = None
+
+
+    def outLineReceived(self, line):
+        if self.finished:
+            return
+        if line.startswith("=" * 40):
+            self.finished = True
+            return
+
+        m = self._start_re.match(line)
+        if m:
+            self._current = self._unfinished = m.group(1)
+            line = line[m.end():]
+        elif self._current is not None:
+            m = self._time_re.match(line.strip())
+            if m:
+                self.timings.append((self._current, float(m.group(1))))
+                self._current = None
+                return
+
+        if self._unfinished is not None:
+            m = self._result_re.match(line.strip())
+            if m:
+                self.results.append((self._unfinished, m.group(1)))
+                self._unfinished = None
+
+
+    def slowest(self, count):
+        """
+        Get the slowest tests.
+
+        @param count: the number of tests to return
+        @return: L{list} of up to C{count} C{(testName, seconds)} pairs, the
+            slowest first.
+        """
+        return sorted(self.timings, key=lambda timing: -timing[1])[:count]
+
+
+
+def formatTimings(timings):
+    """
+    Format test timings as a log, one test per line.
+
+    @param timings: iterable of C{(testName, seconds)} pairs
+    @rtype: L{str}
+    """
+    return "".join(["%9.3fs  %s\n" % (seconds, name)
+                    for name, seconds in timings])
+
+
+
+def testModule(testName):
+    """
+    Get the name of the module defining a test.
+
+    Test case classes are assumed to be the first part of the name which
+    starts with a capital letter, as in Twisted.
+
+    @param testName: the fully qualified name of a test method, like
+        C{twisted.test.test_defer.DeferredTests.test_callback}
+    @rtype: L{str}
+    """
+    parts = testName.split('.')
+    for i, part in enumerate(parts):
+        if part[:1].isupper():
+            return '.'.join(parts[:i])
+    return '.'.join(parts[:-2])
+
+
+def moduleDurations(timings):
+    """
+    Add up the time taken by the tests in each test module.
+
+    @param timings: L{dict} mapping test names to seconds
+    @return: L{dict} mapping module names to seconds
+    """
+    durations = {}
+    for name, seconds in timings.iteritems():
+        module = testModule(name)
+        if module:
+            durations[module] = durations.get(module, 0.0) + seconds
+    return durations
+
+
+
+class TestTimings(object):
+    """
+    The per-test timings of recent trial runs, for a single builder.
+
+    The timings of each trial step of a build are written as JSON to their own
+    file, named after the build number and the step.  When more than
+    C{maxEntries} files are stored, those of the oldest builds are removed.
+
+    @ivar path: L{FilePath} of the directory holding the timings.
+    @ivar maxEntries: the number of files to keep.
+    """
+    dirname = 'test-timings'
+    maxEntries = 50
+
+    def __init__(self, path):
+        self.path = path
+
+
+    @classmethod
+    def forBuilder(cls, builderStatus):
+        """
+        Get the timings for the builder whose status is C{builderStatus}.
+
+        @type builderStatus: L{buildbot.status.builder.BuilderStatus}
+        """
+        return cls(FilePath(builderStatus.basedir).child(cls.dirname))
+
+
+    def _entry(self, number, stepName):
+        return self.path.child('%d-%s.json' % (number, stepName))
+
+
+    def _entries(self):
+        """
+        Get the stored files, the oldest build first.
+        """
+        if not self.path.isdir():
+            return []
+        entries = []
+        for child in self.path.children():
+            number, sep, rest = child.basename().partition('-')
+            if number.isdigit() and rest.endswith('.json'):
+                entries.append((int(number), child))
+        entries.sort()
+        return [child for build, child in entries]
+
+
+    def record(self, number, stepName, timings):
+        """
+        Store the timings of a trial step, and remove the oldest entries.
+
+        @param number: the build number
+        @type number: L{int}
+
+        @param stepName: the name of the trial step
+        @type stepName: L{str}
+
+        @param timings: C{(testName, seconds)} pairs
+        @type timings: L{list}
+
+        @return: the L{FilePath} the timings were written to
+        """
+        if not self.path.isdir():
+            self.path.makedirs()
+        entry = self._entry(number, stepName)
+        entry.setContent(json.dumps({
+            'build': number,
+            'step': stepName,
+            'tests': dict(timings),
+            }))
+
+        for child in self._entries()[:-self.maxEntries]:
+            log.msg(format="Removing test timings %(path)s", path=child.path)
+            child.remove()
+        return entry
+
+
+    def get(self, number, stepName):
+        """
+        Get the timings of a trial step.
+
+        @type number: L{int}
+        @type stepName: L{str}
+
+        @return: L{dict} mapping test names to seconds, or C{None} if the
+            timings are not stored.
+        """
+        return self._read(self._entry(number, stepName))
+
+
+    def latest(self, stepName):
+        """
+        Get the timings of a trial step in the most recent build which
+        recorded any.
+
+        @type stepName: L{str}
+
+        @return: L{dict} mapping test names to seconds, or C{None} if no
+            timings are stored for C{stepName}.
+        """
+        for entry in reversed(self._entries()):
+            if entry.basename().partition('-')[2] == stepName + '.json':
+                timings = self._read(entry)
+                if timings is not None:
+                    return timings
+        return None
+
+
+    def _read(self, entry):
+        try:
+            return json.loads(entry.getContent())['tests']
+        except (IOError, OSError):
+            return None
+        except (ValueError, KeyError, TypeError):
+            log.msg(format="Ignoring unreadable test timings %(path)s",
+                    path=entry.path)
+            return None
@@ -0,0 +1,322 @@
+"""
+Parsing of the output of trial.
+"""
+
+import re
+from collections import deque
+
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+from buildbot.status.builder import SUCCESS, FAILURE, WARNINGS, SKIPPED
+from buildbot.process.buildstep import LogObserver, LogLineObserver
+
+
+
+SEPARATOR = "=" * 60
+SUMMARY_SEPARATOR = "-" * 60
+SEPARATOR_START = "=-"
+
+# The build result of each kind of problem reported by trial.
+PROBLEM_RESULTS = {
+    'SKIPPED': SKIPPED,
+    'EXPECTED FAILURE': SUCCESS,
+    'UNEXPECTED SUCCESS': WARNINGS,
+    'FAILURE': FAILURE,
+    'ERROR': FAILURE,
+    'SUCCESS': SUCCESS, # not reported
+    }
+
+
+
+_ran_re = re.compile(r'Ran (\d+) tests')
+# The overall status of a run, as opposed to an individual test which failed,
+# hence the space after FAILED.  OK may be printed without any additional
+# text (if there are no skips, etc).
+_status_re = re.compile(r'^(?:OK|FAILED |PASSED).*$', re.M)
+_count_re = re.compile(
+    r'(failures|errors|skips|expectedFailures|unexpectedSuccesses|successes)'
+    r'=(\d+)')
+
+def countFailedTests(output):
+    """
+    Find the counts of tests printed at the end of a trial run, like::
+
+        Ran 12 tests in 0.242s
+
+        FAILED (skips=1, failures=1, successes=10)
+
+    @param output: the output of trial, or at least its end
+    @type output: L{str}
+
+    @return: L{dict} of the counts, mapping C{'total'} to the number of tests
+        run, or C{None} if it is not found, and C{'failures'}, C{'errors'},
+        C{'skips'}, C{'expectedFailures'}, C{'unexpectedSuccesses'} and, if
+        printed, C{'successes'} to the number of tests with each result.
+    """
+    # start scanning 10kb from the end, because there might be a few kb of
+    # import exception tracebacks between the total/time line and the errors
+    # line.  The last line is ignored unless it is complete.
+    chunk = output[-10000:]
+    chunk = chunk[:max(chunk.rfind("\n"), 0)]
+    res = {'total': None,
+           'failures': 0,
+           'errors': 0,
+           'skips': 0,
+           'expectedFailures': 0,
+           'unexpectedSuccesses': 0,
+           }
+    for match in _ran_re.finditer(chunk):
+        res['total'] = int(match.group(1))
+    for status in _status_re.finditer(chunk):
+        counts = {}
+        for match in _count_re.finditer(status.group()):
+            counts.setdefault(match.group(1), int(match.group(2)))
+        res.update(counts)
+    return res
+
+
+
+class TrialTestCaseCounter(LogLineObserver):
+    """
+    Report the number of tests run so far as the C{'tests'} progress metric
+    of the step, from the per-test lines of the bwverbose reporter.
+    """
+    _line_re = re.compile(r'^\s*[\w\.]+ \.\.\. \[[^\]]+\]\s*$')
+    _separator = "=" * 40
+    numTests = 0
+    finished = False
+
+    def outLineReceived(self, line):
+        # different versions of Twisted emit different per-test lines with
+        # the bwverbose reporter.
+        #  2.0.0: testSlave (buildbot.test.test_runner.Create) ... [OK]
+        #  2.1.0: buildbot.test.test_runner.Create.testSlave ... [OK]
+        #  2.4.0: buildbot.test.test_runner.Create.testSlave ... [OK]
+        # Let's just handle the most recent version, since it's the easiest.
+
+        if self.finished:
+            return
+        if line.startswith(self._separator):
+            self.finished = True
+            return
+
+        if self._line_re.match(line):
+            self.numTests += 1
+            self.step.setProgress('tests', self.numTests)
+
+
+
+class TrialOutputParser(object):
+    """
+    Collect the warnings and the per-test problems from the output of trial,
+    in a single pass over its lines.
+
+    Before the first separator line, lines mentioning a warning are counted.
+    Everything from the first separator on is the report of the problems,
+    made of one block per test, each starting with a separator line and a
+    line like::
+
+        FAILURE: testBatchFile (twisted.conch.test.test_sftp.TestOurServerBatchFile)
+
+    The last block is followed by a line of dashes and the summary counts.
+
+    @ivar warnings: L{dict} mapping each warning to the number of times it was
+        seen.  Warnings about deprecations and user warnings include the
+        source line following them.
+
+    @ivar results: L{list} of C{(testname, results, text, log)} tuples, one
+        per test with a problem, where C{testname} is a L{tuple} of the
+        components of the name of the test, C{results} is a build result,
+        C{text} the description of the problem and C{log} the report of the
+        problem.
+    """
+    _problem_re = re.compile(r'^([^:]+): (\w+) \(([\w\.]+)\)')
+
+    def __init__(self):
+        self.warnings = {}
+        self.results = []
+        self._problems = []
+        self._warning = None
+        # The first line of the test being reported in _problems, and its
+        # result.
+        self._testStart = None
+        self._test = None
+        self.lineReceived = self._warningLine
+
+
+    def lineReceived(self, line):
+        """
+        Parse the next line of output.
+
+        Each state of the parser is a method handling a line, which replaces
+        this method on the instance.
+
+        @param line: the line, including its trailing newline, if any
+        @type line: L{str}
+        """
+
+
+    def finish(self):
+        """
+        Handle the end of the output.
+        """
+        if self._warning is not None:
+            self._addWarning(self._warning)
+            self._warning = None
+        self._endTest()
+        self.lineReceived = self._ignore
+
+
+    def getProblems(self):
+        """
+        Get the report of the problems.
+
+        @return: the output from the first separator line on, or C{""} if
+            there is none.
+        """
+        return "".join(self._problems)
+
+
+    def _addWarning(self, warning):
+        self.warnings[warning] = self.warnings.get(warning, 0) + 1
+
+
+    def _isSeparator(self, line):
+        return line.startswith(SEPARATOR) or line.startswith(SUMMARY_SEPARATOR)
+
+
+    def _warningLine(self, line):
+        if " exceptions.DeprecationWarning: " in line:
+            # no source
+            self._addWarning(line)
+        elif " DeprecationWarning: " in line or " UserWarning: " in line:
+            # next line is the source
+            self._warning = line
+            self.lineReceived = self._warningSource
+            return
+        elif "Warning: " in line:
+            self._addWarning(line)
+
+        if line[:1] in SEPARATOR_START and self._isSeparator(line):
+            self._problems.append(line)
+            self.lineReceived = self._testStartLine
+
+
+    def _warningSource(self, line):
+        self._addWarning(self._warning + line)
+        self._warning = None
+        self.lineReceived = self._warningLine
+
+
+    def _testStartLine(self, line):
+        self._problems.append(line)
+        if line.startswith(SEPARATOR):
+            return
+        if line.startswith(SUMMARY_SEPARATOR):
+            # the last case has --- as a separator before the summary counts
+            # are printed
+            self.lineReceived = self._problemLine
+            return
+        match = self._problem_re.search(line)
+        if match is None:
+            return
+        result, name, case = match.groups()
+        self._testStart = len(self._problems) - 1
+        self._test = (tuple(case.split(".") + [name]),
+                      PROBLEM_RESULTS.get(result, WARNINGS),
+                      result.lower().split())
+        # the next line is all dashes
+        self.lineReceived = self._testHeaderLine
+
+
+    def _testHeaderLine(self, line):
+        self._problems.append(line)
+        self.lineReceived = self._testBodyLine
+
+
+    def _testBodyLine(self, line):
+        if line[:1] in SEPARATOR_START:
+            if line.startswith(SEPARATOR):
+                self._endTest()
+                self._problems.append(line)
+                self.lineReceived = self._testStartLine
+                return
+            if line.startswith(SUMMARY_SEPARATOR):
+                self._endTest()
+                self.lineReceived = self._problemLine
+        self._problems.append(line)
+
+
+    def _endTest(self):
+        if self._test is not None:
+            testname, results, text = self._test
+            self.results.append((testname, results, text,
+                                 "".join(self._problems[self._testStart:])))
+            self._test = None
+
+
+    def _problemLine(self, line):
+        self._problems.append(line)
+
+
+    def _ignore(self, line):
+        pass
+
+
+
+def parseTrialOutput(output):
+    """
+    Parse the output of trial with a L{TrialOutputParser}.
+
+    @type output: L{str}
+    @return: the finished L{TrialOutputParser}
+    """
+    parser = TrialOutputParser()
+    for line in StringIO.StringIO(output):
+        # Look the current state up for each line, as it changes.
+        parser.lineReceived(line)
+    parser.finish()
+    return parser
+
+
+
+class TrailingOutput(LogObserver):
+    """
+    Keep the end of the output of a command as it arrives, so the summary
+    printed by trial at the end of its run can be parsed without reading the
+    whole log back.
+
+    The output is kept as a queue of the chunks received, from which the
+    oldest chunks are dropped as long as at least C{maxSize} characters
+    remain.
+
+    @ivar maxSize: the number of trailing characters to keep.
+    """
+    maxSize = 10000
+
+    def __init__(self):
+        self._chunks = deque()
+        self._size = 0
+
+
+    def outReceived(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._size - len(self._chunks[0]) >= self.maxSize:
+            self._size -= len(self._chunks.popleft())
+
+
+    errReceived = outReceived
+
+
+    def getText(self):
+        """
+        Get the end of the output.
+
+        @return: the last C{maxSize} characters of the output, from stdout and
+            stderr, in the order they were received.
+        """
+        return "".join(self._chunks)[-self.maxSize:]
@@ -0,0 +1,164 @@
+"""
+Aggregation of the warnings emitted during trial runs.
+
+The warnings of a run are normalized by removing the slave's directories from
+them, so the same warning has the same text on every slave, and are counted.
+L{WarningIndex} remembers the trunk revision each warning was first seen in,
+so that builds of a branch can report the warnings trunk does not emit.
+"""
+
+import json
+
+from twisted.python import log
+from twisted.python.filepath import FilePath
+
+
+
+def slaveDirectories(builddir, workdir):
+    """
+    Get the directories of a build on the slave, to remove from warnings.
+
+    @param builddir: the absolute path of the builder's directory on the
+        slave, as given by the C{workdir} build property
+    @param workdir: the working directory of a step, relative to C{builddir}
+
+    @return: L{list} of the directories, each ending with a path separator.
+    """
+    if not builddir:
+        return []
+    sep = '\\' in builddir and '\\' or '/'
+    if builddir.endswith(sep):
+        builddir = builddir[:-1]
+    return [builddir + sep + workdir.replace('/', sep).strip(sep) + sep,
+            builddir + sep]
+
+
+def normalizeWarnings(warnings, prefixes):
+    """
+    Remove directory prefixes from warnings, adding up the counts of those
+    which become the same.
+
+    @param warnings: L{dict} mapping warnings to the number of times each was
+        seen
+    @param prefixes: the directories to remove, each ending with a path
+        separator; the longest ones are removed first.
+
+    @return: L{dict} mapping normalized warnings to counts
+    """
+    prefixes = sorted(prefixes, key=len, reverse=True)
+    normalized = {}
+    for warning, count in warnings.iteritems():
+        for prefix in prefixes:
+            warning = warning.replace(prefix, '')
+        normalized[warning] = normalized.get(warning, 0) + count
+    return normalized
+
+
+def formatWarnings(warnings):
+    """
+    Format warnings as a log, with the number of times each was seen.
+
+    @param warnings: L{dict} mapping warnings to counts
+    @rtype: L{str}
+    """
+    return "".join(["%5d  %s" % (warnings[warning], warning)
+                    for warning in sorted(warnings)])
+
+
+
+class WarningIndex(object):
+    """
+    The warnings emitted by the recent trunk builds of a builder, with the
+    revision and build each was first seen in.
+
+    A warning is forgotten once it was not seen for C{maxAge} builds, so one
+    which goes away and comes back counts as new again.
+
+    @ivar path: L{FilePath} of the JSON file holding the index.
+    @ivar maxAge: the number of builds a warning is remembered for after it
+        was last seen.
+    """
+    filename = 'trial-warnings.json'
+    maxAge = 20
+
+    def __init__(self, path):
+        self.path = path
+
+
+    @classmethod
+    def forBuilder(cls, builderStatus):
+        """
+        Get the index for the builder whose status is C{builderStatus}.
+
+        @type builderStatus: L{buildbot.status.builder.BuilderStatus}
+        """
+        return cls(FilePath(builderStatus.basedir).child(cls.filename))
+
+
+    def _load(self):
+        """
+        Read the index from disk.
+
+        @return: L{dict} mapping warnings to L{dict}s with the C{revision} and
+            C{build} they were first seen in, and the C{lastBuild} they were
+            seen in; empty if the index is missing or unreadable.
+        """
+        if not self.path.exists():
+            return {}
+        try:
+            return dict(json.loads(self.path.getContent()))
+        except (IOError, ValueError, TypeError):
+            log.msg(format="Ignoring unreadable warning index %(path)s",
+                    path=self.path.path)
+            return {}
+
+
+    def exists(self):
+        """
+        Have any trunk builds been recorded?
+        """
+        return self.path.exists()
+
+
+    def firstSeen(self, warning):
+        """
+        Get the trunk revision a warning was first seen in.
+
+        @return: the revision, or C{None} if the warning is not indexed.
+        """
+        entry = self._load().get(warning)
+        if entry is None:
+            return None
+        return entry['revision']
+
+
+    def newWarnings(self, warnings):
+        """
+        Find the warnings not emitted by recent trunk builds.
+
+        @param warnings: iterable of normalized warnings
+        @return: sorted L{list} of the warnings which are not indexed
+        """
+        index = self._load()
+        return sorted([warning for warning in warnings
+                       if warning not in index])
+
+
+    def record(self, revision, number, warnings):
+        """
+        Record the warnings emitted by a trunk build, and forget those which
+        have not been seen for C{maxAge} builds.
+
+        @param revision: the revision built
+        @param number: the build number
+        @param warnings: iterable of normalized warnings
+        """
+        index = self._load()
+        for warning in warnings:
+            entry = index.setdefault(
+                warning, {'revision': revision, 'build': number})
+            entry['lastBuild'] = max(entry.get('lastBuild', number), number)
+        for warning, entry in index.items():
+            if entry['lastBuild'] <= number - self.maxAge:
+                del index[warning]
+        self.path.setContent(json.dumps(index))
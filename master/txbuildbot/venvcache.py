@@ -0,0 +1,110 @@
+"""
+Virtualenvs cached on the slave, and reused by every build needing the same
+interpreter and requirements.
+"""
+
+from binascii import hexlify
+
+from buildbot.steps.shell import ShellCommand
+
+
+
+class CachedVirtualEnv(ShellCommand):
+    """
+    Make C{path} a virtualenv of C{python} with C{requirements} installed.
+
+    The virtualenvs are kept in C{cache}, each in a directory named after a
+    hash of the interpreter, its version, and the requirements, so a
+    virtualenv is only created and populated when one of them changes.  A
+    virtualenv is only used once a marker file written after its
+    requirements were installed exists, and C{path} is a symbolic link
+    replaced atomically to point to it.
+
+    When the virtualenvs in the cache take more than C{maxSize} bytes, the
+    least recently used ones are removed.
+
+    The paths are relative to the working directory of the step.
+    """
+    name = 'virtualenv'
+    description = ['preparing', 'virtualenv']
+    descriptionDone = ['virtualenv']
+    haltOnFailure = True
+
+    source = (
+        "import hashlib, json, os, shutil, subprocess, sys\n"
+        "cache, path, maxSize = sys.argv[1], sys.argv[2], int(sys.argv[3])\n"
+        "requirements = sorted(sys.argv[4:])\n"
+        "key = hashlib.sha1(json.dumps(\n"
+        "    [os.path.realpath(sys.executable), sys.version, requirements]\n"
+        "    ).encode('utf-8')).hexdigest()[:16]\n"
+        "env = os.path.join(cache, key)\n"
+        "marker = os.path.join(env, '.requirements-installed')\n"
+        "if os.path.exists(marker):\n"
+        "    print('Using the cached virtualenv ' + env)\n"
+        "else:\n"
+        "    print('Creating the virtualenv ' + env)\n"
+        "    if os.path.exists(env):\n"
+        "        shutil.rmtree(env)\n"
+        "    if not os.path.isdir(cache):\n"
+        "        os.makedirs(cache)\n"
+        "    subprocess.check_call(['virtualenv', '-p', sys.executable, env])\n"
+        "    if requirements:\n"
+        "        subprocess.check_call(\n"
+        "            [os.path.join(env, 'bin', 'pip'), 'install'] + requirements)\n"
+        "    output = open(marker, 'w')\n"
+        "    output.write(json.dumps(requirements))\n"
+        "    output.close()\n"
+        "os.utime(marker, None)\n"
+        "target = os.path.relpath(env, os.path.dirname(os.path.abspath(path)))\n"
+        "if os.path.isdir(path) and not os.path.islink(path):\n"
+        "    shutil.rmtree(path)\n"
+        "link = '%s.%d' % (path, os.getpid())\n"
+        "os.symlink(target, link)\n"
+        "os.rename(link, path)\n"
+        "def size(top):\n"
+        "    total = 0\n"
+        "    for dirpath, dirnames, filenames in os.walk(top):\n"
+        "        for filename in filenames:\n"
+        "            try:\n"
+        "                total += os.lstat(os.path.join(dirpath, filename)).st_size\n"
+        "            except OSError:\n"
+        "                pass\n"
+        "    return total\n"
+        "envs = []\n"
+        "for name in os.listdir(cache):\n"
+        "    other = os.path.join(cache, name)\n"
+        "    if other == env or not os.path.isdir(other):\n"
+        "        continue\n"
+        "    try:\n"
+        "        used = os.stat(os.path.join(other, '.requirements-installed')).st_mtime\n"
+        "    except OSError:\n"
+        "        used = 0\n"
+        "    envs.append((used, other, size(other)))\n"
+        "total = size(env) + sum([envSize for used, other, envSize in envs])\n"
+        "for used, other, envSize in sorted(envs):\n"
+        "    if total <= maxSize:\n"
+        "        break\n"
+        "    print('Removing the cached virtualenv ' + other)\n"
+        "    shutil.rmtree(other)\n"
+        "    total -= envSize\n"
+        "print('%d bytes of cached virtualenvs' % (total,))\n")
+
+    def __init__(self, python, path, requirements, cache='../venv-cache',
+                 maxSize=1024 * 1024 * 1024, **kwargs):
+        """
+        @param python: the python command, as a list
+        @param path: the path the virtualenv is used from
+        @param requirements: the requirements to install with pip, which
+            should be pinned to a version
+        @param cache: the directory holding the virtualenvs
+        @param maxSize: the number of bytes the cached virtualenvs may take
+        """
+        ShellCommand.__init__(self, **kwargs)
+        self.addFactoryArguments(python=python, path=path,
+                                 requirements=requirements, cache=cache,
+                                 maxSize=maxSize)
+        self.command = python + [
+            '-c',
+            'from binascii import unhexlify; exec(unhexlify(b"%s"))' % (
+                hexlify(self.source),),
+            cache, path, str(maxSize)] + list(requirements)
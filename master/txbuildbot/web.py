@@ -86,6 +86,8 @@ class TenBoxesPerBuilder(HtmlResource):
         table = tags.table(style="clear:both")
         tag(table)
 
+        buildBranches = map_branches(branches)
+
         for bn in builders:
             builder = status.getBuilder(bn)
             state = builder.getState()[0]
@@ -98,10 +100,10 @@ class TenBoxesPerBuilder(HtmlResource):
 
             builds = sorted([
                     build for build in builder.getCurrentBuilds()
-                    if build.getSourceStamp().branch in map_branches(branches)
+                    if build.getSourceStamp().branch in buildBranches
                     ], key=lambda build: build.getNumber(), reverse=True)
 
-            builds.extend(builder.generateFinishedBuilds(map_branches(branches),
+            builds.extend(builder.generateFinishedBuilds(buildBranches,
                                                          num_builds=num_builds))
             if builds:
                 for b in builds: